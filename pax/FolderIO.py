@@ -62,11 +62,23 @@ class InputFromFolder(plugin.InputPlugin):
         # Files are read in lexically, but in some cases that may not reflect the event order (see issue #345)
         self.raw_data_files = sorted(self.raw_data_files, key=itemgetter('first_event'))
 
+        # When resuming a run, skip the files with events that are already done
+        self.resume_after_event = self.config.get('resume_after_event', None)
+        if self.resume_after_event is not None:
+            self.raw_data_files = [fr for fr in self.raw_data_files if fr['last_event'] > self.resume_after_event]
+            if not len(self.raw_data_files):
+                self.log.info("InputFromFolder: all events were already processed.")
+                self.number_of_events = 0
+                return
+
         # Select the first file
         self.select_file(0)
 
         # Set the number of total events
         self.number_of_events = sum([fr['n_events'] for fr in self.raw_data_files])
+        if self.resume_after_event is not None:
+            self.number_of_events -= len([x for x in self.event_numbers_in_current_file
+                                          if x <= self.resume_after_event])
 
     def init_file(self, filename):
         """Find out the first and last event contained in filename
@@ -116,6 +128,8 @@ class InputFromFolder(plugin.InputPlugin):
             if self.current_file_number != file_i:
                 self.select_file(file_i)
             for event in self.get_all_events_in_current_file():
+                if self.resume_after_event is not None and event.event_number <= self.resume_after_event:
+                    continue
                 yield event
 
     def get_single_event(self, event_number):
@@ -205,6 +219,8 @@ class InputFromFolder(plugin.InputPlugin):
 class WriteToFolder(plugin.OutputPlugin):
     """Write to a folder containing several small files, each containing <= a fixed number of events"""
 
+    finalizes_files = True
+
     def startup(self):
         self.events_per_file = self.config.get('events_per_file', 50)
         self.first_event_in_current_file = None
@@ -212,7 +228,13 @@ class WriteToFolder(plugin.OutputPlugin):
 
         self.output_dir = self.config['output_name']
         if os.path.exists(self.output_dir):
-            if not self.config.get('ignore_existing_dir', False):
+            if self.config.get('resume', False):
+                # Add to the files we finished before. Drop the temporary file we were writing when we died,
+                # the input plugin will give us its events again.
+                self.log.info("Resuming writing to output directory %s" % self.output_dir)
+                for fn in glob.glob(os.path.join(self.output_dir, 'temp.*')):
+                    os.remove(fn)
+            elif not self.config.get('ignore_existing_dir', False):
                 if self.config.get('overwrite_output', False):
                     if self.config['overwrite_output'] == 'confirm':
                         print("\n\nOutput dir %s already exists. Overwrite? [y/n]:" % self.output_dir)
@@ -265,14 +287,16 @@ class WriteToFolder(plugin.OutputPlugin):
         self.close()
 
         # Rename the temporary file to reflect the events we've written to it
-        os.rename(self.tempfile,
-                  os.path.join(self.output_dir,
-                               '%s-%d-%09d-%09d-%09d.%s' % (self.config['tpc_name'],
-                                                            self.config['run_number'],
-                                                            self.first_event_in_current_file,
-                                                            self.last_event_written,
-                                                            self.events_written_to_current_file,
-                                                            self.file_extension)))
+        filename = os.path.join(self.output_dir,
+                                '%s-%d-%09d-%09d-%09d.%s' % (self.config['tpc_name'],
+                                                             self.config['run_number'],
+                                                             self.first_event_in_current_file,
+                                                             self.last_event_written,
+                                                             self.events_written_to_current_file,
+                                                             self.file_extension))
+        os.rename(self.tempfile, filename)
+        self.finalized_files.append(filename)
+        self.finalized_through = self.last_event_written
 
     def shutdown(self):
         if self.has_shut_down:
@@ -304,6 +328,10 @@ class WriteToFolder(plugin.OutputPlugin):
 class ReadZippedDecoder(plugin.TransformPlugin):
     do_input_check = False
 
+    def startup(self):
+        # Top-level fields to decode right away (None: all). Decoders which can, decode the others on first access.
+        self.materialize_fields = self.config.get('materialize_fields')
+
     def transform_event(self, event_proxy):
         data = zlib.decompress(event_proxy.data)
         return self.decode_event(data)
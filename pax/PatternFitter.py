@@ -7,8 +7,6 @@ import logging
 
 import numpy as np
 import numexpr as ne
-import matplotlib.pyplot as plt
-from matplotlib import _cntr
 from scipy.optimize import fmin_powell
 from scipy.ndimage.interpolation import zoom as image_zoom
 
@@ -135,6 +133,7 @@ class PatternFitter(object):
 
         # The below code is for diagnostic plots only
         if plot:
+            import matplotlib.pyplot as plt     # Slow to import, so only do it when we actually plot
             plt.figure()
             plt.set_cmap('viridis')
             # Make the linspaces of coordinates along each dimension
@@ -252,6 +251,7 @@ class PatternFitter(object):
         if cls is not None and n_dim == 2:
             x, y = np.mgrid[:gofs.shape[0], :gofs.shape[1]]
             # Use matplotlib _Cntr module to trace contours (without plotting)
+            from matplotlib import _cntr
             c = _cntr.Cntr(x, y, gofs)
 
             for cl in cls:
@@ -292,6 +292,7 @@ class PatternFitter(object):
                     cl_segments.append(contour_points)
 
         if plot and n_dim == 2:
+            import matplotlib.pyplot as plt
             plt.scatter(*[[r] for r in result], marker='*', s=20, color='orange', label='Grid minimum')
             for i, contour in enumerate(cl_segments):
                 if len(contour) == 0:
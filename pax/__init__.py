@@ -8,3 +8,9 @@ Provides a framework for calling plugins that manipulate data.
 __author__ = 'Christopher Tunnell'
 __email__ = 'ctunnell@nikhef.nl'
 __version__ = '4.9.3'
+
+
+def precompile():
+    """Compile pax's numba functions and store them in numba's on-disk cache. See pax.numba_cache."""
+    from pax.numba_cache import precompile as _precompile
+    _precompile()
@@ -0,0 +1,113 @@
+"""Benchmarks of pax's own overhead, i.e. everything except what the plugins do. Run with:
+
+    python -m pax.benchmarks
+
+Reports the median over several repetitions of:
+  - import: time to import pax.core in a fresh python interpreter
+  - paxer --version: wall time of the paxer script, which is what short jobs pay on top of processing
+  - standalone / multiprocessing startup: time to set up a Processor with dummy plugins, process one event
+    and shut down, without and with (two) worker processes.
+  - dispatch: time pax takes to run one plugin on one event, if the plugin does nothing. This is paid by every
+    plugin on every event: you want it to be small compared to the time plugins take for the real work.
+"""
+from __future__ import print_function
+import os
+import subprocess
+import sys
+import time
+
+from pax import utils
+
+PAXER = os.path.join(os.path.dirname(utils.PAX_DIR), 'bin', 'paxer')
+
+# Modules which take long to import, and should only be imported when a plugin or option needs them
+HEAVY_MODULES = ('matplotlib', 'scipy', 'pandas', 'h5py', 'psutil', 'prettytable', 'tqdm', 'pax.simulation')
+
+
+def subprocess_env():
+    """Environment for subprocesses, in which they import this pax (rather than some other installed version)"""
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(utils.PAX_DIR)] +
+                                        [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+def time_command(command, n_repeats=5):
+    """Return the median wall time (seconds) of running command (a list) in a subprocess"""
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        subprocess.check_call(command, stdout=subprocess.PIPE, env=subprocess_env())
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def time_processor(n_cpus, n_repeats=5):
+    """Return the median time to run a Processor with dummy plugins on one event"""
+    from pax import core
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        mypax = core.Processor(config_dict={'pax': {'plugin_group_names': ['input', 'output'],
+                                                    'input': 'Dummy.DummyInput',
+                                                    'output': 'Dummy.DummyOutput',
+                                                    'n_cpus': n_cpus,
+                                                    'print_timing_report': False,
+                                                    'logging_level': 'WARNING'}},
+                               just_testing=True)
+        mypax.run()
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def dispatch_overhead(production_mode=False, n_plugins=10, n_events=2000, n_repeats=5):
+    """Return the median time (seconds) pax spends per plugin per event on no-op plugins"""
+    from pax import core, datastructure
+    mypax = core.Processor(config_dict={'pax': {'plugin_group_names': ['transform'],
+                                                'transform': ['Dummy.DummyTransform'] * n_plugins,
+                                                'production_mode': production_mode,
+                                                'logging_level': 'WARNING'}},
+                           just_testing=True)
+    events = [datastructure.Event.empty_event() for _ in range(n_events)]
+    times = []
+    for _ in range(n_repeats):
+        start = time.time()
+        for event in events:
+            mypax.process_event(event)
+        times.append((time.time() - start) / (n_events * n_plugins))
+    mypax.shutdown()
+    return sorted(times)[len(times) // 2]
+
+
+def dispatch_benchmark(n_repeats=5):
+    """Return a list of (description, seconds) of the overhead per plugin per event"""
+    return [('dispatch', dispatch_overhead(False, n_repeats=n_repeats)),
+            ('dispatch (production mode)', dispatch_overhead(True, n_repeats=n_repeats))]
+
+
+def heavy_modules_imported(module='pax.core'):
+    """Return the heavy modules (see HEAVY_MODULES) that get imported along with module"""
+    code = "import sys, %s; print(' '.join([m for m in %s if m in sys.modules]))" % (module, HEAVY_MODULES)
+    return subprocess.check_output([sys.executable, '-c', code], env=subprocess_env()).decode().split()
+
+
+def startup_benchmark(n_repeats=5):
+    """Return a list of (description, seconds) of pax's startup overheads"""
+    return [('import pax.core', time_command([sys.executable, '-c', 'import pax.core'], n_repeats)),
+            ('paxer --version', time_command([sys.executable, PAXER, '--version'], n_repeats)),
+            ('standalone startup', time_processor(1, n_repeats)),
+            ('multiprocessing startup', time_processor(2, n_repeats))]
+
+
+def main():
+    for description, seconds in startup_benchmark():
+        print("%-30s %8.1f ms" % (description, seconds * 1000))
+    for description, seconds in dispatch_benchmark():
+        print("%-30s %8.1f us per plugin per event" % (description, seconds * 1e6))
+    heavy = heavy_modules_imported()
+    if len(heavy):
+        print("Importing pax.core also imports %s" % ', '.join(heavy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Binary format for events (or other data_model objects), generated from the field schemas of the data model
+
+Pickle and BSON walk the object tree and convert every numpy array to bytes (or lists) and back. In this format,
+numpy arrays are written as raw buffers, and decode makes them views of the encoded data (np.frombuffer) rather than
+copies. A list field (e.g. Event.pulses) is stored column by column, for all its elements at once:
+  - the scalar fields (int, float, bool) as one structured array, with a row per element
+  - each array field as one buffer with the arrays of all elements concatenated, so the raw data of all pulses
+    takes one buffer (the arrays of the decoded pulses are views of it)
+  - each list field as one list of all their elements together, recursively
+  - the other fields (e.g. strings) in the header
+A single object is stored as a list with one element.
+
+Layout of encoded data:
+  - prefix: magic bytes, format version, length of the header (struct '<4sII')
+  - header: JSON with the class name, the (offset, nbytes) of each buffer, and a tree describing the fields
+  - buffers: each starting at a multiple of alignment bytes from the start of the data (padded with zeros)
+
+Arrays are views of the data passed to decode: they are only writable if it is (e.g. a bytearray rather than bytes).
+"""
+import json
+import operator
+import struct
+from functools import partial
+
+import numpy as np
+
+from pax import datastructure
+from pax.data_model import Model, make_lazy, materialize
+from pax.peak_array import scalar_types
+from pax.utils import Memoize
+
+magic = b'PAXB'
+version = 1
+prefix = struct.Struct('<4sII')
+# Buffers are aligned to this many bytes, so the arrays we make from them are well-aligned
+alignment = 64
+
+
+@Memoize
+def get_column_layout(cls):
+    """Return (scalar dtype, fields per kind) for storing a list of objects of Model class cls.
+    The scalar dtype has a column for each int, float or bool field. The other kinds are:
+      - 'arrays': numpy array fields, 'lists': list fields, 'models': Model fields
+      - 'values': anything else (e.g. strings), which goes in the header
+    """
+    scalar_fields = []
+    fields = dict(arrays=[], lists=[], models=[], values=[])
+    for field in cls.get_field_schema():
+        numpy_type = scalar_types.get(type(field.default).__name__)
+        if field.kind == 'value' and numpy_type is not None and numpy_type is not object:
+            scalar_fields.append((field.name, numpy_type))
+        elif field.kind == 'array':
+            fields['arrays'].append(field)
+        elif field.kind == 'list':
+            fields['lists'].append(field)
+        elif field.kind == 'model':
+            fields['models'].append(field)
+        else:
+            fields['values'].append(field)
+    return np.dtype(scalar_fields), fields
+
+
+##
+# Encoding
+##
+
+def encode(obj):
+    """Return a bytearray with obj (a pax.datastructure object, e.g. an Event) in the binary format"""
+    # Decode any lazy fields (e.g. of an event decoded with materialize_fields)
+    materialize(obj)
+    cls = type(obj)
+    if getattr(datastructure, cls.__name__, None) is not cls:
+        raise ValueError("Can only encode classes from pax.datastructure, not %s" % cls)
+
+    # Each buffer is a list of arrays, written one after the other
+    buffers = []
+    root = encode_list([obj], cls, buffers)
+
+    spans = []
+    offset = 0
+    for arrays in buffers:
+        n_bytes = sum([a.nbytes for a in arrays])
+        spans.append((offset, n_bytes))
+        offset += n_bytes + (-n_bytes % alignment)
+
+    header = json.dumps(dict(cls=cls.__name__, spans=spans, root=root), default=to_json_type).encode('utf-8')
+    start = prefix.size + len(header)
+    start += -start % alignment
+    result = bytearray(start + offset)
+    prefix.pack_into(result, 0, magic, version, len(header))
+    result[prefix.size:prefix.size + len(header)] = header
+
+    # Copy the arrays straight into the result
+    for (offset, n_bytes), arrays in zip(spans, buffers):
+        if not n_bytes:
+            continue
+        target = np.frombuffer(result, dtype=arrays[0].dtype, count=n_bytes // arrays[0].itemsize,
+                               offset=start + offset)
+        if len(arrays) == 1:
+            target.reshape(arrays[0].shape)[...] = arrays[0]
+        else:
+            np.concatenate(arrays, out=target)
+    return result
+
+
+def encode_list(objects, cls, buffers):
+    """Return header node for the list objects of Model class cls. Adds the buffers we need to buffers."""
+    node = dict(n=len(objects))
+    if not len(objects):
+        return node
+    scalar_dtype, fields = get_column_layout(cls)
+    dicts = [obj.__dict__ for obj in objects]
+
+    if scalar_dtype.names:
+        try:
+            # Objects made by construct or decode have all fields in their __dict__
+            get_scalars = operator.itemgetter(*scalar_dtype.names)
+            rows = [get_scalars(d) for d in dicts]
+        except KeyError:
+            # Others only have the fields which were set: the rest have their default value
+            defaults = [getattr(cls, name) for name in scalar_dtype.names]
+            rows = [tuple([d.get(name, default) for name, default in zip(scalar_dtype.names, defaults)])
+                    for d in dicts]
+        if len(scalar_dtype.names) == 1:
+            # itemgetter with one name does not return tuples
+            rows = [(x,) for x in rows]
+        try:
+            rows = np.array(rows, dtype=scalar_dtype)
+        except (ValueError, TypeError, OverflowError) as e:
+            raise ValueError("Can't store the scalar fields of %s in a numpy array: %s" % (cls.__name__, e))
+        node['rows'] = add_array(rows, buffers)
+
+    # Lengths of the array fields and list fields of each element
+    sizes = {}
+
+    for field in fields['arrays']:
+        arrays = [np.asarray(d.get(field.name, field.default)) for d in dicts]
+        if arrays[0].dtype.hasobject:
+            raise ValueError("Can't store field %s of %s: it has object dtype" % (field.name, cls.__name__))
+        dtype = arrays[0].dtype
+        if all([a.ndim == 1 and a.dtype == dtype for a in arrays]):
+            # Store the arrays of all elements in one buffer
+            sizes[field.name] = [len(a) for a in arrays]
+            node.setdefault('arrays', {})[field.name] = dict(buffer=len(buffers),
+                                                             dtype=np.lib.format.dtype_to_descr(dtype))
+            buffers.append(arrays)
+        else:
+            node.setdefault('arrays', {})[field.name] = dict(each=[add_array(a, buffers) for a in arrays])
+
+    for field in fields['lists']:
+        values = [d.get(field.name, []) for d in dicts]
+        sizes[field.name] = [len(x) for x in values]
+        node.setdefault('lists', {})[field.name] = encode_list([el for x in values for el in x],
+                                                               field.element_type, buffers)
+
+    for field in fields['models']:
+        node.setdefault('models', {})[field.name] = encode_list([d.get(field.name, field.default) for d in dicts],
+                                                                type(field.default), buffers)
+
+    for field in fields['values']:
+        node.setdefault('values', {})[field.name] = [d.get(field.name, field.default) for d in dicts]
+
+    if sizes:
+        size_dtype = np.dtype([(name, np.int64) for name in sorted(sizes.keys())])
+        node['sizes'] = add_array(np.array(list(zip(*[sizes[name] for name in size_dtype.names])),
+                                           dtype=size_dtype),
+                                  buffers)
+    return node
+
+
+def add_array(a, buffers):
+    """Add numpy array a as a new buffer, return its header node"""
+    if a.dtype.hasobject:
+        raise ValueError("Can't store numpy arrays with object dtype")
+    buffers.append([a])
+    return dict(buffer=len(buffers) - 1, dtype=np.lib.format.dtype_to_descr(a.dtype), shape=a.shape)
+
+
+def to_json_type(x):
+    """Convert numpy scalars and arrays in values fields to something json can store"""
+    if isinstance(x, (np.generic, np.ndarray)):
+        return x.tolist()
+    raise TypeError("Can't store a %s in the header" % type(x))
+
+
+##
+# Decoding
+##
+
+def decode(data, materialize_fields=None):
+    """Return the object encoded in data (bytes, bytearray, memoryview...) by encode.
+    Its numpy arrays are views of data, so they are read-only if data is.
+    If materialize_fields (list of field names) is given, only those of the object's array, list and model fields
+    are decoded right away; the others are decoded when they are first accessed.
+    """
+    magic_found, version_found, header_length = prefix.unpack_from(data, 0)
+    if magic_found != magic:
+        raise ValueError("Data is not in the pax binary format")
+    if version_found != version:
+        raise ValueError("Data is in version %d of the pax binary format, we can only read version %d" % (
+            version_found, version))
+    header = json.loads(bytes(data[prefix.size:prefix.size + header_length]).decode('utf-8'))
+    cls = getattr(datastructure, header['cls'], None)
+    if not (isinstance(cls, type) and issubclass(cls, Model)):
+        raise ValueError("Data contains a %s, which is not a class in pax.datastructure" % header['cls'])
+
+    start = prefix.size + header_length
+    start += -start % alignment
+    return Reader(data, start, header['spans']).decode_list(header['root'], cls, materialize_fields)[0]
+
+
+class Reader(object):
+    """Makes objects from the buffers of encoded data"""
+
+    def __init__(self, data, start, spans):
+        self.data = data
+        self.start = start
+        self.spans = spans
+
+    def array(self, node, dtype=None):
+        """Return the buffer of header node as a numpy array of dtype (default: dtype from node), with the shape
+        from node (if any). Does not copy the data."""
+        offset, n_bytes = self.spans[node['buffer']]
+        if dtype is None:
+            dtype = np.lib.format.descr_to_dtype(node['dtype'])
+        result = np.frombuffer(self.data, dtype=dtype, count=n_bytes // dtype.itemsize, offset=self.start + offset)
+        if 'shape' in node:
+            result = result.reshape(node['shape'])
+        return result
+
+    def decode_list(self, node, cls, materialize_fields=None):
+        """Return list of objects of Model class cls described by header node.
+        If materialize_fields (list of field names) is given, only those of the array, list and model fields are
+        decoded right away. The others are decoded when they are first accessed (see data_model.make_lazy).
+        """
+        n = node['n']
+        if not n:
+            return []
+        schema = cls.get_field_schema_by_name()
+
+        if 'rows' in node:
+            rows = self.array(node['rows'])
+            names = [name for name in rows.dtype.names if name in schema]
+            if len(names) != len(rows.dtype.names):
+                # Data from a version of pax with fields we don't know: ignore them
+                rows = rows[names]
+            dicts = [dict(zip(names, row)) for row in rows.tolist()]
+        else:
+            dicts = [dict() for _ in range(n)]
+        sizes = self.array(node['sizes']) if 'sizes' in node else None
+
+        # Initialize the list fields, in case the data doesn't have them
+        for field_name in cls.get_list_field_info():
+            for d in dicts:
+                d[field_name] = []
+
+        for field_name, values in node.get('values', {}).items():
+            if field_name not in schema:
+                continue
+            for d, value in zip(dicts, values):
+                d[field_name] = value
+
+        # Functions which return the values of a field for all n objects
+        columns = {}
+        for field_name, array_node in node.get('arrays', {}).items():
+            columns[field_name] = partial(self.decode_arrays, array_node, sizes, field_name)
+        for field_name, list_node in node.get('lists', {}).items():
+            if field_name in schema:
+                columns[field_name] = partial(self.decode_lists, list_node, schema[field_name].element_type,
+                                              sizes, field_name)
+        for field_name, model_node in node.get('models', {}).items():
+            if field_name in schema:
+                columns[field_name] = partial(self.decode_list, model_node, type(schema[field_name].default))
+
+        lazy_columns = {}
+        for field_name, column in columns.items():
+            if field_name not in schema:
+                continue
+            if materialize_fields is not None and field_name not in materialize_fields:
+                lazy_columns[field_name] = column
+                continue
+            for d, value in zip(dicts, column()):
+                d[field_name] = value
+
+        result = []
+        for i, d in enumerate(dicts):
+            # Set the fields directly, as unpickling does, skipping the type checks of the constructor
+            obj = cls.__new__(cls)
+            obj.__dict__.update(d)
+            if lazy_columns:
+                make_lazy(obj, {field_name: partial(get_item, column, i)
+                                for field_name, column in lazy_columns.items()})
+            result.append(obj)
+        return result
+
+    def decode_arrays(self, node, sizes, field_name):
+        """Return list with the array field_name of each object, described by header node"""
+        if 'each' in node:
+            return [self.array(x) for x in node['each']]
+        buffer = self.array(node)
+        ends = np.cumsum(sizes[field_name])
+        starts = ends - sizes[field_name]
+        return [buffer[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+    def decode_lists(self, node, element_cls, sizes, field_name):
+        """Return list with the list field_name of each object, whose elements are described by header node"""
+        elements = self.decode_list(node, element_cls)
+        result = []
+        position = 0
+        for size in sizes[field_name].tolist():
+            result.append(elements[position:position + size])
+            position += size
+        return result
+
+
+def get_item(column, i):
+    """Return the value of object i from column (a function returning the values for all objects)"""
+    return column()[i]
@@ -0,0 +1,75 @@
+"""Checkpoint journal, so long processing runs can be resumed after they die
+
+The process that writes the output (the output worker, or a standalone processor) keeps a small JSON file
+<output_name>_checkpoint.json up to date with:
+  - last_event: the event number up to which all events are safely in the output. Events are written in order,
+                so every event read before this one is in the output too.
+  - output_files: the output files which are finished, and won't be touched again.
+
+With the resume option, pax reads this file and tells the input plugin to skip the events up to last_event,
+and the output plugins to add to the existing output rather than overwrite it.
+"""
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger('pax_checkpoint')
+
+
+def checkpoint_file_name(output_name):
+    return output_name + '_checkpoint.json'
+
+
+def load_checkpoint(output_name):
+    """Return the checkpoint for output_name as a dict, or None if there is no checkpoint"""
+    filename = checkpoint_file_name(output_name)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, mode='r') as infile:
+        return json.load(infile)
+
+
+class CheckpointJournal(object):
+    """Keeps the checkpoint file for output_name up to date.
+    Writes at most once every min_interval seconds, unless an output file was finished.
+    With resume=True, continues from the existing checkpoint file (if any).
+    """
+
+    def __init__(self, output_name, min_interval=10, resume=False):
+        self.filename = checkpoint_file_name(output_name)
+        self.min_interval = min_interval
+        self.last_event = None
+        self.output_files = []
+        if resume:
+            checkpoint = load_checkpoint(output_name)
+            if checkpoint is not None:
+                self.last_event = checkpoint['last_event']
+                self.output_files = checkpoint['output_files']
+        self.last_write = 0
+        self.dirty = False
+
+    def update(self, last_event, output_files=()):
+        """Record that all events up to last_event are in the output, and output_files are finished.
+        last_event None means we don't know about any new events yet.
+        """
+        new_files = [fn for fn in output_files if fn not in self.output_files]
+        self.output_files.extend(new_files)
+        if last_event is not None and (self.last_event is None or last_event > self.last_event):
+            self.last_event = last_event
+            self.dirty = True
+        if len(new_files) or (self.dirty and time.time() - self.last_write > self.min_interval):
+            self.write()
+
+    def write(self):
+        # Write to a temporary file first, so we never leave a half-written checkpoint if we die
+        temp_filename = self.filename + '.temp'
+        with open(temp_filename, mode='w') as outfile:
+            json.dump(dict(last_event=self.last_event,
+                           output_files=self.output_files,
+                           time=time.time()),
+                      outfile, indent=4)
+        os.rename(temp_filename, self.filename)
+        self.last_write = time.time()
+        self.dirty = False
+        log.debug("Checkpoint: events up to %s are in the output" % self.last_event)
@@ -5,6 +5,51 @@ import six
 
 from pax import units, utils
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    # Python 2
+    from collections import MutableMapping
+
+
+class ConfigOverlay(MutableMapping):
+    """Minimal version of python 3's collections.ChainMap, for python 2: looks up keys in each of maps in turn,
+    writes and deletes only in the first. The maps are not copied.
+    """
+
+    def __init__(self, *maps):
+        self.maps = list(maps) or [{}]
+
+    def __getitem__(self, key):
+        for mapping in self.maps:
+            if key in mapping:
+                return mapping[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return any([key in mapping for mapping in self.maps])
+
+    def __setitem__(self, key, value):
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        del self.maps[0][key]
+
+    def __iter__(self):
+        return iter(set().union(*self.maps))
+
+    def __len__(self):
+        return len(set().union(*self.maps))
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join([repr(m) for m in self.maps]))
+
+
+try:
+    from collections import ChainMap
+except ImportError:
+    ChainMap = ConfigOverlay
+
 
 def load_configuration(config_names=(), config_paths=(), config_string=None, config_dict=None):
     """Load pax configuration using configuration data. See the docstring of Processor for more info.
@@ -127,3 +172,12 @@ def load_configuration(config_names=(), config_paths=(), config_string=None, con
         del evaled_config['Why_doesnt_configparser_let_me_disable_DEFAULT']
 
     return evaled_config
+
+
+def plugin_config(config, name):
+    """Return the configuration for plugin name ('Module.Class'): a view of the plugin-level settings, over the
+    module-level settings, over the DEFAULT settings in config. Nothing is copied, so all plugins and worker processes
+    can share one configuration. The plugin's own changes go to a fresh dict on top, so they don't leak into config.
+    """
+    name_module = name.split('.')[0]
+    return ChainMap({}, config.get(name, {}), config.get(name_module, {}), config['DEFAULT'])
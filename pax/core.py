@@ -1,49 +1,30 @@
 """The backbone of pax - the Processor class
 """
 import glob
+import json
+import pickle
+from collections import OrderedDict
 import logging
 import six
+import traceback
 import itertools
 import os
-import psutil
+import socket
 import sys
 import time
 import multiprocessing
-try:
-    import queue
-except ImportError:
-    import Queue as queue   # flake8: noqa
-
-from prettytable import PrettyTable     # Timing report
-from tqdm import tqdm                   # Progress bar
+from contextlib import contextmanager
 
 import pax      # Needed for pax.__version__
-from pax.configuration import load_configuration
-from pax import simulation, utils
+from pax.configuration import load_configuration, plugin_config
+from pax import utils, data_model, transport, parallel, checkpoint, quarantine, watchdog, memory_profile, metrics, \
+    tracing
+from pax.plugin import OutputPlugin
 if six.PY2:
     import imp
 else:
     import importlib
-import heapq
-
-import signal
-
-class timeout:
-    def __init__(self, seconds=1, error_message='Timeout'):
-        self.seconds = seconds
-        self.error_message = error_message
-    def handle_timeout(self, signum, frame):
-        raise TimeoutError(self.error_message)
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.handle_timeout)
-        signal.alarm(self.seconds)
-    def __exit__(self, type, value, traceback):
-        signal.alarm(0)
-
-# For diagnosing suspected memory leaks, uncomment this code
-# and similar code in process_event
-# import gc
-# import objgraph
+
 
 # Multiprocess status codes
 MP_STATUS = dict(normal=0,
@@ -54,6 +35,40 @@ MP_STATUS = dict(normal=0,
                  processing_done=5)
 
 
+def _retry_event(config, original, connection):
+    """Process the event pickled in original in a new Processor with config, send back the pickled result and
+    traceback (either is None) through connection. Used by Processor.retry_event.
+    """
+    try:
+        processor = Processor(config_dict=config)
+        event = processor.process_event(pickle.loads(original))
+        connection.send((pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL), None))
+        processor.shutdown()
+    except Exception:
+        connection.send((None, traceback.format_exc()))
+
+
+def run_remote_worker(address, authkey, stage=0):
+    """Connect to the broker of a pax master on another host (see broker_address in the configuration),
+    and process event blocks for it until it is done.
+      - address: 'host:port' of the broker
+      - authkey: the broker_authkey of the master
+      - stage: the pipeline stage to work on (if the master uses pipeline_stages)
+    """
+    if not isinstance(authkey, bytes):
+        authkey = authkey.encode()
+    manager = parallel.BrokerManager(address=parallel.parse_address(address), authkey=authkey)
+    manager.connect()
+    # Needed to talk to the shared objects in the configuration we unpickle
+    multiprocessing.current_process().authkey = authkey
+    broker_info = manager.get_broker_info()
+    if 'stage_%d' % stage not in broker_info:
+        raise ValueError("The pax master at %s has no stage %d" % (address, stage))
+    config = pickle.loads(broker_info['stage_%d' % stage])
+    config['pax']['_worker_id'] = 'remote_%s_%d' % (socket.gethostname(), os.getpid())
+    return Processor(config_dict=config)
+
+
 class Processor:
 
     def __init__(self, config_names=(), config_paths=(), config_string=None, config_dict=None, just_testing=False):
@@ -84,6 +99,16 @@ class Processor:
         pc = self.config['pax']
         self.worker_id = pc.get('_worker_id', 'master')
         self.log = self.setup_logging()
+        self.is_output_worker = False
+
+        self.plugin_search_paths = self.get_plugin_search_paths(pc.get('plugin_paths', None))
+        self.log.debug("Search path for plugins is %s" % str(self.plugin_search_paths))
+
+        # If quarantine_failed_events is set, events on which a plugin fails go to the dead letter file
+        # rather than crashing pax (see quarantine.py). Workers send them to the master through dead_letter_queue.
+        self.quarantine = pc.get('quarantine_failed_events', False)
+        self.dead_letters = None
+        self.dead_letter_queue = None
 
         if self.worker_id != 'master':
             self.log.debug("I'm worker %s" % self.worker_id)
@@ -91,17 +116,62 @@ class Processor:
             self.multiprocessing = True
             self.status = pc['status']
             self.input_queue = pc['input_queue']
-            self.output_queue = pc.get('output_queue', None)
+            self.output_queues = pc['output_queues']
+            self.reorder_limits = pc['reorder_limits']
+            self.block_stats = pc['block_stats']
+            self.worker_stats = pc['worker_stats']
+            self.state_changed = pc['state_changed']
+            self.crash_wakeup_queues = pc['crash_wakeup_queues']
+            self.report_queue = pc['report_queue']
+            self.dead_letter_queue = pc['dead_letter_queue']
+            self.stage_workers = pc['stage_workers']
+            self.n_output_workers = pc['n_output_workers']
+            # Processing workers of stage i get blocks from the queue of stage i, and put them on the queue
+            # of stage i + 1 (next_queue), or on the output queues if they are in the last stage.
+            self.stage = pc.get('_stage', None)
+            if self.stage is not None and self.stage < len(self.stage_workers) - 1:
+                self.next_queue = pc['stage_queues'][self.stage + 1]
+            else:
+                self.next_queue = None
+            # Number of workers of each stage which are done; the last one to finish tells the next stage to stop.
+            self.stage_done = pc['stage_done']
+            # Output workers each write a shard of the blocks: block_id % n_output_workers == output_shard
+            self.output_shard = pc.get('_output_shard', None)
+            self.is_output_worker = self.output_shard is not None
+            if self.is_output_worker and self.reorder_limits is not None:
+                self.reorder_limit = self.reorder_limits[self.output_shard]
+            else:
+                self.reorder_limit = None
             # Remove multiprocessing objects from config datastructure,
             # so the configuration can still be serialized to JSON later
-            for k in ['input_queue', 'output_queue', 'status']:
+            for k in ['input_queue', 'output_queues', 'stage_queues', 'status', 'reorder_limits', 'block_stats',
+                      'worker_stats', 'state_changed', 'crash_wakeup_queues', 'report_queue', 'stage_done',
+                      'stage_workers', 'dead_letter_queue']:
                 pc[k] = None
+            if pc.get('_remote'):
+                self.join_stage()
 
         else:
             # I'm the main processor
             self.log.info("This is PAX version %s, running with configuration for %s." % (
                 pax.__version__, self.config['DEFAULT'].get('tpc_name', 'UNSPECIFIED TPC NAME')))
 
+            self.check_checkpoint_support()
+
+            if self.quarantine:
+                # A resumed run adds to the dead letters of the run it resumes, any other run starts afresh
+                output_name = self.derive_output_name()
+                resuming = (pc.get('resume', False) and output_name is not None and
+                            checkpoint.load_checkpoint(output_name) is not None)
+                self.dead_letters = quarantine.DeadLetterFile(
+                    pc.get('dead_letter_file') or quarantine.dead_letter_file_name(output_name or 'pax'),
+                    append=resuming)
+
+            # Live metrics of multiprocessing runs (see metrics.py)
+            self.metrics = None
+            self.worker_stats = None
+            self.events_read = 0
+
             n_cpus = pc.get('n_cpus', 1)
             if n_cpus == 'all':
                 n_cpus = multiprocessing.cpu_count()
@@ -111,37 +181,7 @@ class Processor:
             else:
                 # Setup multiprocessing
                 self.multiprocessing = True
-                self.manager = multiprocessing.Manager()
-                self.status = self.manager.Value('i', MP_STATUS['normal'])
-                self.input_queue = self.manager.Queue()
-                self.output_queue = self.manager.Queue()
-                self.last_status_update = time.time()
-
-                # Start worker processes
-                self.processing_workers = []
-                from copy import deepcopy
-                for worker_number in range(n_cpus):
-                    c = deepcopy(self.config)
-                    c['pax'].update(dict(plugin_group_names=[q for q in pc['plugin_group_names']
-                                                             if q not in ('input', 'output')],
-                                         input_queue=self.input_queue,
-                                         output_queue=self.output_queue,
-                                         status=self.status,
-                                         _worker_id='processing_%d' % worker_number))
-                    self.processing_workers.append(multiprocessing.Process(target=Processor,
-                                                                           kwargs=dict(config_dict=c)))
-
-                c = deepcopy(self.config)
-                c['pax'].update(dict(plugin_group_names=['output'],
-                                     _worker_id='output',
-                                     status=self.status,
-                                     input_queue=self.output_queue))
-                self.output_worker = multiprocessing.Process(target=Processor,
-                                                             kwargs=dict(config_dict=c))
-
-                # Start my child processes
-                for w in self.processing_workers + [self.output_worker]:
-                    w.start()
+                self.start_workers(n_cpus)
 
                 # I will just focus on input
                 pc['plugin_group_names'] = ['input']
@@ -152,6 +192,7 @@ class Processor:
             wvsim_config = {}
             wvsim_config.update(self.config['DEFAULT'])
             wvsim_config.update(self.config['WaveformSimulator'])
+            from pax import simulation      # Pulls in scipy.stats and more, so only import when needed
             self.simulator = simulation.Simulator(wvsim_config)
         elif not just_testing:
                 self.log.warning('You did not specify any configuration for the waveform simulator!\n' +
@@ -165,7 +206,7 @@ class Processor:
                 self.log.warning('You did not specify any plugin groups to load: are you testing me?')
             pc['plugin_group_names'] = []
 
-        if not self.multiprocessing or self.worker_id not in ('master', 'output'):
+        if not self.multiprocessing or not (self.worker_id == 'master' or self.is_output_worker):
             # Standalone or child processor (not output)
             # Make plugin group names for the encoder and decoder plugins
             # By having this code here, we ensure they are always just after/before input/output,
@@ -215,9 +256,23 @@ class Processor:
             for o in plugin_names['output']:
                 self.config[o]['output_name'] = pc['output_name']
 
-        self.plugin_search_paths = self.get_plugin_search_paths(pc.get('plugin_paths', None))
-
-        self.log.debug("Search path for plugins is %s" % str(self.plugin_search_paths))
+        # When resuming a run, the input plugin skips the events already in the output (see checkpoint.py),
+        # and the output plugins add to the existing output.
+        if pc.get('resume', False):
+            if 'input' in pc['plugin_group_names']:
+                output_name = self.derive_output_name()
+                if output_name is None:
+                    raise ValueError("Invalid configuration: specify output_name to resume a run")
+                cp = checkpoint.load_checkpoint(output_name)
+                if cp is None:
+                    self.log.warning("No checkpoint found for %s, starting from the beginning." % output_name)
+                else:
+                    self.log.info("Resuming after event %s, which is already in %s." % (
+                        cp['last_event'], output_name))
+                    self.config[plugin_names['input'][0]]['resume_after_event'] = cp['last_event']
+            if 'output' in pc['plugin_group_names']:
+                for o in plugin_names['output']:
+                    self.config[o]['resume'] = True
 
         # Load input plugin & setup the get_events generator
         if 'input' in pc['plugin_group_names']:
@@ -262,14 +317,233 @@ class Processor:
             self.action_plugins = []
             self.log.debug("No action plugins specified: this will be a pretty boring processing run...")
 
+        # Workers process their event blocks plugin by plugin if some plugin can process many events at once.
+        # Output workers which quarantine events don't: output plugins can't take back events they already wrote,
+        # so they can't start a block over when some event fails.
+        self.process_blocks = any([p.processes_blocks for p in self.action_plugins]) and \
+            not (self.quarantine and self.is_output_worker)
+
+        # In production mode, don't check that plugins get and return Events: that costs time for every plugin
+        # on every event, and is only useful while developing plugins.
+        if pc.get('production_mode', False):
+            for p in self.action_plugins:
+                p.do_input_check = p.do_output_check = False
+        # The log level doesn't change once it's set (see __init__), so we can check this once,
+        # rather than format debug messages for every plugin and event.
+        self.log_debug = self.log.isEnabledFor(logging.DEBUG)
+        # Plugins make most datastructure objects with construct(), which skips the type checks unless we want them
+        data_model.validate_construct = bool(pc.get('validate_models', False)) or self.log_debug
+
+        # Workers interrupt plugins which take longer than this on an event (see watchdog.py)
+        timeouts = pc.get('plugin_timeouts', None) or {}
+        self.plugin_timeouts = [timeouts.get(p.name, pc.get('plugin_timeout', None)) for p in self.action_plugins]
+        self.watchdog = None
+
+        # Measure the memory used by each plugin on every memory_profile_interval-th event (see memory_profile.py)
+        self.memory_profile_interval = pc.get('memory_profile_interval', None)
+        self.memory_sampler = None
+        self.memory_events_seen = 0
+        if self.memory_profile_interval and len(self.action_plugins):
+            self.memory_sampler = memory_profile.MemorySampler()
+
+        # Record where the time goes on every trace_every-th event, for the trace file (see tracing.py)
+        self.tracer = None
+        if pc.get('trace_file') is not None:
+            self.tracer = tracing.Tracer(self.worker_id, every=pc.get('trace_every', 100))
+
+        # Workers tell the master how they are doing through worker_stats, for the live metrics (see metrics.py)
+        self.events_processed = 0
+        self.failed_events = 0
+        self.last_stats_update = 0
+
         self.timer = utils.Timer()
 
+        # The process which writes the output keeps the checkpoint journal
+        self.checkpoint = None
+        self.last_event_written = None
+        if (pc.get('write_checkpoint', False) or pc.get('resume', False)) and \
+                (self.is_output_worker or not self.multiprocessing) and self.get_output_name() is not None:
+            self.checkpoint = checkpoint.CheckpointJournal(self.get_output_name(),
+                                                           min_interval=pc.get('checkpoint_interval', 10),
+                                                           resume=pc.get('resume', False))
+
+        # How event blocks are sent between processes, see transport.py
+        if self.multiprocessing:
+            self.transport = transport.get_transport(pc)
+
         # For worker processed, we have to call run from init: nobody else wil...
         self.max_queue_blocks = self.config['pax'].get('max_queue_blocks', 100)
-        self.block_size = self.config['pax'].get('event_block_size', 10)
+        if self.worker_id == 'master' and self.multiprocessing:
+            self.block_sizer = parallel.BlockSizer(pc, self.block_stats)
+        if self.is_output_worker:
+            self.ordered_output = pc.get('ordered_output', True)
+            self.max_reorder_blocks = pc.get('max_reorder_blocks', None)
+            self.reorder_buffer = parallel.ReorderBuffer(self.transport,
+                                                         max_bytes=pc.get('max_reorder_bytes', None),
+                                                         spill_dir=pc.get('reorder_spill_dir', None),
+                                                         first_block_id=self.output_shard,
+                                                         block_id_step=self.n_output_workers)
+            # Event numbers this output worker wrote, as a list of [first, last] ranges
+            self.event_ranges = []
         if self.worker_id != 'master':
             self.run()
 
+    def start_workers(self, n_cpus):
+        """Setup the queues and other shared objects for multiprocessing, then start the worker processes"""
+        pc = self.config['pax']
+        if (pc.get('write_checkpoint', False) or pc.get('resume', False)) and \
+                (int(pc.get('n_output_workers', 1)) != 1 or not pc.get('ordered_output', True)):
+            raise ValueError("Invalid configuration: checkpoints need a single output worker and ordered output")
+        if pc.get('broker_address') is not None:
+            # Serve the queues over TCP, so workers on other hosts can join. See run_remote_worker.
+            if pc.get('broker_authkey') is None:
+                raise ValueError("Invalid configuration: set broker_authkey if you set broker_address")
+            if pc.get('transport', 'pickle') == 'shared_memory':
+                raise ValueError("Invalid configuration: the shared_memory transport does not work across hosts")
+            authkey = pc['broker_authkey'].encode()
+            self.manager = parallel.BrokerManager(address=parallel.parse_address(pc['broker_address']),
+                                                  authkey=authkey)
+            self.manager.start()
+            # Our child processes inherit this, and need it to talk to the manager
+            multiprocessing.current_process().authkey = authkey
+        else:
+            self.manager = multiprocessing.Manager()
+        self.status = self.manager.Value('i', MP_STATUS['normal'])
+        self.last_status_update = time.time()
+
+        # The processing plugin groups run in one or more stages, each with their own pool of processing workers.
+        # Normally there is just one stage with n_cpus workers, which runs all the groups.
+        self.stages = self.get_pipeline_stages(n_cpus)
+        # Number of workers in each stage. Remote workers add themselves when they join.
+        self.stage_workers = [self.manager.Value('i', n) for _, n in self.stages]
+        self.stage_queues = [self.manager.Queue() for _ in self.stages]
+        self.stage_done = [self.manager.Value('i', 0) for _ in self.stages]
+        self.input_queue = self.stage_queues[0]
+
+        # Each output worker gets its own queue, and writes its own shard of the output
+        self.n_output_workers = int(pc.get('n_output_workers', 1))
+        self.output_queues = [self.manager.Queue() for _ in range(self.n_output_workers)]
+        output_names = self.get_shard_output_names()
+
+        # When the workers are done, they put reports (e.g. the event ranges each output shard wrote)
+        # on this queue for the master.
+        self.report_queue = self.manager.Queue()
+        if self.quarantine:
+            self.dead_letter_queue = self.manager.Queue()
+
+        # Anyone who changes something another process may be waiting for (the status, the space on a queue,
+        # the reorder limit) notifies state_changed. See wait_until and notify.
+        self.state_changed = self.manager.Condition()
+        # Queues on which to put stops when crashing, so workers waiting for blocks wake up.
+        self.crash_wakeup_queues = self.stage_queues + self.output_queues
+
+        # Each output worker uses its reorder limit to tell the master the highest block id it will accept.
+        # This bounds the number of blocks waiting in its reorder buffer.
+        max_reorder_blocks = pc.get('max_reorder_blocks')
+        if pc.get('ordered_output', True) and (max_reorder_blocks is not None or
+                                               pc.get('max_reorder_bytes') is not None):
+            self.reorder_limits = [
+                self.manager.Value('i', sys.maxsize if max_reorder_blocks is None
+                                   else shard + (max(max_reorder_blocks, 1) - 1) * self.n_output_workers)
+                for shard in range(self.n_output_workers)]
+        else:
+            self.reorder_limits = None
+
+        # If the block size is tuned to a target processing time, the processing workers report
+        # their (moving average) processing time per event here.
+        if pc.get('target_block_seconds') is not None:
+            self.block_stats = self.manager.dict()
+        else:
+            self.block_stats = None
+
+        # Export live metrics if the user asked for them. The workers report their statistics in worker_stats.
+        if pc.get('metrics_file') is not None or pc.get('metrics_port') is not None:
+            self.metrics = metrics.MetricsExporter(filename=pc.get('metrics_file'), port=pc.get('metrics_port'))
+            self.metrics_interval = pc.get('metrics_interval', 5)
+            self.last_metrics_update = 0
+            self.last_events_written = (time.time(), 0)
+            self.worker_stats = self.manager.dict()
+
+        # Start worker processes
+        worker_config = dict(status=self.status,
+                             stage_queues=self.stage_queues,
+                             output_queues=self.output_queues,
+                             reorder_limits=self.reorder_limits,
+                             block_stats=self.block_stats,
+                             worker_stats=self.worker_stats,
+                             state_changed=self.state_changed,
+                             crash_wakeup_queues=self.crash_wakeup_queues,
+                             report_queue=self.report_queue,
+                             dead_letter_queue=self.dead_letter_queue,
+                             stage_done=self.stage_done,
+                             stage_workers=self.stage_workers,
+                             n_output_workers=self.n_output_workers)
+        self.processing_workers = []
+        # Worker ids of the processing workers, then the output workers, for the live metrics
+        self.worker_ids = []
+        for stage, (group_names, n_workers) in enumerate(self.stages):
+            for worker_number in range(n_workers):
+                c = self.get_worker_config(worker_config)
+                c['pax'].update(dict(plugin_group_names=group_names,
+                                     input_queue=self.stage_queues[stage],
+                                     _stage=stage,
+                                     _worker_id=('processing_%d' % worker_number if len(self.stages) == 1
+                                                 else 'stage%d_%d' % (stage, worker_number))))
+                self.worker_ids.append(c['pax']['_worker_id'])
+                # Only the first stage decodes, only the last stage encodes
+                if stage != 0:
+                    c['pax']['decoder_plugin'] = None
+                if stage != len(self.stages) - 1:
+                    c['pax']['encoder_plugin'] = None
+                self.processing_workers.append(multiprocessing.Process(target=Processor,
+                                                                       kwargs=dict(config_dict=c)))
+            if pc.get('broker_address') is not None:
+                # Leave the configuration for remote workers of this stage with the broker
+                c = dict(c, pax=dict(c['pax'], _remote=True))
+                self.manager.get_broker_info()['stage_%d' % stage] = pickle.dumps(c)
+
+        self.output_workers = []
+        for shard in range(self.n_output_workers):
+            c = self.get_worker_config(worker_config)
+            c['pax'].update(dict(plugin_group_names=['output'],
+                                 input_queue=self.output_queues[shard],
+                                 _output_shard=shard,
+                                 _worker_id='output' if self.n_output_workers == 1 else 'output_%d' % shard))
+            self.worker_ids.append(c['pax']['_worker_id'])
+            if output_names is not None:
+                c['pax']['output_name'] = output_names[shard]
+            self.output_workers.append(multiprocessing.Process(target=Processor,
+                                                               kwargs=dict(config_dict=c)))
+
+        # Start my child processes
+        for w in self.processing_workers + self.output_workers:
+            w.start()
+
+    def get_worker_config(self, pax_settings):
+        """Return the configuration for a worker process: our configuration, with pax_settings added to [pax].
+        Only the [pax] section is copied: the other sections (with e.g. the large list of pmts) are shared by all
+        workers. Workers started by forking share them with the master too, until someone changes them.
+        """
+        config = dict(self.config)
+        config['pax'] = dict(self.config['pax'], **pax_settings)
+        return config
+
+    def get_pipeline_stages(self, n_cpus):
+        """Return list of (plugin group names, number of workers) for each processing stage"""
+        pc = self.config['pax']
+        processing_groups = [q for q in pc['plugin_group_names'] if q not in ('input', 'output')]
+        stages = pc.get('pipeline_stages', None)
+        if stages is None:
+            return [(processing_groups, n_cpus)]
+        stages = [(list(stage['groups']), int(stage.get('n_cpus', 1))) for stage in stages]
+        staged_groups = list(itertools.chain(*[groups for groups, _ in stages]))
+        if staged_groups != processing_groups:
+            raise ValueError("Invalid configuration: the pipeline stages should run the processing plugin groups %s "
+                             "in order, but they run %s" % (processing_groups, staged_groups))
+        if any([n < 1 for _, n in stages]):
+            raise ValueError("Invalid configuration: each pipeline stage needs at least one cpu")
+        return stages
+
     def setup_logging(self):
         """Sets up logging. Must have loaded config first."""
 
@@ -308,12 +582,26 @@ class Processor:
         return plugin_search_paths
 
     def instantiate_plugin(self, name):
-        """Take plugin class name and build class from it
+        """Take plugin class name and build class from it"""
+        self.log.debug('Instantiating %s' % name)
+
+        # Plugin-level settings override module-level settings, which override the default settings
+        this_plugin_config = plugin_config(self.config, name)
+
+        # Let each plugin access its own config, and the processor instance as well
+        # -- needed to e.g. access self.simulator in the simulator plugins or self.config for dumping the config file
+        # TODO: Is this wise? If s there another way?
+        instance = self.get_plugin_class(name)(this_plugin_config, processor=self)
+
+        self.log.debug('Instantiated %s succesfully' % name)
+
+        return instance
+
+    def get_plugin_class(self, name):
+        """Return the plugin class with name (module.class), without instantiating it
 
         The python default module locations are also searched... I think.. so don't name your module 'glob'...
         """
-
-        self.log.debug('Instantiating %s' % name)
         name_module, name_class = name.split('.')
 
         # Find and load the module which includes the plugin
@@ -331,22 +619,27 @@ class Processor:
                 raise ValueError('Invalid configuration: plugin %s not found.' % name)
             plugin_module = spec.loader.load_module()
 
-        this_plugin_config = {}
+        return getattr(plugin_module, name_class)
 
-        this_plugin_config.update(self.config['DEFAULT'])          # First load the default settings
-        if name_module in self.config:
-            this_plugin_config.update(self.config[name_module])    # Then override with module-level settings
-        if name in self.config:
-            this_plugin_config.update(self.config[name])           # Then override with plugin-level settings
-
-        # Let each plugin access its own config, and the processor instance as well
-        # -- needed to e.g. access self.simulator in the simulator plugins or self.config for dumping the config file
-        # TODO: Is this wise? If s there another way?
-        instance = getattr(plugin_module, name_class)(this_plugin_config, processor=self)
-
-        self.log.debug('Instantiated %s succesfully' % name)
-
-        return instance
+    def check_checkpoint_support(self):
+        """Raise ValueError if checkpoints or resuming are on, but some output plugin doesn't support them.
+        Only output plugins which finalize files (see OutputPlugin.finalizes_files) tell the checkpoint which events
+        are safely on disk, and add to their existing output on resume. Others may still have events in a buffer
+        the checkpoint counts as done, or overwrite the output of the run we resume.
+        """
+        pc = self.config['pax']
+        if not (pc.get('write_checkpoint', False) or pc.get('resume', False)):
+            return
+        if 'output' not in pc.get('plugin_group_names', []):
+            return
+        output_plugin_names = pc['output']
+        if not isinstance(output_plugin_names, list):
+            output_plugin_names = [output_plugin_names]
+        for name in output_plugin_names:
+            plugin_class = self.get_plugin_class(name)
+            if issubclass(plugin_class, OutputPlugin) and not plugin_class.finalizes_files:
+                raise ValueError("Invalid configuration: output plugin %s does not support checkpoints or resuming. "
+                                 "Use an output plugin based on WriteToFolder." % name)
 
     def get_plugin_by_name(self, name):
         """Return plugin by class name. Use for testing."""
@@ -370,19 +663,199 @@ class Processor:
         """Process one event with all action plugins. Returns processed event."""
         total_plugins = len(self.action_plugins)
 
+        sample_memory = self.sample_memory()
+        trace = self.tracer is not None and self.tracer.traces(event)
+        if trace:
+            event_number, start = event.event_number, self.timer.last_t
+
         for j, plugin in enumerate(self.action_plugins):
-            self.log.debug("%s (step %d/%d)" % (plugin.__class__.__name__, j, total_plugins))
-            try:
-                event = plugin.process_event(event)
-            except:
-                raise RuntimeError("Plugin failed: " + plugin.__class__.__name__)
-            plugin.total_time_taken += self.timer.punch()
-
-        # Uncomment to diagnose memory leaks
-        # gc.collect()  # don't care about stuff that would be garbage collected properly
-        # objgraph.show_growth(limit=5)
+            if self.log_debug:
+                self.log.debug("%s (step %d/%d)" % (plugin.name, j, total_plugins))
+            event = self.call_plugin(j, plugin.process_event, event, sample_memory=sample_memory, trace=trace)
+        if trace:
+            self.tracer.add('Event %s' % event_number, 'event', start, self.timer.last_t)
         return event
 
+    def process_events(self, events):
+        """Process a list of events (an event block) with all action plugins. Returns the list of processed events.
+        Plugins which can process many events at once (see ProcessPlugin.process_events) get the whole list,
+        the others get the events one by one.
+        """
+        total_plugins = len(self.action_plugins)
+        sample_memory = [self.sample_memory() for _ in events]
+        trace = [self.tracer is not None and self.tracer.traces(event) for event in events]
+        if any(trace):
+            event_numbers, start = '%s-%s' % (events[0].event_number, events[-1].event_number), self.timer.last_t
+
+        for j, plugin in enumerate(self.action_plugins):
+            if self.log_debug:
+                self.log.debug("%s (step %d/%d)" % (plugin.name, j, total_plugins))
+            if plugin.processes_blocks:
+                events = self.call_plugin(j, plugin.process_events, events,
+                                          n_events=len(events), sample_memory=any(sample_memory), trace=any(trace))
+            else:
+                for i, event in enumerate(events):
+                    events[i] = self.call_plugin(j, plugin.process_event, event,
+                                                 sample_memory=sample_memory[i], trace=trace[i])
+        if any(trace):
+            self.tracer.add('Events %s' % event_numbers, 'event', start, self.timer.last_t)
+        return events
+
+    def call_plugin(self, plugin_index, method, argument, n_events=1, sample_memory=False, trace=False):
+        """Call method (process_event or process_events) of the action plugin with index plugin_index on argument,
+        which holds n_events events. Keeps the watchdog informed, charges the time taken to the plugin,
+        if sample_memory, measures the memory the call uses, and if trace, records the call in the trace.
+        Returns what method returned.
+        """
+        plugin = self.action_plugins[plugin_index]
+        start = self.timer.last_t
+        # This runs for every plugin on every event, so skip the method calls for features which are off
+        watchdog = self.watchdog
+        try:
+            if watchdog is not None:
+                self.watch_plugin(plugin_index, n_events=n_events)
+            if sample_memory:
+                self.memory_sampler.start()
+            result = method(argument)
+        except Exception as e:
+            # Note which plugin failed (for the dead letter file), but let the plugin's own exception through
+            e.plugin_name = plugin.__class__.__name__
+            raise
+        finally:
+            # Also when the plugin fails: otherwise the watchdog could interrupt whatever we do next
+            if watchdog is not None:
+                watchdog.rest()
+            if sample_memory:
+                memory_used = self.memory_sampler.stop()
+        if sample_memory:
+            plugin.memory.add(*memory_used)
+        self.add_plugin_time(plugin, n_events=n_events)
+        if trace:
+            self.tracer.add(plugin.name, 'plugin', start, self.timer.last_t, n_events=n_events)
+        return result
+
+    def sample_memory(self):
+        """Return whether to measure the memory used by the plugins on the next event (see memory_profile.py)"""
+        if self.memory_sampler is None:
+            return False
+        self.memory_events_seen += 1
+        return (self.memory_events_seen - 1) % self.memory_profile_interval == 0
+
+    def watch_plugin(self, plugin_index, n_events=1):
+        """Tell the watchdog (if we have one) the action plugin with index plugin_index starts on n_events events"""
+        if self.watchdog is not None and self.plugin_timeouts[plugin_index] is not None:
+            # The timer was punched when the previous plugin finished, i.e. when this plugin started
+            self.watchdog.watch(self.action_plugins[plugin_index].name,
+                                self.timer.last_t,
+                                self.plugin_timeouts[plugin_index] * n_events)
+
+    def start_watchdog(self):
+        """Start a watchdog thread which interrupts plugins that exceed plugin_timeout"""
+        timeouts = [t for t in self.plugin_timeouts if t is not None]
+        if len(timeouts):
+            # Check often enough to catch a timeout within about a tenth of its length, but not more than once a second
+            self.watchdog = watchdog.Watchdog(check_interval=min(1, min(timeouts) / 10))
+
+    def process_pickled_event(self, original, event_number):
+        """Process the event pickled in original. If a plugin fails on it, deal with that using handle_failed_event."""
+        try:
+            return self.process_event(pickle.loads(original))
+        except Exception:
+            return self.handle_failed_event(original, event_number)
+
+    def handle_failed_event(self, original, event_number):
+        """Deal with an event on which a plugin failed: retry it in a fresh worker if retry_failed_events is set,
+        otherwise (or if it fails again) put it in the dead letter file. Call this from an except block.
+          - original: pickle of the event as it was before processing
+          - event_number: number of the event
+        Returns the processed event if the retry worked, None if the event was quarantined.
+        """
+        self.failed_events += 1
+        error_traceback = traceback.format_exc()
+        exc = sys.exc_info()[1]
+        plugin_name = getattr(exc, 'plugin_name', None)
+        self.log.error("%s failed on event %s, quarantining it:\n%s" % (
+            plugin_name or 'Processing', event_number, error_traceback))
+        # Don't charge the time until now to the next plugin
+        self.timer.punch()
+
+        # Output plugins have files open in this process, we can't retry those in a fresh worker
+        retry = self.config['pax'].get('retry_failed_events', False) and not self.is_output_worker
+        if retry:
+            event, retry_traceback = self.retry_event(original)
+            self.timer.punch()
+            if event is not None:
+                self.log.info("Event %s was processed fine in a fresh worker" % event_number)
+                # In a standalone processor, the output plugins still have to see it
+                for plugin in self.action_plugins:
+                    if isinstance(plugin, OutputPlugin):
+                        event = plugin.process_event(event)
+                return event
+            error_traceback += '\nRetry in a fresh worker:\n' + retry_traceback
+
+        record = dict(event_number=event_number,
+                      plugin=plugin_name,
+                      traceback=error_traceback,
+                      worker_id=self.worker_id,
+                      retried=retry,
+                      event=original)
+        if self.dead_letter_queue is not None:
+            self.dead_letter_queue.put(record)
+        else:
+            self.dead_letters.write(record)
+        return None
+
+    def retry_event(self, original):
+        """Process the event pickled in original with freshly started plugins in a new process.
+        The output plugins are left out: in a standalone processor, run those on the result yourself.
+        Returns (event, None) if this worked, (None, traceback) if not.
+        """
+        config = self.get_worker_config({})
+        pc = config['pax']
+        # The decoder and encoder get their place in the plugin groups again when the new processor starts
+        pc['plugin_group_names'] = [g for g in pc['plugin_group_names']
+                                    if g not in ('input', 'output', 'decoder_plugin', 'encoder_plugin')]
+        for k in ('_worker_id', '_remote', '_stage', '_output_shard'):
+            pc.pop(k, None)
+        pc.update(dict(n_cpus=1, quarantine_failed_events=False, write_checkpoint=False, resume=False,
+                       trace_file=None))
+
+        parent_connection, child_connection = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target=_retry_event, args=(config, original, child_connection))
+        worker.start()
+        try:
+            result, error_traceback = parent_connection.recv()
+        except EOFError:
+            result, error_traceback = None, 'Retry worker died without a word (exit code %s)' % worker.exitcode
+        worker.join()
+        if result is None:
+            return None, error_traceback
+        return pickle.loads(result), None
+
+    def add_plugin_time(self, plugin, n_events=1):
+        """Charge the time since the last timer punch to plugin.
+        If it processed n_events at once, each event counts as taking an equal share of the time.
+        """
+        t = self.timer.punch()
+        plugin.total_time_taken += t
+        plugin.latency.add(t / n_events, n=n_events)
+
+    def add_input_time(self, event):
+        """Charge the time since the last timer punch to the input plugin, which just read event"""
+        start = self.timer.last_t
+        self.add_plugin_time(self.input_plugin)
+        if self.tracer is not None and self.tracer.traces(event):
+            self.tracer.add(self.input_plugin.name, 'input', start, self.timer.last_t,
+                            event_number=event.event_number)
+
+    @contextmanager
+    def trace_span(self, trace, name, category):
+        """Record the code in the with block as a span called name in the trace, if trace is True"""
+        start = time.time()
+        yield
+        if trace:
+            self.tracer.add(name, category, start, time.time())
+
     def run(self, clean_shutdown=True):
         """Run the processor over all events, then shuts down the plugins (unless clean_shutdown=False)
 
@@ -395,77 +868,111 @@ class Processor:
         if self.worker_id != 'master':
             # I'm a child processor
             self.check_crash()
-            if self.worker_id == 'output':
-                block_id = -1
-                block_heap = []
+            if self.is_output_worker:
+                self.update_reorder_limit()
+            self.start_watchdog()
 
             while True:
-                # Check if we can end before we fetch event blocks:
-                # the last block may get added while we are fetching events
-                can_end = self.status.value == MP_STATUS['processing_done' if self.worker_id == 'output'
-                                                         else 'input_done']
-
-                if self.worker_id == 'output':
-                    # The output worker has an additional complication: blocks must be written in proper order
-                    self.check_crash()
-
-                    try:
-                        # If we don't have the block we want yet, keep fetching event blocks from the queue .
-                        # Note: if one block takes much longer than the others, this would slurp all blocks
-                        # while waiting for the difficult one to come through, potentially exhausting your RAM...
-                        while not (len(block_heap) and block_heap[0][0] == block_id + 1):
-                            self.check_crash()
-                            heapq.heappush(block_heap, self.input_queue.get(block=True, timeout=1))
-                            self.log.debug("Output just got a block, heap is now %d blocks long" % len(block_heap))
-                            self.log.debug("Earliest block: %d, looking for block %s" % (block_heap[0][0],
-                                                                                         block_id + 1))
-
-                    except queue.Empty:
-                        if can_end and not len(block_heap):
-                            # We're done!
-                            break
-                        # Queue is empty, but either we're not in the processing_done status, or we're waiting for a
-                        # block which hasn't arrived on the queue yet. Wait, then try the queue again.
-                        time.sleep(1)
-                        continue
-
-                    # Pop the next event block from the heap
-                    block_id, event_block = heapq.heappop(block_heap)
-
-                else:
-                    # Ordinary worker
-                    self.check_crash()
-                    try:
-                        block_id, event_block = self.input_queue.get(block=True, timeout=1)
-                    except queue.Empty:
-                        if can_end:
-                            # We're done!
-                            break
-                        # Queue is empty: wait for more data, then check can_end again
-                        self.log.debug("%s found empty input queue, can_end is %s, status is %s" % (
-                            self.worker_id, can_end, self.status.value))
-                        time.sleep(1)
-                        continue
-
                 try:
-                    self.log.debug("%s now processing block %d" % (self.worker_id, block_id))
-
-                    for i, event in enumerate(event_block):
+                    get_start = time.time()
+                    block = self.get_block()
+                    if block is None:
+                        # We're done!
+                        break
+                    block_id, event_block, payload = block
+                    got_block = time.time()
+
+                    self.log.debug("%s now processing block %d", self.worker_id, block_id)
+                    if event_block is None:
+                        event_block = self.transport.unpack(payload)
+                    # We only know whether to trace this block once we see which events are in it
+                    trace_block = self.tracer is not None and self.tracer.traces_any(event_block)
+                    if trace_block:
+                        self.tracer.add('Get block %d' % block_id, 'queue', get_start, got_block)
+                        self.tracer.add('Unpack block %d' % block_id, 'block', got_block, time.time())
+
+                    # Don't charge the time spent waiting for the block to the first plugin
+                    self.timer.punch()
+                    block_start = time.time()
+                    if self.process_blocks:
+                        # Let plugins which can vectorize over events process the whole block at once
                         self.check_crash()
-                        with timeout(seconds=300, error_message="Worker %s timed out." % (self.worker_id)):
-                            event_block[i] = self.process_event(event)
+                        originals = [pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+                                     for event in event_block] if self.quarantine else None
+                        event_numbers = [event.event_number for event in event_block] if self.quarantine else None
+                        try:
+                            event_block = self.process_events(event_block)
+                        except Exception:
+                            if not self.quarantine:
+                                raise
+                            # We don't know which event(s) the plugin failed on: start again, one event at a time.
+                            self.log.warning("Processing block %d failed, processing its events one by one" % block_id)
+                            self.timer.punch()
+                            event_block = [self.process_pickled_event(original, event_number)
+                                           for original, event_number in zip(originals, event_numbers)]
+                    else:
+                        for i, event in enumerate(event_block):
+                            self.check_crash()
+                            original = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL) if self.quarantine \
+                                else None
+                            event_number = event.event_number
+                            try:
+                                event_block[i] = self.process_event(event)
+                            except Exception:
+                                if not self.quarantine:
+                                    raise
+                                event_block[i] = self.handle_failed_event(original, event_number)
+                    # Quarantined events drop out of the block
+                    event_block = [event for event in event_block if event is not None]
+                    if self.block_stats is not None and len(event_block):
+                        self.report_block_time((time.time() - block_start) / len(event_block))
+                    self.events_processed += len(event_block)
+                    self.report_worker_stats()
+
+                    if self.is_output_worker:
+                        for event in event_block:
+                            parallel.add_to_ranges(self.event_ranges, getattr(event, 'event_number', None))
+                        if len(event_block):
+                            self.update_checkpoint(event_block[-1].event_number)
+                    else:
+                        # Push the result to the next stage, or to the output worker for this block
+                        if self.next_queue is not None:
+                            next_queue = self.next_queue
+                        else:
+                            next_queue = self.output_queues[block_id % self.n_output_workers]
+                        with self.trace_span(trace_block, 'Pack block %d' % block_id, 'block'):
+                            packed = self.transport.pack(event_block)
+                        with self.trace_span(trace_block, 'Put block %d' % block_id, 'queue'):
+                            next_queue.put((block_id, packed))
+
+                    # We're done with the block we got: the transport can free its resources
+                    # (the payload is None if the output worker had spilled the block to disk)
+                    del event_block
+                    if payload is not None:
+                        self.transport.release(payload)
+
+                    if not self.is_output_worker:
+                        # If the next stage or output worker has trouble catching up, wait for it
+                        with self.trace_span(trace_block, 'Wait for space on the next queue', 'queue'):
+                            self.wait_until(lambda: next_queue.qsize() < self.max_queue_blocks)
                 except Exception:
-                    # Crash occurred during processing: notify everyone else, then die
-                    self.status.value = MP_STATUS['crashing']
+                    # Crash occurred while getting, processing or passing on a block: notify everyone else, then die
+                    self.signal_crash()
                     raise
 
-                if self.worker_id != 'output':
-                    # Push the result to the output queue
-                    self.output_queue.put((block_id, event_block))
-                    # If the output worker has trouble catching up, sleep for a bit
-                    while self.output_queue.qsize() >= self.max_queue_blocks:
-                        self.check_crash()
-                        time.sleep(1)
+            self.report_worker_stats(force=True)
+            report = dict(worker_id=self.worker_id,
+                          latency=[(p.name, p.latency) for p in self.action_plugins],
+                          memory=[(p.name, p.memory) for p in self.action_plugins],
+                          trace=self.tracer.spans if self.tracer is not None else [])
+            if self.is_output_worker:
+                report.update(dict(output_shard=self.output_shard,
+                                   output_name=self.get_output_name(),
+                                   event_ranges=self.event_ranges))
+            # Report before finishing our stage, so the report is in before the master is done
+            self.report_queue.put(report)
+            if not self.is_output_worker:
+                self.finish_stage()
 
         else:
             # I'm a master or standalone processor
@@ -481,75 +988,452 @@ class Processor:
                 # I'm a master processor
                 block_id = 0
                 event_block = []
-                for i, event in enumerate(self.get_events()):
-                    event_block.append(event)
-                    self.master_heartbeat()
-                    if len(event_block) >= self.block_size:
-                        self.log.debug("Created event block %d" % block_id)
-                        self.input_queue.put((block_id, event_block))
-                        block_id += 1
-                        event_block = []
-                    # If the processing workers have trouble catching up, sleep for a bit
-                    while self.input_queue.qsize() >= self.max_queue_blocks:
+                self.timer.punch()
+                try:
+                    for i, event in enumerate(self.get_events()):
+                        self.add_input_time(event)
+                        self.events_read = i + 1
+                        event_block.append(event)
                         self.master_heartbeat()
-                        time.sleep(1)
-                    if i >= self.stop_after:
-                        self.log.info("Read in user-defined limit of %d events." % i)
-                        break
-                self.input_queue.put((block_id, event_block))
+                        if self.block_sizer.add(event):
+                            self.log.debug("Created event block %d with %d events", block_id, len(event_block))
+                            self.send_block(block_id, event_block)
+                            block_id += 1
+                            event_block = []
+                        # If the processing workers have trouble catching up, wait for them
+                        self.wait_until(lambda: self.input_queue.qsize() < self.max_queue_blocks)
+                        if i >= self.stop_after:
+                            self.log.info("Read in user-defined limit of %d events." % i)
+                            break
+                        # Don't charge the time spent sending blocks to the input plugin
+                        self.timer.punch()
+                    self.send_block(block_id, event_block)
+                except Exception:
+                    if self.status.value != MP_STATUS['crashing']:
+                        self.signal_crash()
+                    raise
+                # Tell each worker of the first stage to stop once it has finished the blocks on the queue.
+                # From now on, remote workers can't join anymore (see join_stage).
+                with self.state_changed:
+                    for _ in range(self.stage_workers[0].value):
+                        self.input_queue.put(parallel.STOP)
+                    self.set_status('input_done')
                 self.master_heartbeat()
-                self.status.value = MP_STATUS['input_done']
-
-                # Wait for child processes to die or crash
-                # Note we never use join/wait -- so we never wait for something that may not happen
-                while True:
-                    self.master_heartbeat()
-                    if all([not w.is_alive() for w in self.processing_workers]):
-                        self.status.value = MP_STATUS['processing_done']
-                    if not self.output_worker.is_alive():
-                        break
-                    time.sleep(1)
+
+                # Wait for child processes to die or crash.
+                # We wait at most a second at a time, to update the status line.
+                for output_worker in self.output_workers:
+                    while output_worker.is_alive():
+                        output_worker.join(timeout=1)
+                        self.master_heartbeat()
+                        if self.status.value == MP_STATUS['input_done'] and \
+                                all([not w.is_alive() for w in self.processing_workers]):
+                            self.set_status('processing_done')
+                self.check_crash()
+                self.write_dead_letters()
+                self.update_metrics(force=True)
+                self.report_dead_letters()
+                self.process_reports()
                 self.log.info("Pax is done, goodbye!")
 
             else:
                 # I'm a standalone processor
                 i = 0  # in case loop does not run
                 self.timer.punch()
+                from tqdm import tqdm       # Progress bar
                 for i, event in enumerate(tqdm(self.get_events(),
                                                desc='Event',
                                                total=self.number_of_events)):
-                    self.input_plugin.total_time_taken += self.timer.punch()
+                    self.add_input_time(event)
                     if i >= self.stop_after:
                         self.log.info("User-defined limit of %d events reached." % i)
                         break
-                    self.process_event(event)
-                    self.log.debug("Event %d (%d processed)" % (event.event_number, i))
+                    original = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL) if self.quarantine else None
+                    try:
+                        self.process_event(event)
+                    except Exception:
+                        if not self.quarantine:
+                            raise
+                        self.handle_failed_event(original, event.event_number)
+                    self.update_checkpoint(event.event_number)
+                    self.log.debug("Event %d (%d processed)", event.event_number, i)
                 else:   # If no break occurred:
                     self.log.info("All events from input source have been processed.")
+                self.report_dead_letters()
 
                 if self.config['pax']['print_timing_report']:
                     self.make_timing_report(i + 1)
+                self.write_latency_report(self.get_latency_histograms(), self.get_output_name())
+                self.make_memory_report(self.get_memory_profiles(), self.get_output_name())
+                self.write_trace()
 
         # Shutdown all plugins now -- don't wait until this Processor instance gets deleted
         if clean_shutdown:
             self.shutdown()
 
+    def report_block_time(self, seconds_per_event):
+        """Update the moving average of the processing time per event we report to the master"""
+        if hasattr(self, 'seconds_per_event'):
+            self.seconds_per_event = 0.7 * self.seconds_per_event + 0.3 * seconds_per_event
+        else:
+            self.seconds_per_event = seconds_per_event
+        self.block_stats[self.worker_id] = self.seconds_per_event
+
+    def report_worker_stats(self, force=False):
+        """Tell the master how many events we processed, how many failed, and how much time each plugin took,
+        for the live metrics. Does this at most once a second, unless force=True.
+        """
+        if self.worker_stats is None or (not force and time.time() < self.last_stats_update + 1):
+            return
+        self.last_stats_update = time.time()
+        self.worker_stats[self.worker_id] = dict(
+            is_output_worker=self.is_output_worker,
+            events_processed=self.events_processed,
+            failed_events=self.failed_events,
+            plugin_seconds=[(p.name, p.total_time_taken / 1000) for p in self.action_plugins])
+
+    def get_shard_output_names(self):
+        """Return the output_name for each output worker, or None if there is only one output worker
+        (which then uses the output_name as usual).
+        Shard i writes to <output_name>_shard<i>, where output_name defaults to the input name without extension.
+        """
+        if self.n_output_workers == 1:
+            return None
+        output_name = self.derive_output_name()
+        if output_name is None:
+            raise ValueError("Invalid configuration: specify output_name when using several output workers")
+        self.output_name = output_name
+        return ['%s_shard%d' % (output_name, shard) for shard in range(self.n_output_workers)]
+
+    def derive_output_name(self):
+        """Return the output_name the output plugin will use, without loading it (e.g. in the master).
+        Like OutputPlugin, defaults to the input name without extension. Returns None if we can't tell.
+        """
+        pc = self.config['pax']
+        output_name = pc.get('output_name')
+        if output_name is None:
+            output_plugins = pc.get('output', [])
+            if not isinstance(output_plugins, list):
+                output_plugins = [output_plugins]
+            if len(output_plugins):
+                output_name = self.config.get(output_plugins[0], {}).get('output_name')
+        if output_name is None:
+            input_name = pc.get('input_name', self.config.get(pc.get('input'), {}).get('input_name'))
+            if input_name is None:
+                return None
+            output_name = os.path.splitext(os.path.basename(input_name))[0]
+        return output_name
+
+    def process_reports(self):
+        """Process the reports the workers sent us at the end of the run.
+        With several output workers, writes a manifest of the event ranges in each output shard.
+        """
+        reports = []
+        while not self.report_queue.empty():
+            reports.append(self.report_queue.get())
+        self.worker_reports = reports
+        output_reports = sorted([r for r in reports if r.get('output_shard') is not None],
+                                key=lambda r: r['output_shard'])
+
+        # Merge the latency histograms of all workers. Input plugin first, then processing, then output.
+        histograms = self.get_latency_histograms()
+        for r in sorted(reports, key=lambda r: r.get('output_shard') is not None):
+            for name, h in r['latency']:
+                if name in histograms:
+                    histograms[name].merge(h)
+                else:
+                    histograms[name] = h
+        if self.config['pax'].get('print_timing_report'):
+            self.make_timing_report(self.input_plugin.latency.n, histograms)
+        # Merge the memory profiles of all workers in the same way
+        profiles = self.get_memory_profiles()
+        for r in sorted(reports, key=lambda r: r.get('output_shard') is not None):
+            for name, m in r['memory']:
+                if name in profiles:
+                    profiles[name].merge(m)
+                else:
+                    profiles[name] = m
+
+        if self.n_output_workers > 1:
+            output_name = self.output_name
+        elif len(output_reports):
+            output_name = output_reports[0]['output_name']
+        else:
+            output_name = None
+        self.write_latency_report(histograms, output_name)
+        self.make_memory_report(profiles, output_name)
+        self.write_trace(itertools.chain(*[r['trace'] for r in reports]))
+
+        if self.n_output_workers > 1:
+            manifest = dict(output_name=self.output_name,
+                            shards=[dict(output_shard=r['output_shard'],
+                                         output_name=r['output_name'],
+                                         event_ranges=r['event_ranges'],
+                                         n_events=sum([last - first + 1 for first, last in r['event_ranges']]))
+                                    for r in output_reports])
+            manifest_file = self.output_name + '_manifest.json'
+            self.log.info("Writing manifest of output shards to %s" % manifest_file)
+            with open(manifest_file, mode='w') as outfile:
+                json.dump(manifest, outfile, sort_keys=True, indent=4)
+
+    def write_trace(self, worker_spans=()):
+        """Write our trace, and the spans the workers traced (if any), to the trace file (see tracing.py)"""
+        if self.tracer is None:
+            return
+        filename = self.config['pax']['trace_file']
+        self.log.info("Writing trace to %s" % filename)
+        tracing.write_trace(filename, self.tracer.spans + list(worker_spans))
+
+    def get_output_name(self):
+        """Return the output_name of the first output plugin this processor runs, or None if it has none"""
+        for p in self.action_plugins:
+            if isinstance(p, OutputPlugin):
+                return p.config.get('output_name')
+        return None
+
+    def update_checkpoint(self, last_event_written=None):
+        """Update the checkpoint journal (if we keep one) after writing the event last_event_written.
+        Output plugins which only finish output files now and then (see OutputPlugin.finalized_through)
+        hold the checkpoint back to the last event in their finished files.
+        """
+        if self.checkpoint is None:
+            return
+        if last_event_written is not None:
+            self.last_event_written = last_event_written
+        last_event = self.last_event_written
+        output_files = []
+        for p in self.action_plugins:
+            if not isinstance(p, OutputPlugin) or not p.finalizes_files:
+                continue
+            output_files.extend(p.finalized_files)
+            if p.finalized_through is None:
+                last_event = None
+            elif last_event is not None:
+                last_event = min(last_event, p.finalized_through)
+        self.checkpoint.update(last_event, output_files)
+
+    def get_latency_histograms(self):
+        """Return OrderedDict of plugin name -> latency histogram for the plugins in this processor"""
+        plugins = self.action_plugins
+        if self.input_plugin is not None:
+            plugins = [self.input_plugin] + plugins
+        return OrderedDict([(p.name, p.latency) for p in plugins])
+
+    def write_latency_report(self, histograms, output_name):
+        """Write a summary of the latency histograms to <output_name>_latency.json, if write_latency_report is set"""
+        if not self.config['pax'].get('write_latency_report', False) or output_name in (None, 'SCREEN'):
+            return
+        filename = output_name + '_latency.json'
+        self.log.info("Writing latency report to %s" % filename)
+        with open(filename, mode='w') as outfile:
+            json.dump(OrderedDict([(name, h.summary()) for name, h in histograms.items()]), outfile, indent=4)
+
+    def get_memory_profiles(self):
+        """Return OrderedDict of plugin name -> memory profile for the action plugins in this processor"""
+        return OrderedDict([(p.name, p.memory) for p in self.action_plugins])
+
+    def make_memory_report(self, profiles, output_name):
+        """If memory_profile_interval is set, log a table of the memory used by each plugin,
+        and write it to <output_name>_memory.json.
+          - profiles: OrderedDict of plugin name -> memory profile
+        """
+        if not self.memory_profile_interval:
+            return
+        from prettytable import PrettyTable     # Only import when we make a memory report
+        memory_report = PrettyTable(['Plugin',
+                                     'Samples',
+                                     'RSS growth (MB)',
+                                     'RSS growth after first sample (MB)',
+                                     'Retained/call (kB)',
+                                     'Peak (MB)'])
+        memory_report.align = "r"
+        memory_report.align["Plugin"] = "l"
+        # Plugins which keep growing the memory (and so may leak) go on top
+        for name, m in sorted(profiles.items(), key=lambda x: -x[1].later_rss_growth):
+            summary = m.summary()
+            memory_report.add_row([name,
+                                   summary['n'],
+                                   round(summary['rss_growth'] / 1e6, 1),
+                                   round(summary['later_rss_growth'] / 1e6, 1),
+                                   round(summary['mean_retained'] / 1e3, 1),
+                                   round(summary['peak'] / 1e6, 1)])
+        self.log.info("Memory report (sampled every %d events):\n%s" % (self.memory_profile_interval, memory_report))
+
+        if output_name in (None, 'SCREEN'):
+            return
+        filename = output_name + '_memory.json'
+        self.log.info("Writing memory report to %s" % filename)
+        with open(filename, mode='w') as outfile:
+            json.dump(OrderedDict([(name, m.summary()) for name, m in profiles.items()]), outfile, indent=4)
+
+    def get_block(self):
+        """Get the next event block a worker should process, or None if there is nothing left to do.
+        Returns (block_id, event_block, payload). event_block is None if it still has to be unpacked from payload.
+        """
+        if self.is_output_worker and self.ordered_output:
+            # The output worker has an additional complication: blocks must be written in proper order.
+            # If we don't have the block we want yet, keep fetching event blocks from the queue.
+            # If one block takes much longer than the others, the reorder buffer fills up while we wait
+            # for it. Use max_reorder_blocks / max_reorder_bytes to make the processing workers wait
+            # instead, and/or reorder_spill_dir to spill blocks to disk.
+            while not self.reorder_buffer.next_block_available():
+                item = self.get_from_queue()
+                if item is None:
+                    if len(self.reorder_buffer):
+                        raise RuntimeError("All processing workers are done, but block %d never arrived!" %
+                                           self.reorder_buffer.next_block_id)
+                    return None
+                self.reorder_buffer.push(*item)
+                self.update_reorder_limit()
+            block = self.reorder_buffer.pop()
+            self.update_reorder_limit()
+            return block
+
+        item = self.get_from_queue()
+        if item is None:
+            return None
+        block_id, payload = item
+        return block_id, None, payload
+
+    def get_from_queue(self):
+        """Get the next (block_id, payload) from our input queue, or None once all upstream workers are done"""
+        item = self.input_queue.get()
+        self.check_crash()
+        # Whoever puts blocks on this queue may be waiting for space on it
+        self.notify()
+        if item == parallel.STOP:
+            return None
+        return item
+
+    def send_block(self, block_id, event_block):
+        """Put an event block on the queue of the first processing stage (master only).
+        If the reorder buffer of the output worker for this block is limited, first wait until it can accept it.
+        Since blocks are sent in order, the block each output worker waits for is always already on its way,
+        so this can't deadlock.
+        """
+        trace = self.tracer is not None and self.tracer.traces_any(event_block)
+        if self.reorder_limits is not None:
+            reorder_limit = self.reorder_limits[block_id % self.n_output_workers]
+            with self.trace_span(trace, 'Wait for space in the reorder buffer', 'queue'):
+                self.wait_until(lambda: block_id <= reorder_limit.value)
+        with self.trace_span(trace, 'Pack block %d' % block_id, 'block'):
+            packed = self.transport.pack(event_block)
+        with self.trace_span(trace, 'Put block %d' % block_id, 'queue'):
+            self.input_queue.put((block_id, packed))
+
+    def join_stage(self):
+        """Add a remote worker to the count of workers in its stage.
+        Workers can only join while the master is still sending out blocks; if it's done, we just exit.
+        """
+        with self.state_changed:
+            if self.status.value != MP_STATUS['normal']:
+                self.log.info("This pax run is already finishing, no need for another worker.")
+                exit('')
+            self.stage_workers[self.stage].value += 1
+
+    def finish_stage(self):
+        """Called when a processing worker is done. If it is the last worker of its stage to finish,
+        tell the workers of the next stage (or the output workers) to stop once they are done with their blocks.
+        """
+        with self.state_changed:
+            done = self.stage_done[self.stage]
+            done.value += 1
+            last_to_finish = done.value == self.stage_workers[self.stage].value
+        if not last_to_finish:
+            return
+        if self.next_queue is not None:
+            for _ in range(self.stage_workers[self.stage + 1].value):
+                self.next_queue.put(parallel.STOP)
+        else:
+            for q in self.output_queues:
+                q.put(parallel.STOP)
+
+    def wait_until(self, predicate):
+        """Wait until predicate() is True. Dies (see check_crash) if some process crashes in the meantime.
+        Whoever changes something predicate depends on must call notify.
+        """
+        if predicate():
+            return
+        with self.state_changed:
+            while not predicate() and self.status.value != MP_STATUS['crashing']:
+                if self.worker_id == 'master':
+                    # Wake up every second to update the status line
+                    self.state_changed.wait(1)
+                    self.update_status()
+                else:
+                    self.state_changed.wait()
+        self.check_crash()
+
+    def notify(self):
+        """Wake up all processes waiting in wait_until"""
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+    def set_status(self, status):
+        with self.state_changed:
+            # Once we're crashing, there's no going back
+            if self.status.value != MP_STATUS['crashing'] or status == 'crashing':
+                self.status.value = MP_STATUS[status]
+            self.state_changed.notify_all()
+
+    def signal_crash(self):
+        """Tell all other processes we're crashing, and wake them up if they are waiting for something"""
+        self.set_status('crashing')
+        for q in self.crash_wakeup_queues:
+            for _ in range(max([n.value for n in self.stage_workers])):
+                q.put(parallel.STOP)
+
+    def update_reorder_limit(self):
+        """Tell the master the highest block id the output worker can accept.
+        If the reorder buffer is full (and can't spill to disk) we only accept the block we are waiting for.
+        """
+        if self.reorder_limit is None:
+            return
+        next_block_id = self.reorder_buffer.next_block_id
+        if self.reorder_buffer.full:
+            limit = next_block_id
+        elif self.max_reorder_blocks is not None:
+            limit = next_block_id + (max(self.max_reorder_blocks, 1) - 1) * self.n_output_workers
+        else:
+            limit = sys.maxsize
+        if limit != self.reorder_limit.value:
+            self.reorder_limit.value = limit
+            self.notify()
+
     def master_heartbeat(self):
         self.check_crash()
+        if time.time() > self.last_status_update + 1:
+            self.write_dead_letters()
+        self.update_metrics()
         self.update_status()
 
+    def report_dead_letters(self):
+        if self.dead_letters is not None and self.dead_letters.n_records:
+            self.log.warning("%d events were quarantined since a plugin failed on them. See %s." % (
+                self.dead_letters.n_records, self.dead_letters.filename))
+
+    def write_dead_letters(self):
+        """Write the quarantined events the workers sent us to the dead letter file"""
+        if self.dead_letter_queue is None:
+            return
+        while not self.dead_letter_queue.empty():
+            self.dead_letters.write(self.dead_letter_queue.get())
+
     @property
     def queued_events(self):
         """Return the number of events waiting to be processed, or 0 if we're not multiprocessing"""
         if hasattr(self, 'input_queue'):
-            return self.input_queue.qsize() * self.block_size
+            return self.input_queue.qsize() * self.block_sizer.block_size
         return 0
 
     def check_crash(self):
         if self.status.value == MP_STATUS['crashing']:
             if self.worker_id == 'master':
                 self.log.fatal("Crash detected, giving worker processes five seconds to die in peace")
-                time.sleep(5)
+                give_up_at = time.time() + 5
+                for w in self.processing_workers + self.output_workers:
+                    w.join(timeout=max(0, give_up_at - time.time()))
+                self.update_metrics(force=True)
                 self.log.fatal("That's it, farewell cruel world!")
                 raise RuntimeError("Terminated pax multiprocessing due to crash in one of the workers.")
             exit('')
@@ -561,40 +1445,97 @@ class Processor:
         self.last_status_update = time.time()
 
         def get_mem_usage(pid):
-            """Return memory usage in MB for process with PID pid.
-            Returns 0 if process does not exist (anymore).
-            Maintains a cache to make sure this is not polled more than once per second
-            """
-            try:
-                return psutil.Process(pid).memory_info().rss / 1e6
-            except psutil.NoSuchProcess:
-                return 0
+            """Return memory usage in MB for process with PID pid, or 0 if it does not exist (anymore)"""
+            return metrics.process_rss(pid) / 1e6
 
         sys.stdout.write('\rStatus: %s. Processing queue: %d events. Output queue: %s events. '
                          'RAM usage: %0.1f (master) %0.1f (workers) %0.1f (output)' % (
             [k for k, v in MP_STATUS.items() if v == self.status.value][0],
             self.queued_events,
-            self.output_queue.qsize() * self.block_size,
+            sum([q.qsize() for q in self.output_queues]) * self.block_sizer.block_size,
             get_mem_usage(os.getpid()),
             sum([get_mem_usage(worker.pid) if worker.pid is not None else 0
                  for worker in self.processing_workers]),
-            (get_mem_usage(self.output_worker.pid) if self.output_worker.pid is not None else 0),
+            sum([get_mem_usage(worker.pid) if worker.pid is not None else 0
+                 for worker in self.output_workers]),
         ))
         sys.stdout.flush()
 
-    def make_timing_report(self, events_actually_processed):
-        all_plugins = [self.input_plugin] + self.action_plugins
+    def update_metrics(self, force=False):
+        """Publish the live metrics (if the user asked for them), at most once every metrics_interval seconds
+        unless force=True"""
+        if self.metrics is None or (not force and time.time() < self.last_metrics_update + self.metrics_interval):
+            return
+        self.last_metrics_update = time.time()
+        self.metrics.update(self.get_metrics())
+
+    def get_metrics(self):
+        """Return the live metrics of this multiprocessing run, in the format metrics.format_metrics expects"""
+        worker_stats = dict(self.worker_stats.items())
+        now = time.time()
+        events_written = sum([s['events_processed'] for s in worker_stats.values() if s['is_output_worker']])
+        last_t, last_events_written = self.last_events_written
+        self.last_events_written = (now, events_written)
+        status = [k for k, v in MP_STATUS.items() if v == self.status.value][0]
+
+        queues = [('stage_%d' % i, q) for i, q in enumerate(self.stage_queues)]
+        queues += [('output_%d' % i, q) for i, q in enumerate(self.output_queues)]
+        processes = [('master', os.getpid())]
+        processes += [(worker_id, w.pid) for worker_id, w in zip(self.worker_ids,
+                                                                 self.processing_workers + self.output_workers)
+                      if w.pid is not None]
+        crashed_workers = [w for w in self.processing_workers + self.output_workers
+                           if w.exitcode is not None and w.exitcode != 0]
+
+        return [
+            ('pax_events_read_total', 'counter', 'Events read by the input plugin',
+             [({}, self.events_read)]),
+            ('pax_events_processed_total', 'counter', 'Events each worker processed (for output workers: wrote)',
+             [(dict(worker=k), s['events_processed']) for k, s in sorted(worker_stats.items())]),
+            ('pax_events_per_second', 'gauge', 'Events written to the output per second since the last update',
+             [({}, (events_written - last_events_written) / max(now - last_t, 1e-9))]),
+            ('pax_queue_blocks', 'gauge', 'Event blocks waiting on each queue',
+             [(dict(queue=name), q.qsize()) for name, q in queues]),
+            ('pax_block_size', 'gauge', 'Events per block the master currently sends',
+             [({}, self.block_sizer.block_size)]),
+            ('pax_rss_bytes', 'gauge', 'Resident memory of the master and the local workers',
+             [(dict(worker=name), metrics.process_rss(pid)) for name, pid in processes]),
+            ('pax_plugin_seconds_total', 'counter', 'Time each worker spent in each plugin',
+             [(dict(worker=k, plugin=plugin_name), t)
+              for k, s in sorted(worker_stats.items()) for plugin_name, t in s['plugin_seconds']]),
+            ('pax_failed_events_total', 'counter', 'Events on which a plugin failed, per worker',
+             [(dict(worker=k), s['failed_events']) for k, s in sorted(worker_stats.items())]),
+            ('pax_quarantined_events_total', 'counter', 'Events written to the dead letter file',
+             [({}, self.dead_letters.n_records if self.dead_letters is not None else 0)]),
+            ('pax_worker_crashes_total', 'counter', 'Local worker processes which exited with an error',
+             [({}, len(crashed_workers))]),
+            ('pax_status', 'gauge', 'Multiprocessing status of pax (1 for the current status)',
+             [(dict(status=k), int(k == status)) for k in MP_STATUS.keys()]),
+        ]
+
+    def make_timing_report(self, events_actually_processed, histograms=None):
+        """Log a table of the time taken by each plugin.
+        histograms: OrderedDict of plugin name -> latency histogram, defaults to those of the plugins in this processor
+        """
+        if histograms is None:
+            histograms = self.get_latency_histograms()
+        from prettytable import PrettyTable     # Only import when we make a timing report
         timing_report = PrettyTable(['Plugin',
                                      '%',
                                      '/event (ms)',
                                      '#/s',
-                                     'Total (s)'])
+                                     'Total (s)',
+                                     'p50 (ms)',
+                                     'p90 (ms)',
+                                     'p99 (ms)',
+                                     'max (ms)'])
         timing_report.align = "r"
         timing_report.align["Plugin"] = "l"
-        total_time = sum([plugin.total_time_taken for plugin in all_plugins])
+        total_time = sum([h.total for h in histograms.values()])
 
-        for plugin in all_plugins:
-            t = plugin.total_time_taken
+        for name, h in histograms.items():
+            t = h.total
+            percentiles = [round(x, 1) for x in (h.percentile(50), h.percentile(90), h.percentile(99), h.max)]
 
             if t > 0:
                 time_per_event_ms = round(t / events_actually_processed, 1)
@@ -603,34 +1544,41 @@ class Processor:
                 if event_rate_hz > 100:
                     event_rate_hz = ''
 
-                timing_report.add_row([plugin.__class__.__name__,
+                timing_report.add_row([name,
                                        round(100 * t / total_time, 1),
                                        time_per_event_ms,
                                        event_rate_hz,
-                                       round(t / 1000, 1)])
+                                       round(t / 1000, 1)] + percentiles)
             else:
-                timing_report.add_row([plugin.__class__.__name__,
+                timing_report.add_row([name,
                                        0,
                                        0,
                                        'n/a',
-                                       round(t / 1000, 1)])
+                                       round(t / 1000, 1)] + percentiles)
 
         if total_time > 0:
             timing_report.add_row(['TOTAL',
                                    round(100., 1),
                                    round(total_time / events_actually_processed, 1),
                                    round(1000 * events_actually_processed / total_time, 1),
-                                   round(total_time / 1000, 1)])
+                                   round(total_time / 1000, 1),
+                                   '', '', '', ''])
         else:
             timing_report.add_row(['TOTAL',
                                    round(100., 1),
                                    0,
                                    'n/a',
-                                   round(total_time / 1000, 1)])
+                                   round(total_time / 1000, 1),
+                                   '', '', '', ''])
         self.log.info("Timing report:\n" + str(timing_report))
 
     def shutdown(self):
         """Call shutdown on all plugins"""
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+        if self.worker_id == 'master' and self.metrics is not None:
+            self.metrics.shutdown()
         self.log.debug("Shutting down all plugins...")
         if self.input_plugin is not None:
             self.log.debug("Shutting down %s..." % self.input_plugin.name)
@@ -640,3 +1588,12 @@ class Processor:
             self.log.debug("Shutting down %s..." % ap.name)
             ap.shutdown()
             ap.has_shut_down = True
+        if self.checkpoint is not None:
+            # The output plugins finished their last files
+            self.update_checkpoint()
+            if self.checkpoint.dirty:
+                self.checkpoint.write()
+        if self.multiprocessing:
+            self.transport.shutdown()
+        if self.is_output_worker:
+            self.reorder_buffer.shutdown()
@@ -3,6 +3,9 @@ Python skeleton for data structure
 Extends python object to do a few tricks
 """
 import json
+from collections import namedtuple
+from functools import partial
+
 import bson
 import six
 import numpy as np
@@ -10,6 +13,18 @@ import numpy as np
 from pax.utils import Memoize
 
 
+# Description of a field of a Model class, see Model.get_field_schema
+#   - kind: 'list' (ListField), 'model' (another Model), 'array' (numpy array) or 'value' (anything else)
+#   - default: the value in the class declaration
+#   - element_type: for list fields, the Model class of the elements
+#   - dtype: for numpy array fields, the dtype of the array
+FieldSchema = namedtuple('FieldSchema', ['name', 'kind', 'default', 'element_type', 'dtype'])
+
+# Whether Model.construct checks its arguments like the normal constructor does.
+# The processor turns this on with the validate_models option, or when logging at DEBUG level.
+validate_construct = False
+
+
 class Model(object):
     """Data modelling base class -- use for subclassing.
     Features:
@@ -23,6 +38,9 @@ class Model(object):
             (we'd have to mess with / override list for that)
       - recursive initializiation of subclasses
       - dump as dictionary and JSON
+      - construct(): fast initialization without type checks, for code which makes many objects
+    The fields of each class are found once, see get_field_schema.
+    A field keeps the kind (list, model, numpy array or other value) of its value in the class declaration.
     """
 
     def __init__(self, kwargs_dict=None, **kwargs):
@@ -34,56 +52,107 @@ class Model(object):
 
         # Initialize all attributes from kwargs and kwargs_dict
         kwargs.update(kwargs_dict or {})
+        fields = self.get_field_schema_by_name()
         for k, v in kwargs.items():
-            if k in list_field_info:
-                # User gave a value to initialize a list field. Hopefully an iterable!
-                # Let's check if the types are correct
-                desired_type = list_field_info[k]
-                temp_list = []
-                for el in v:
-                    if isinstance(el, desired_type):
-                        # Good, pass through unmolested
-                        temp_list.append(el)
-                    elif isinstance(el, dict):
-                        # Dicts are fine too, we can use them to init the desired type
-                        temp_list.append(desired_type(**el))
-                    else:
-                        raise ValueError("Attempt to initialize list field %s with type %s, "
-                                         "but you promised type %s in class declaration." % (k,
-                                                                                             type(el),
-                                                                                             desired_type))
-                # This has to be a list of dictionaries
-                # suitable to be passed to __init__ of the list field's element type
-                setattr(self, k, temp_list)
+            field = fields.get(k)
+            if field is None:
+                # Not a field declared in this class. Raises AttributeError unless a parent class declares it.
+                getattr(self, k)
+                setattr(self, k, v)
             else:
-                default_value = getattr(self, k)
-                if type(default_value) == np.ndarray:
-                    if isinstance(v, np.ndarray):
-                        pass
-                    elif isinstance(v, bytes):
-                        # Numpy arrays can be also initialized from a 'string' of bytes...
-                        v = np.fromstring(v, dtype=default_value.dtype)
-                    elif hasattr(v, '__iter__'):
-                        # ... or an iterable
-                        v = np.array(v, dtype=default_value.dtype)
-                    else:
-                        raise ValueError("Can't initialize field %s: "
-                                         "don't know how to make a numpy array from a %s" % (k, type(v)))
-                elif isinstance(default_value, Model):
-                    v = default_value.__class__(**v)
+                setattr(self, k, self.convert_field_value(field, v))
 
-                setattr(self, k, v)
+    @classmethod
+    def convert_field_value(cls, field, v):
+        """Return v (e.g. from a dict made by to_dict) converted to the kind of value field (a FieldSchema) holds:
+        lists of dicts become lists of Model objects, bytes and iterables become numpy arrays, dicts become Models.
+        """
+        k = field.name
+        if field.kind == 'list':
+            # User gave a value to initialize a list field. Hopefully an iterable!
+            # Let's check if the types are correct
+            desired_type = field.element_type
+            temp_list = []
+            for el in v:
+                if isinstance(el, desired_type):
+                    # Good, pass through unmolested
+                    temp_list.append(el)
+                elif isinstance(el, dict):
+                    # Dicts are fine too, we can use them to init the desired type
+                    temp_list.append(desired_type(**el))
+                else:
+                    raise ValueError("Attempt to initialize list field %s with type %s, "
+                                     "but you promised type %s in class declaration." % (k,
+                                                                                         type(el),
+                                                                                         desired_type))
+            # This has to be a list of dictionaries
+            # suitable to be passed to __init__ of the list field's element type
+            return temp_list
+        elif field.kind == 'array':
+            if isinstance(v, np.ndarray):
+                return v
+            elif isinstance(v, bytes):
+                # Numpy arrays can be also initialized from a 'string' of bytes...
+                return np.fromstring(v, dtype=field.dtype)
+            elif hasattr(v, '__iter__'):
+                # ... or an iterable
+                return np.array(v, dtype=field.dtype)
+            else:
+                raise ValueError("Can't initialize field %s: "
+                                 "don't know how to make a numpy array from a %s" % (k, type(v)))
+        elif field.kind == 'model':
+            return field.default.__class__(**v)
+        return v
+
+    @classmethod
+    def construct(cls, **kwargs):
+        """Make an instance with fields from kwargs, skipping the type checks and conversions of the normal constructor.
+        The class's own __init__ is not run either. Use this where many objects are made (e.g. peaks in a plugin),
+        passing only fields of this class with values of exactly the right type (e.g. int(x), not a numpy integer),
+        including anything __init__ would otherwise compute (e.g. Pulse.right).
+        If validate_construct is True (e.g. when debugging), this just calls the normal constructor.
+        """
+        if validate_construct:
+            return cls(**kwargs)
+        self = cls.__new__(cls)
+        self_dict = self.__dict__
+        for field_name in cls.get_list_field_info():
+            self_dict[field_name] = []
+        self_dict.update(kwargs)
+        return self
 
     @classmethod        # Use only in initialization (or if attributes are fixed, as for StrictModel)
     @Memoize            # Caching decorator, improves performance if a model is initialized often
+    def get_field_schema(cls):
+        """Return tuple of FieldSchema's of the user-specified fields of this class
+        (attributes in the class declaration which are not methods, properties or _internals), in lexical order
+        """
+        fields = []
+        for field_name, value in sorted(cls.__dict__.items()):
+            if field_name.startswith('_') or callable(value) or isinstance(value, (property, classmethod)):
+                continue
+            if isinstance(value, ListField):
+                fields.append(FieldSchema(field_name, 'list', value, value.element_type, None))
+            elif isinstance(value, Model):
+                fields.append(FieldSchema(field_name, 'model', value, None, None))
+            elif isinstance(value, np.ndarray):
+                fields.append(FieldSchema(field_name, 'array', value, None, value.dtype))
+            else:
+                fields.append(FieldSchema(field_name, 'value', value, None, None))
+        return tuple(fields)
+
+    @classmethod
+    @Memoize
+    def get_field_schema_by_name(cls):
+        """Return dict with fieldname => FieldSchema for the fields of this class"""
+        return {field.name: field for field in cls.get_field_schema()}
+
+    @classmethod
+    @Memoize
     def get_list_field_info(cls):
         """Return dict with fielname => type of elements in collection fields in this class
         """
-        list_field_info = {}
-        for k, v in cls.__dict__.items():
-            if isinstance(v, ListField):
-                list_field_info[k] = v.element_type
-        return list_field_info
+        return {field.name: field.element_type for field in cls.get_field_schema() if field.kind == 'list'}
 
     def __str__(self):
         return str(self.__dict__)
@@ -92,28 +161,17 @@ class Model(object):
         """Iterator over (key, value) tuples of all user-specified fields
         Returns keys in lexical order
         """
-        # TODO: increase performance by pre-sorting keys?
-        # self.__dict__.items() does not return default values set in class declaration
-        # Hence we need something more complicated
-
-        class_dict = self.__class__.__dict__
+        # self.__dict__ does not contain the default values set in class declaration
         self_dict = self.__dict__
+        for field in self.get_field_schema():
+            yield (field.name, self_dict.get(field.name, field.default))
 
-        for field_name in sorted(class_dict.keys()):
-            if field_name in self_dict:
-                # The instance has a value for this field: return it
-                yield (field_name, self_dict[field_name])
-            else:
-                # ... it doesnt. Should we return its value?
-                if field_name.startswith('_'):
-                    continue    # No, is internal
-                value_in_class = class_dict[field_name]
-                if callable(value_in_class):
-                    continue    # No, is a method
-                if isinstance(value_in_class, (property, classmethod)):
-                    continue    # No, is a property or classmethod
-                # Yes, yield the class-level value
-                yield (field_name, value_in_class)
+    def get_fields_with_schema(self):
+        """Iterator over (FieldSchema, value) tuples of all user-specified fields, in lexical order"""
+        # self.__dict__ does not contain the default values set in class declaration
+        self_dict = self.__dict__
+        for field in self.get_field_schema():
+            yield (field, self_dict.get(field.name, field.default))
 
     @classmethod
     def get_dtype(cls):
@@ -136,18 +194,19 @@ class Model(object):
         result = {}
         if fields_to_ignore is None:
             fields_to_ignore = tuple()
-        for k, v in self.get_fields_data():
+        for field, v in self.get_fields_with_schema():
+            k = field.name
             if k in fields_to_ignore:
                 continue
-            if isinstance(v, Model):
+            if field.kind == 'model':
                 result[k] = v.to_dict(convert_numpy_arrays_to=convert_numpy_arrays_to,
                                       fields_to_ignore=fields_to_ignore,
                                       nan_to_none=nan_to_none)
-            elif isinstance(v, list):
+            elif field.kind == 'list':
                 result[k] = [el.to_dict(convert_numpy_arrays_to=convert_numpy_arrays_to,
                                         fields_to_ignore=fields_to_ignore,
                                         nan_to_none=nan_to_none) for el in v]
-            elif isinstance(v, np.ndarray) and convert_numpy_arrays_to is not None:
+            elif field.kind == 'array' and convert_numpy_arrays_to is not None:
                 if convert_numpy_arrays_to == 'list':
                     result[k] = v.tolist()
                 elif convert_numpy_arrays_to == 'bytes':
@@ -171,18 +230,39 @@ class Model(object):
                                              nan_to_none=nan_to_none))
 
     @classmethod
-    def from_json(cls, x):
-        return cls(**json.loads(x))
+    def from_dict(cls, x, materialize_fields=None):
+        """Make an instance from dict x, e.g. made by to_dict.
+        If materialize_fields (list of field names) is given, only those of the list, array and model fields
+        are converted right away. The others are converted when they are first accessed, see make_lazy.
+        """
+        if materialize_fields is None:
+            return cls(**x)
+        fields = cls.get_field_schema_by_name()
+        now = {}
+        later = {}
+        for k, v in x.items():
+            field = fields.get(k)
+            if field is None or field.kind == 'value' or k in materialize_fields:
+                now[k] = v
+            else:
+                later[k] = partial(cls.convert_field_value, field, v)
+        self = cls(**now)
+        make_lazy(self, later)
+        return self
+
+    @classmethod
+    def from_json(cls, x, materialize_fields=None):
+        return cls.from_dict(json.loads(x), materialize_fields=materialize_fields)
 
     @classmethod
-    def from_bson(cls, x):
+    def from_bson(cls, x, materialize_fields=None):
         if six.PY2:
             # Hack for python 2: may work in py3 too, but it's definitely not the standard way!
             reader = bson.decode_file_iter(six.BytesIO(x))
             event_dict = next(reader)
         else:
             event_dict = bson.BSON.decode(x)
-        return cls(**event_dict)
+        return cls.from_dict(event_dict, materialize_fields=materialize_fields)
 
 
 casting_allowed_for = {
@@ -239,3 +319,102 @@ class StrictModel(Model):
                     key, self.__class__.__name__, old_val.dtype, value.dtype))
 
         Model.__setattr__(self, key, value)
+
+
+##
+# Lazy fields
+##
+
+def make_lazy(obj, decoders):
+    """Make fields of obj (a Model instance) be decoded only when they are first accessed.
+    decoders: dict field name => function that returns the field's value. Values of these fields already in obj
+    are discarded. Once all lazy fields are decoded (or set), obj is an ordinary instance of its class again.
+    Pickling obj, or getting all its fields (to_dict, get_fields_data, ...), decodes all lazy fields first.
+    """
+    if not decoders:
+        return
+    obj_dict = obj.__dict__
+    for field_name in decoders:
+        obj_dict.pop(field_name, None)
+    if '_lazy_fields' in obj_dict:
+        # obj already has lazy fields
+        obj_dict['_lazy_fields'].update(decoders)
+        return
+    obj_dict['_lazy_fields'] = dict(decoders)
+    # obj stays an instance of its own class as far as isinstance is concerned
+    object.__setattr__(obj, '__class__', lazy_class(obj.__class__))
+
+
+def materialize(obj):
+    """Decode all lazy fields of obj (see make_lazy). Does nothing if obj has none."""
+    lazy_fields = obj.__dict__.get('_lazy_fields')
+    if lazy_fields is None:
+        return
+    for field_name, decoder in list(lazy_fields.items()):
+        obj.__dict__[field_name] = decoder()
+    end_lazy(obj)
+
+
+def end_lazy(obj):
+    """Make obj, whose lazy fields have all been decoded, an ordinary instance of its class again"""
+    del obj.__dict__['_lazy_fields']
+    object.__setattr__(obj, '__class__', obj.__class__.__bases__[0])
+
+
+class LazyField(object):
+    """Descriptor for a field of instances of lazy_class(cls): decodes the field when it is first accessed"""
+
+    def __init__(self, name, default):
+        self.name = name
+        self.default = default
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self.default
+        obj_dict = obj.__dict__
+        if self.name in obj_dict:
+            return obj_dict[self.name]
+        lazy_fields = obj_dict['_lazy_fields']
+        if self.name not in lazy_fields:
+            return self.default
+        value = obj_dict[self.name] = lazy_fields.pop(self.name)()
+        if not lazy_fields:
+            end_lazy(obj)
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
+
+
+@Memoize
+def lazy_class(cls):
+    """Return the class of instances of Model class cls with lazy fields, see make_lazy.
+    It is a subclass of cls (with the same name) with a LazyField for each field.
+    """
+    namespace = {field.name: LazyField(field.name, field.default) for field in cls.get_field_schema()}
+    # The fields are those of cls, not the LazyFields
+    for method_name in ('get_field_schema', 'get_field_schema_by_name', 'get_list_field_info'):
+        namespace[method_name] = staticmethod(getattr(cls, method_name))
+
+    def __setattr__(self, key, value):
+        lazy_fields = self.__dict__['_lazy_fields']
+        if key in lazy_fields:
+            # No need to decode the old value. Replace it by the default, so StrictModel can check the type.
+            del lazy_fields[key]
+            self.__dict__[key] = [] if key in cls.get_list_field_info() else getattr(cls, key)
+            if not lazy_fields:
+                end_lazy(self)
+        cls.__setattr__(self, key, value)
+
+    def needs_all_fields(method_name):
+        def method(self, *args, **kwargs):
+            materialize(self)
+            return getattr(self, method_name)(*args, **kwargs)
+        method.__name__ = method_name
+        return method
+
+    namespace['__setattr__'] = __setattr__
+    namespace['__module__'] = cls.__module__
+    for method_name in ('get_fields_data', 'get_fields_with_schema', '__reduce_ex__'):
+        namespace[method_name] = needs_all_fields(method_name)
+    return type(cls.__name__, (cls,), namespace)
@@ -647,6 +647,20 @@ class Event(StrictModel):
         self.lone_hits_per_channel_before = np.zeros(n_channels, dtype=np.int16)
         self.lone_hits_per_channel = np.zeros(n_channels, dtype=np.int16)
 
+    def __getstate__(self):
+        # Pickle the pulses as a PulseArray: one buffer with the raw data of all pulses is much faster
+        # to (un)pickle than a numpy array for each pulse. See pulse_array.py.
+        state = self.__dict__.copy()
+        if state.get('pulses'):
+            from pax.pulse_array import PulseArray     # pulse_array imports this module, so import it here
+            state['pulses'] = PulseArray.from_pulses(state['pulses'])
+        return state
+
+    def __setstate__(self, state):
+        if not isinstance(state.get('pulses', []), list):
+            state['pulses'] = state['pulses'].to_pulses()
+        self.__dict__.update(state)
+
     @classmethod
     def empty_event(cls):
         """Returns an empty example event: for testing purposes only!!
@@ -6,7 +6,7 @@ from pax.datastructure import Hit
 
 
 @numba.jit(numba.int64[:](numba.from_dtype(Hit.get_dtype())[:]),
-           nopython=True)
+           nopython=True, cache=True)
 def gaps_between_hits(hits):
     """Return array of gaps between hits: a hit's 'gap' is the # of samples before that hit free of other hits.
     The gap of the first hit is 0 by definition.
@@ -121,7 +121,7 @@ def cluster_by_diff(x, diff_threshold, return_indices=False):
 
 
 @numba.jit(numba.int32(numba.float64[:], numba.float64, numba.float64, numba.int64[:, :], numba.float64),
-           nopython=True)
+           nopython=True, cache=True)
 def find_intervals_above_threshold(w, high_threshold, low_threshold, result_buffer, dynamic_low_threshold_coeff):
     """Fills result_buffer with l, r bounds of intervals in w > low_threshold which exceed high_threshold somewhere
         result_buffer: numpy N*2 array of ints, will be filled by function.
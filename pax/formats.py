@@ -17,15 +17,8 @@ import numpy as np
 
 base_logger = logging.getLogger('TableWriter')
 
-try:
-    import pandas
-except ImportError:
-    base_logger.warning("You don't have pandas -- if you use any of the pandas formats, pax will crash!")
-
-try:
-    import h5py
-except ImportError:
-    base_logger.warning("You don't have h5py -- if you use the hdf5 format, pax will crash!")
+# pandas and h5py take a while to import, so we only import them when a format that needs them is used.
+# If you don't have them, pax will crash when you use those formats.
 
 
 class TableFormat(object):
@@ -101,6 +94,7 @@ class HDF5Dump(TableFormat):
     supports_read_back = True
 
     def open(self, name, mode):
+        import h5py
         self.f = h5py.File(name, mode)
 
     def close(self):
@@ -302,6 +296,7 @@ class PandasFormat(TableFormat):
         self.filename = name
 
     def write_data(self, data):
+        import pandas
         for name, records in data.items():
             # Write pandas dataframe to container
             df_series_dict = {}
@@ -344,6 +339,7 @@ class PandasHDF5(PandasFormat):
     file_extension = 'hdf5'
 
     def open(self, name, mode):
+        import pandas
         self.store = pandas.HDFStore(name, complevel=9, complib='blosc')
 
     def close(self):
@@ -0,0 +1,83 @@
+"""Per-plugin memory accounting, to size the multiprocessing queues and find plugins which leak memory
+
+With memory_profile_interval = N in the pax config, the processor measures the memory used by each plugin call
+on every N-th event:
+  - RSS growth: how much the resident memory of the process grew during the call.
+    Some growth on the first calls is normal (caches, numba compilation...); a plugin which keeps growing
+    the RSS call after call probably leaks.
+  - retained: bytes allocated during the call (by python objects or numpy arrays) and not freed when it returned.
+    Usually this is data the plugin added to the event, which is freed once the event is written.
+  - peak: the most bytes the call had allocated at any time.
+The last two use tracemalloc, so they are only available on python 3, and only if tracemalloc isn't already running.
+"""
+import os
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class MemoryProfile:
+    """Sums of the memory measurements of the sampled calls of one plugin (in bytes).
+    Profiles from different processes can be merged.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.rss_growth = 0
+        self.later_rss_growth = 0       # RSS growth, except during the first sampled call in each process
+        self.retained = 0
+        self.peak = 0
+
+    def add(self, rss_growth, retained, peak):
+        if self.n:
+            self.later_rss_growth += rss_growth
+        self.n += 1
+        self.rss_growth += rss_growth
+        self.retained += retained
+        self.peak = max(self.peak, peak)
+
+    def merge(self, other):
+        self.n += other.n
+        self.rss_growth += other.rss_growth
+        self.later_rss_growth += other.later_rss_growth
+        self.retained += other.retained
+        self.peak = max(self.peak, other.peak)
+
+    def summary(self):
+        """Return dict with the number of samples, RSS growth (total and after the first sample), mean retained bytes
+        per call and peak allocation (all in bytes)"""
+        return dict(n=self.n,
+                    rss_growth=self.rss_growth,
+                    later_rss_growth=self.later_rss_growth,
+                    mean_retained=self.retained / float(self.n) if self.n else 0,
+                    peak=self.peak)
+
+
+class MemorySampler:
+    """Measures the memory used between start() and stop() in this process"""
+
+    def __init__(self):
+        import psutil   # Only import when memory profiling is on
+        self.process = psutil.Process(os.getpid())
+        # Don't mess with tracemalloc if someone else is using it
+        self.use_tracemalloc = tracemalloc is not None and not tracemalloc.is_tracing()
+        self.rss_before = 0
+
+    def start(self):
+        if self.use_tracemalloc:
+            if tracemalloc.is_tracing():
+                # The last call we sampled crashed before we could stop
+                tracemalloc.stop()
+            tracemalloc.start()
+        self.rss_before = self.process.memory_info().rss
+
+    def stop(self):
+        """Return (RSS growth, retained bytes, peak allocated bytes) since start()"""
+        rss_growth = self.process.memory_info().rss - self.rss_before
+        retained, peak = 0, 0
+        if self.use_tracemalloc:
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return rss_growth, retained, peak
@@ -0,0 +1,100 @@
+"""Live metrics of a multiprocessing pax run, in the Prometheus text format
+
+With metrics_file and/or metrics_port in the pax config, the master collects every metrics_interval seconds:
+  - pax_events_read_total, pax_events_processed_total{worker}, pax_events_per_second (written to the output)
+  - pax_queue_blocks{queue}: number of event blocks waiting on each queue
+  - pax_rss_bytes{worker}: resident memory of the master and each local worker
+  - pax_plugin_seconds_total{worker, plugin}: time spent in each plugin
+  - pax_failed_events_total{worker}, pax_quarantined_events_total, pax_worker_crashes_total and pax_status{status}
+The metrics file is rewritten atomically, so you can point e.g. the node exporter's textfile collector at it.
+The HTTP endpoint (http://127.0.0.1:<metrics_port>/metrics) only listens on localhost.
+"""
+import logging
+import os
+import threading
+
+from six.moves import BaseHTTPServer
+
+log = logging.getLogger('pax_metrics')
+
+
+def process_rss(pid):
+    """Return the resident memory (in bytes) of the process with PID pid, or 0 if it does not exist (anymore)"""
+    import psutil   # Only the master needs this, so don't import it at startup
+    try:
+        return psutil.Process(pid).memory_info().rss
+    except psutil.NoSuchProcess:
+        return 0
+
+
+def format_metrics(metrics):
+    """Return metrics in the Prometheus text format.
+    metrics: list of (name, type, help, samples), where samples is a list of (labels dict, value)
+    """
+    lines = []
+    for name, metric_type, help_text, samples in metrics:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels, value in samples:
+            if labels:
+                label_str = '{%s}' % ','.join(['%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                               for k, v in sorted(labels.items())])
+            else:
+                label_str = ''
+            lines.append('%s%s %s' % (name, label_str, repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter(object):
+    """Publishes the metrics text in filename (if not None) and on an HTTP server on localhost:port (if not None).
+    Use port 0 to let the OS pick a free port; self.port tells you which.
+    """
+
+    def __init__(self, filename=None, port=None):
+        self.filename = filename
+        self.text = ''
+        self.server = None
+        self.port = None
+        if port is not None:
+            exporter = self
+
+            class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = exporter.text.encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    # Don't clutter the output with a line for every scrape
+                    pass
+
+            self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', int(port)), Handler)
+            self.port = self.server.server_address[1]
+            self.thread = threading.Thread(target=self.server.serve_forever, name='pax_metrics')
+            self.thread.daemon = True
+            self.thread.start()
+            log.info("Serving live metrics on http://127.0.0.1:%d/metrics" % self.port)
+
+    def update(self, metrics):
+        """Publish metrics (see format_metrics)"""
+        self.text = format_metrics(metrics)
+        if self.filename is not None:
+            # Write to a temporary file first, so whoever reads the file never sees half of it
+            temp_filename = self.filename + '.temp'
+            with open(temp_filename, mode='w') as outfile:
+                outfile.write(self.text)
+            os.rename(temp_filename, self.filename)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
@@ -0,0 +1,89 @@
+"""Ahead-of-time compilation of pax's numba functions
+
+All numba-jitted functions in pax use cache=True, so numba stores the compiled machine code in __pycache__
+(or in NUMBA_CACHE_DIR, if the pax directory is not writable) and later processes load it instead of compiling again.
+Run precompile() (or paxer --warmup) once after installing pax to fill this cache, rather than having the first
+processing run pay for the compilation.
+"""
+import importlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+log = logging.getLogger('pax_numba_cache')
+
+# Modules with numba functions with an explicit signature: these are compiled (or loaded from the cache)
+# when the module is imported.
+EAGER_MODULES = ('pax.dsputils',
+                 'pax.plugins.signal_processing.HitFinder',
+                 'pax.plugins.signal_processing.SumWaveform',
+                 'pax.plugins.peak_processing.NaturalBreaksClustering')
+
+
+def precompile():
+    """Compile all numba functions in pax, storing the results in numba's on-disk cache"""
+    for module_name in EAGER_MODULES:
+        log.info("Compiling numba functions in %s" % module_name)
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            # Don't let one module which doesn't compile (e.g. with a newer numba) stop us from warming up the rest
+            log.warning("Could not compile the numba functions in %s: %s" % (module_name, e))
+
+    # The others are compiled when they are first called, for the types they are called with.
+    # Call them on a bit of fake data, with the same types pax uses.
+    for description, function in (('hitfinder', precompile_hitfinder),
+                                  ('trigger', precompile_trigger)):
+        log.info("Compiling %s functions" % description)
+        try:
+            function()
+        except Exception as e:
+            log.warning("Could not compile the %s functions: %s" % (description, e))
+
+
+def precompile_hitfinder():
+    """Run the hitfinder functions on some fake data, so they get compiled"""
+    from pax.plugins.signal_processing import Sum_n_HitFinder
+    w = np.zeros(100, dtype=np.float64)
+    w[50:55] = 10
+    hits_buffer = -1 * np.ones((10, 2), dtype=np.int64)
+    Sum_n_HitFinder.compute_pulse_properties(w, 40)
+    n_hits = Sum_n_HitFinder.find_intervals_above_threshold(w, 5.0, 1.0, hits_buffer, dynamic_low_threshold_coeff=0.01)
+    Sum_n_HitFinder.compute_hit_properties(w, hits_buffer[:n_hits],
+                                           np.zeros(10, dtype=np.int64),
+                                           np.zeros(10, dtype=np.float64),
+                                           np.zeros(10, dtype=np.float64))
+
+
+def precompile_trigger():
+    """Run the trigger on some fake data, so all the trigger plugins' numba functions get compiled"""
+    from pax import trigger, configuration, units
+    config = configuration.load_configuration('XENON1T')
+    tempdir = tempfile.mkdtemp()
+    try:
+        config['Trigger']['trigger_data_filename'] = os.path.join(tempdir, 'trigger_data.hdf5')
+        config['Trigger'].pop('trigger_monitor_file_path', None)
+        # Trigger on every signal, so the event building functions get compiled too
+        config['Trigger.DecideTriggers']['trigger_probability'] = {0: {2: 1}, 1: {2: 1}, 2: {2: 1}}
+        trig = trigger.Trigger(config)
+        digitizer = config['DEFAULT']['pmts'][0]['digitizer']
+
+        # An S1-like and an S2-like signal. Times are in ns, as the MongoDB input plugin passes them.
+        times = np.concatenate([np.array([0, 1]),
+                                np.arange(int(1 * units.ms), int(1 * units.ms + 1 * units.us), int(0.1 * units.us))])
+        times = times.astype(np.int64)
+        for batch_i, last_data in enumerate((False, True)):
+            batch_times = times + batch_i * int(10 * units.ms)
+            for _ in trig.run(last_time_searched=batch_times[-1] + int(1 * units.ms),
+                              start_times=batch_times,
+                              channels=digitizer['channel'] * np.ones(len(times), dtype=np.int32),
+                              modules=digitizer['module'] * np.ones(len(times), dtype=np.int32),
+                              areas=np.ones(len(times), dtype=np.float64),
+                              last_data=last_data):
+                pass
+        trig.shutdown()
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
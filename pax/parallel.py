@@ -0,0 +1,213 @@
+"""Helpers for running pax on several cores. The Processor class in core.py uses these.
+"""
+import heapq
+import logging
+from multiprocessing.managers import SyncManager, DictProxy
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from pax.data_model import Model
+
+log = logging.getLogger('pax_parallel')
+
+# Put on a queue instead of a (block_id, payload) tuple to tell the worker(s) reading from it to stop
+STOP = 'stop'
+
+
+def approximate_nbytes(x):
+    """Rough estimate of the memory used by x, counting only the big stuff: numpy arrays and bytes.
+    Recurses into pax data models, lists, tuples and dicts.
+    """
+    if isinstance(x, np.ndarray):
+        return x.nbytes
+    if isinstance(x, (bytes, bytearray)):
+        return len(x)
+    if isinstance(x, Model):
+        return sum([approximate_nbytes(v) for _, v in x.get_fields_data()])
+    if isinstance(x, (list, tuple)):
+        return sum([approximate_nbytes(v) for v in x])
+    if isinstance(x, dict):
+        return sum([approximate_nbytes(v) for v in x.values()])
+    return 0
+
+
+def add_to_ranges(ranges, number):
+    """Add number to ranges, a list of [first, last] ranges of numbers, extending the last range if possible."""
+    if number is None:
+        return
+    if len(ranges) and ranges[-1][1] + 1 == number:
+        ranges[-1][1] = number
+    else:
+        ranges.append([number, number])
+
+
+class ReorderBuffer(object):
+    """Puts event blocks coming out of the processing workers back in order, for the output worker.
+
+    Blocks are pushed as (block_id, payload) tuples straight from the queue, and popped in order of block_id.
+    We keep track of the (approximate) size of the blocks we hold. If this exceeds max_bytes and spill_dir is set,
+    the blocks furthest in the future are moved to temporary files in spill_dir until we're below max_bytes again.
+
+    With several output workers, each gets only the block ids first_block_id, first_block_id + block_id_step, ...
+    """
+
+    def __init__(self, transport, max_bytes=None, spill_dir=None, first_block_id=0, block_id_step=1):
+        self.transport = transport
+        self.max_bytes = max_bytes
+        self.heap = []
+        self.nbytes = 0
+        self.next_block_id = first_block_id
+        self.block_id_step = block_id_step
+        self.spill_dir = None
+        if spill_dir is not None:
+            if not os.path.exists(spill_dir):
+                os.makedirs(spill_dir)
+            self.spill_dir = tempfile.mkdtemp(prefix='pax_reorder_', dir=spill_dir)
+        # block_id -> (path of file with the pickled event block, payload size before spilling)
+        self.spilled = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    @property
+    def full(self):
+        """Are we holding more than max_bytes in memory?"""
+        return self.max_bytes is not None and self.nbytes >= self.max_bytes
+
+    def push(self, block_id, payload):
+        nbytes = self.transport.nbytes(payload)
+        heapq.heappush(self.heap, (block_id, payload, nbytes))
+        self.nbytes += nbytes
+        log.debug("Reorder buffer got block %d, now has %d blocks (%d bytes in memory). "
+                  "Looking for block %d." % (block_id, len(self.heap), self.nbytes, self.next_block_id))
+        if self.spill_dir is not None:
+            while self.full:
+                if not self.spill_one():
+                    break
+
+    def next_block_available(self):
+        return len(self.heap) and self.heap[0][0] == self.next_block_id
+
+    def pop(self):
+        """Return (block_id, event_block, payload) of the next block in order.
+        payload is None if the block was spilled to disk, otherwise you must release it with the transport
+        once you're done with the event block.
+        """
+        block_id, payload, nbytes = heapq.heappop(self.heap)
+        assert block_id == self.next_block_id
+        self.next_block_id += self.block_id_step
+        if payload is None:
+            path, _ = self.spilled.pop(block_id)
+            with open(path, mode='rb') as infile:
+                event_block = pickle.load(infile)
+            os.remove(path)
+        else:
+            self.nbytes -= nbytes
+            event_block = self.transport.unpack(payload)
+        return block_id, event_block, payload
+
+    def spill_one(self):
+        """Move the in-memory block furthest in the future to disk. Returns False if there was nothing to spill.
+        We never spill the block we're waiting for.
+        """
+        candidates = [(block_id, i) for i, (block_id, payload, _) in enumerate(self.heap)
+                      if payload is not None and block_id != self.next_block_id]
+        if not len(candidates):
+            return False
+        block_id, i = max(candidates)
+        _, payload, nbytes = self.heap[i]
+        path = os.path.join(self.spill_dir, '%d.pickle' % block_id)
+        with open(path, mode='wb') as outfile:
+            pickle.dump(self.transport.unpack(payload), outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.transport.release(payload)
+        self.spilled[block_id] = (path, nbytes)
+        self.heap[i] = (block_id, None, 0)
+        self.nbytes -= nbytes
+        log.debug("Spilled block %d to disk" % block_id)
+        return True
+
+    def shutdown(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class BlockSizer(object):
+    """Decides when the master should close the event block it is filling.
+
+    By default blocks have a fixed number of events (event_block_size). If target_block_seconds is set,
+    the number of events per block is tuned so a block takes about that long to process, using the processing time
+    per event the workers report in block_stats. If target_block_bytes is set, blocks are closed once they hold
+    (approximately) that many bytes. The number of events per block always stays between
+    min_event_block_size and max_event_block_size.
+    """
+
+    def __init__(self, config, block_stats=None):
+        self.target_seconds = config.get('target_block_seconds', None)
+        self.target_bytes = config.get('target_block_bytes', None)
+        self.min_size = max(config.get('min_event_block_size', 1), 1)
+        self.max_size = config.get('max_event_block_size', 1000)
+        self.block_stats = block_stats
+        if self.target_bytes is not None and self.target_seconds is None:
+            self.block_size = self.max_size
+        else:
+            self.block_size = config.get('event_block_size', 10)
+        self.n_events = 0
+        self.nbytes = 0
+
+    @property
+    def adaptive(self):
+        return self.target_seconds is not None or self.target_bytes is not None
+
+    def add(self, event):
+        """Note event was added to the current block. Returns True if the block should now be closed."""
+        self.n_events += 1
+        if self.target_bytes is not None:
+            self.nbytes += approximate_nbytes(event)
+        if not (self.n_events >= self.block_size or
+                (self.target_bytes is not None and self.nbytes >= self.target_bytes)):
+            return False
+        self.n_events = 0
+        self.nbytes = 0
+        self.update_block_size()
+        return True
+
+    def update_block_size(self):
+        if self.target_seconds is None or self.block_stats is None:
+            return
+        seconds_per_event = list(self.block_stats.values())
+        if not len(seconds_per_event):
+            return
+        seconds_per_event = max(sum(seconds_per_event) / len(seconds_per_event), 1e-9)
+        block_size = int(round(self.target_seconds / seconds_per_event))
+        block_size = min(max(block_size, self.min_size), self.max_size)
+        if block_size != self.block_size:
+            log.debug("Changing event block size from %d to %d" % (self.block_size, block_size))
+            self.block_size = block_size
+
+
+# Configurations for remote workers, only filled in the broker's server process. See BrokerManager.
+_broker_info = {}
+
+
+def _get_broker_info():
+    return _broker_info
+
+
+class BrokerManager(SyncManager):
+    """Multiprocessing manager which can serve pax's queues and other shared objects over TCP.
+    Remote workers connect to it and get their configuration (including the shared objects) from get_broker_info().
+    """
+    pass
+
+
+BrokerManager.register('get_broker_info', callable=_get_broker_info, proxytype=DictProxy)
+
+
+def parse_address(address):
+    """Convert 'host:port' to a (host, port) tuple"""
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
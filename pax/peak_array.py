@@ -0,0 +1,186 @@
+"""Columnar storage of peaks: one numpy array per field, rather than one Peak object per peak
+
+Event.peaks is a list of Peak objects, each with its own small arrays. Code which works on all peaks of an event at
+once (e.g. to classify them) can instead use a PeakArray, which holds:
+  - data: structured numpy array with the scalar fields (area, type, left, ...), one row per peak
+  - matrices: the array fields which have the same length for every peak (e.g. area_per_channel, range_area_decile),
+    each as a contiguous 2d array with one row per peak
+  - objects: the other fields (e.g. hits, reconstructed_positions), as a list with the value of each peak
+peak_array[i] gives a PeakView: it looks like a Peak, but reads and writes the arrays.
+
+Use PeakArray.from_peaks to get a PeakArray for Event.peaks, and update_peaks or to_peaks to go back.
+"""
+import numpy as np
+
+from pax.datastructure import Peak
+
+# Numpy type of the scalar fields, by the type of their default value.
+# Strings are stored as python objects, so we don't have to fix a maximum length.
+scalar_types = {'int': np.int64,
+                'long': np.int64,
+                'float': np.float64,
+                'bool': np.bool_,
+                'str': object,
+                'unicode': object}
+
+
+class PeakArray(object):
+
+    def __init__(self, data, matrices=None, objects=None):
+        self.data = data
+        self.matrices = matrices or {}
+        self.objects = objects or {}
+
+    @classmethod
+    def from_columns(cls, **columns):
+        """Return a PeakArray with the given fields. Pass the values of all peaks for each field:
+        a 1d array for scalar fields, a 2d array (one row per peak) for array fields, a list for the others.
+        """
+        schema = Peak.get_field_schema_by_name()
+        dtype = []
+        scalar_columns = []
+        matrices = {}
+        objects = {}
+        n_peaks = None
+        for field_name, values in sorted(columns.items()):
+            field = schema.get(field_name)
+            if field is None:
+                raise ValueError("Peaks don't have a field %s" % field_name)
+            if n_peaks is None:
+                n_peaks = len(values)
+            elif len(values) != n_peaks:
+                raise ValueError("Field %s has %d values instead of %d" % (field_name, len(values), n_peaks))
+            if field.kind == 'value' and type(field.default).__name__ in scalar_types:
+                dtype.append((field_name, scalar_types[type(field.default).__name__]))
+                scalar_columns.append(values)
+            elif field.kind == 'array' and isinstance(values, np.ndarray) and values.ndim == 2:
+                matrices[field_name] = values.astype(field.dtype, copy=False)
+            else:
+                objects[field_name] = list(values)
+
+        data = np.zeros(n_peaks or 0, dtype=dtype)
+        for (field_name, _), values in zip(dtype, scalar_columns):
+            data[field_name] = values
+        return cls(data, matrices, objects)
+
+    @classmethod
+    def from_peaks(cls, peaks, fields=None):
+        """Return a PeakArray with the fields (list of names, default all) of peaks (a list of Peak objects).
+        Array fields with the same length for all peaks become matrices.
+        """
+        schema = Peak.get_field_schema()
+        if fields is not None:
+            unknown_fields = set(fields) - set([field.name for field in schema])
+            if unknown_fields:
+                raise ValueError("Peaks don't have field(s) %s" % ', '.join(sorted(unknown_fields)))
+            schema = [field for field in schema if field.name in fields]
+
+        columns = {}
+        for field in schema:
+            column = [getattr(peak, field.name) for peak in peaks]
+            if field.kind == 'array' and field.dtype.names is None and len(set([len(x) for x in column])) <= 1:
+                if column:
+                    column = np.array(column, dtype=field.dtype)
+                else:
+                    column = np.zeros((0, len(field.default)), dtype=field.dtype)
+            columns[field.name] = column
+        return cls.from_columns(**columns)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("Peak %d does not exist, there are only %d peaks" % (index, len(self)))
+        return PeakView(self, index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield PeakView(self, index)
+
+    def field_names(self):
+        return list(self.data.dtype.names or []) + list(self.matrices.keys()) + list(self.objects.keys())
+
+    def column(self, field_name):
+        """Return the values of field_name of all peaks: a 1d array for scalar fields, a 2d array for matrices,
+        a list for the others"""
+        if field_name in self.matrices:
+            return self.matrices[field_name]
+        if field_name in self.objects:
+            return self.objects[field_name]
+        return self.data[field_name]
+
+    def get_fields(self, index):
+        """Return dict with the fields of peak index (python types for scalar fields, copies of matrix rows for
+        array fields)"""
+        result = dict(zip(self.data.dtype.names or [], self.data[index].tolist()))
+        for field_name, matrix in self.matrices.items():
+            result[field_name] = matrix[index].copy()
+        for field_name, values in self.objects.items():
+            result[field_name] = values[index]
+        return result
+
+    def to_peaks(self):
+        """Return a list of new Peak objects with the fields in this PeakArray (others get their default value).
+        Their array fields are copies of the rows of our matrices.
+        """
+        return [Peak.construct(**self.get_fields(index)) for index in range(len(self))]
+
+    def update_peaks(self, peaks, fields=None):
+        """Set the fields (list of names, default all) of peaks (a list of Peak objects, e.g. the list we were made
+        from) to our values. Array fields of the peaks become copies of the rows of our matrices: views would keep
+        the whole matrix alive as long as any of the peaks, and changing one peak's array would change our matrix.
+        """
+        if len(peaks) != len(self):
+            raise ValueError("Can't update %d peaks from a PeakArray of %d peaks" % (len(peaks), len(self)))
+        if fields is None:
+            fields = self.field_names()
+        for field_name in fields:
+            column = self.column(field_name)
+            if field_name in self.matrices:
+                column = [row.copy() for row in column]
+            elif field_name not in self.objects:
+                # Convert to python types, which is what Peak expects
+                column = column.tolist()
+            for peak, value in zip(peaks, column):
+                setattr(peak, field_name, value)
+
+
+class PeakView(object):
+    """Peak index of a PeakArray. Has the fields and properties of a Peak: reading and setting fields reads and
+    sets the PeakArray's arrays. Scalar fields are returned as numpy scalars.
+    """
+    __slots__ = ('peak_array', 'index')
+
+    def __init__(self, peak_array, index):
+        object.__setattr__(self, 'peak_array', peak_array)
+        object.__setattr__(self, 'index', index)
+
+    def __getattr__(self, name):
+        # Only called for names which aren't in __slots__
+        peak_array = self.peak_array
+        if name in peak_array.matrices:
+            return peak_array.matrices[name][self.index]
+        if name in peak_array.objects:
+            return peak_array.objects[name][self.index]
+        if name in (peak_array.data.dtype.names or []):
+            return peak_array.data[name][self.index]
+        attr = getattr(Peak, name)
+        if isinstance(attr, property):
+            return attr.fget(self)
+        raise AttributeError("Field %s is not in this PeakArray" % name)
+
+    def __setattr__(self, name, value):
+        peak_array = self.peak_array
+        if name in peak_array.matrices:
+            peak_array.matrices[name][self.index] = value
+        elif name in peak_array.objects:
+            peak_array.objects[name][self.index] = value
+        elif name in (peak_array.data.dtype.names or []):
+            peak_array.data[name][self.index] = value
+        else:
+            raise AttributeError("Field %s is not in this PeakArray" % name)
+
+    def to_peak(self):
+        """Return a new Peak object with the fields of this peak"""
+        return Peak.construct(**self.peak_array.get_fields(self.index))
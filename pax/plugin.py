@@ -12,8 +12,17 @@ import os
 from time import strftime
 
 import numpy as np
+import six
 import pax    # for version
 from pax.datastructure import Event, ReconstructedPosition
+from pax.utils import LatencyHistogram
+from pax.memory_profile import MemoryProfile
+
+
+def overrides(plugin, base_class, method_name):
+    """Return whether the plugin's class overrides the method method_name of base_class"""
+    return (six.get_unbound_function(getattr(type(plugin), method_name)) is not
+            six.get_unbound_function(getattr(base_class, method_name)))
 
 
 class BasePlugin(object):
@@ -26,6 +35,8 @@ class BasePlugin(object):
         self.processor = processor
         self.log = logging.getLogger(self.name)
         self.total_time_taken = 0   # Total time in msec spent in this plugin
+        self.latency = LatencyHistogram()   # Distribution of time spent per event
+        self.memory = MemoryProfile()       # Memory used on sampled events, see memory_profile.py
         self.config = config_values
         self._pre_startup()
         y = self.startup()
@@ -77,13 +88,16 @@ class ProcessPlugin(BasePlugin):
     def _pre_startup(self):
         # Give the logger another name, we need self.log for the adapter
         self._log = self.log
+        # The logging adapter which will prepend [Event: ...] to the logging messages.
+        # We reuse it for every event, only changing the event number.
+        self._event_log = EventLoggingAdapter(self._log, dict(event_number=None))
 
     def process_event(self, event=None):
         if self.do_input_check:
             if not isinstance(event, Event):
                 raise RuntimeError("%s received a %s instead of an Event" % (self.name, type(event)))
-        # Setup the logging adapter which will prepend [Event: ...] to the logging messages
-        self.log = EventLoggingAdapter(self._log, dict(event_number=event.event_number))
+        self._event_log.extra['event_number'] = event.event_number
+        self.log = self._event_log
         if self.has_shut_down:
             raise RuntimeError("%s was asked to process an event, but it has already shut down!" % self.name)
 
@@ -96,20 +110,84 @@ class ProcessPlugin(BasePlugin):
     def _process_event(self, event):
         raise NotImplementedError
 
+    @property
+    def processes_blocks(self):
+        """Whether the plugin can process a list of events at once, see process_events"""
+        return False
+
+    def process_events(self, events):
+        """Process a list of events (an event block) at once. Returns the list of processed events.
+        Only call this if processes_blocks is True; the processor does so for the event blocks of its workers.
+        """
+        if not len(events):
+            return events
+        if self.do_input_check:
+            for event in events:
+                if not isinstance(event, Event):
+                    raise RuntimeError("%s received a %s instead of an Event" % (self.name, type(event)))
+        self._event_log.extra['event_number'] = '%s-%s' % (events[0].event_number, events[-1].event_number)
+        self.log = self._event_log
+        if self.has_shut_down:
+            raise RuntimeError("%s was asked to process events, but it has already shut down!" % self.name)
+
+        result = self._process_events(events)
+        if len(result) != len(events):
+            raise RuntimeError("%s returned %d events instead of %d." % (self.name, len(result), len(events)))
+        if self.do_output_check:
+            for event in result:
+                if not isinstance(event, Event):
+                    raise RuntimeError("%s returned a %s instead of an event." % (self.name, type(event)))
+        return result
+
+    def _process_events(self, events):
+        raise NotImplementedError
+
 
 class TransformPlugin(ProcessPlugin):
 
+    def _pre_startup(self):
+        # Find out once which methods the plugin defines, rather than for every event
+        self._transforms_single_events = overrides(self, TransformPlugin, 'transform_event')
+        self._transforms_blocks = overrides(self, TransformPlugin, 'transform_events')
+        ProcessPlugin._pre_startup(self)
+
     def transform_event(self, event):
         """Do your magic. Return event"""
         raise NotImplementedError
 
+    def transform_events(self, events):
+        """Do your magic on a list of events at once. Return the list of events.
+        Define this if your plugin can vectorize its work over many events (e.g. all S2s in an event block).
+        In a standalone processor there are no event blocks: define transform_event as well, or rely on getting
+        lists of one event.
+        """
+        raise NotImplementedError
+
+    @property
+    def processes_blocks(self):
+        return self._transforms_blocks
+
     def _process_event(self, event):
+        if not self._transforms_single_events:
+            # The plugin only knows how to transform lists of events
+            return self.transform_events([event])[0]
         return self.transform_event(event)
 
+    def _process_events(self, events):
+        return self.transform_events(events)
+
 
 class OutputPlugin(ProcessPlugin):
+    # Set this to True if the plugin writes events to files which are only finished now and then,
+    # and keep finalized_through (event number of the last event in a finished file) and finalized_files
+    # (names of the finished files) up to date. The checkpoint journal (see checkpoint.py) then only counts
+    # events in finished files as done, and resuming adds to these files. Checkpoints and resuming are refused
+    # for output plugins which don't do this.
+    finalizes_files = False
+    finalized_through = None
 
     def _pre_startup(self):
+        self.finalized_files = []
         # If no output name specified, create a default one.
         # We need to do this here, rather than in paxer, otherwise user couldn't specify output_name in config
         # (paxer would override it)
@@ -2,9 +2,16 @@ from pax import plugin, datastructure
 
 
 class DummyInput(plugin.InputPlugin):
+    """Yields n_events (default 1) empty events"""
+
+    def startup(self):
+        self.number_of_events = self.config.get('n_events', 1)
 
     def get_events(self):
-        yield datastructure.Event.empty_event()
+        for i in range(self.number_of_events):
+            event = datastructure.Event.empty_event()
+            event.event_number = i
+            yield event
 
 
 class DummyOutput(plugin.OutputPlugin):
@@ -15,7 +22,10 @@ class DummyOutput(plugin.OutputPlugin):
 
 
 class DummyTransform(plugin.TransformPlugin):
-    pass
+    """Does nothing, useful for testing and for measuring the overhead of pax itself"""
+
+    def transform_event(self, event):
+        return event
 
 
 class DummyTransform2(plugin.TransformPlugin):
@@ -4,8 +4,6 @@ from pax import plugin, datastructure
 
 from pax.dsputils import find_intervals_above_threshold
 
-import matplotlib.pyplot as plt
-
 
 class SoftwareZLE(plugin.TransformPlugin):
     """Emulate the Zero-length encoding of the CAEN 1724 digitizer
@@ -19,6 +17,8 @@ class SoftwareZLE(plugin.TransformPlugin):
     def transform_event(self, event):
         new_pulses = []
         zle_intervals_buffer = self.zle_intervals_buffer
+        if self.debug:
+            import matplotlib.pyplot as plt     # Slow to import, so only do it when we actually plot
 
         for pulse_i, pulse in enumerate(event.pulses):
             if self.debug:
@@ -83,8 +83,8 @@ class SoftwareZLE(plugin.TransformPlugin):
                     start = itvs_to_encode[itv_i, 0]
 
                     if itvs_encoded >= self.config['max_intervals']:
-                        self.log.debug("ZLE breakdown in channel %d: all samples from %d onwards are stored" % (
-                            pulse.channel, zle_intervals_buffer[-1, 0]))
+                        self.log.debug("ZLE breakdown in channel %d: all samples from %d onwards are stored",
+                                       pulse.channel, zle_intervals_buffer[-1, 0])
                         stop = pulse.length - 1
                         itv_i = len(itvs_to_encode) - 1     # Loop will end after this last pulse is appended
                     else:
@@ -110,10 +110,10 @@ class SoftwareZLE(plugin.TransformPlugin):
                     if self.debug:
                         plt.axvspan(start, stop, alpha=0.3, color='green')
 
-                    new_pulses.append(datastructure.Pulse(
+                    new_pulses.append(datastructure.Pulse.construct(
                         channel=pulse.channel,
-                        left=pulse.left+start,
-                        right=pulse.left+stop,
+                        left=int(pulse.left+start),
+                        right=int(pulse.left+stop),
                         raw_data=pulse.raw_data[start:stop + 1]
                     ))
                     itvs_encoded += 1
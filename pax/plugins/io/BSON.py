@@ -1,7 +1,5 @@
 """JSON and BSON-based data output to files
 """
-import json
-
 from pax import datastructure
 from pax.FolderIO import InputFromFolder, WriteToFolder, WriteZippedEncoder, ReadZippedDecoder
 
@@ -20,8 +18,9 @@ class ReadJSON(InputFromFolder):
         self.current_file = open(filename, mode='r')
 
     def get_all_events_in_current_file(self):
+        materialize_fields = self.config.get('materialize_fields')
         for line in self.current_file:
-            yield datastructure.Event(**json.loads(line))
+            yield datastructure.Event.from_json(line, materialize_fields=materialize_fields)
 
     def close(self):
         self.current_file.close()
@@ -57,5 +56,5 @@ class EncodeZBSON(WriteZippedEncoder):
 class DecodeZBSON(ReadZippedDecoder):
 
     def decode_event(self, event):
-        event = datastructure.Event.from_bson(event)
+        event = datastructure.Event.from_bson(event, materialize_fields=self.materialize_fields)
         return event
@@ -0,0 +1,22 @@
+"""Read/write events from/to zipfiles of events in the pax binary format, see pax/binary_format.py
+"""
+from pax import binary_format
+from pax.FolderIO import WriteZippedEncoder, ReadZippedDecoder
+
+
+##
+# Zipped binary events
+##
+
+class EncodeZBinary(WriteZippedEncoder):
+
+    def encode_event(self, event):
+        return binary_format.encode(event)
+
+
+class DecodeZBinary(ReadZippedDecoder):
+
+    def decode_event(self, event):
+        # The arrays of the event are views of the data we decode. Decompressing gave us immutable bytes:
+        # copy them once to a bytearray, so the arrays are writable like those of other decoders' events.
+        return binary_format.decode(bytearray(event), materialize_fields=self.materialize_fields)
@@ -17,7 +17,8 @@ import numpy as np
 import snappy
 import pymongo
 
-from pax.datastructure import Event, Pulse, EventProxy
+from pax.datastructure import Event, EventProxy
+from pax.pulse_array import PulseArray
 from pax import plugin, trigger, units
 
 
@@ -197,6 +198,7 @@ class MongoDBReadUntriggered(plugin.InputPlugin, MongoBase):
         last_time_searched = 0  # Last time (ns) searched, exclusive. ie we searched [something, last_time_searched)
         next_event_number = 0
         more_data_coming = True
+        resume_after_event = self.config.get('resume_after_event', None)
 
         while more_data_coming:
             # Refresh the run info, to find out if data taking has ended
@@ -298,7 +300,10 @@ class MongoDBReadUntriggered(plugin.InputPlugin, MongoBase):
                                                  modules=modules,
                                                  areas=areas,
                                                  last_data=(not more_data_coming and i == len(futures) - 1)):
-                        yield EventProxy(event_number=next_event_number, data=data)
+                        # When resuming a run, the trigger must still see all the data to number the events
+                        # the same way, but we don't send out the events which are already done.
+                        if resume_after_event is None or next_event_number > resume_after_event:
+                            yield EventProxy(event_number=next_event_number, data=data)
                         next_event_number += 1
 
         # Built all events for the run!
@@ -382,6 +387,8 @@ class MongoDBReadUntriggeredFiller(plugin.TransformPlugin, MongoBase):
         else:
             mongo_iterator = self._get_cursor_between_times(t0, t1)
 
+        # Collect the pulses, then put all their data in one buffer
+        channels, lefts, raw_datas = [], [], []
         for i, pulse_doc in enumerate(mongo_iterator):
             digitizer_id = (pulse_doc['module'], pulse_doc['channel'])
             if digitizer_id in self.pmt_mappings:
@@ -392,15 +399,16 @@ class MongoDBReadUntriggeredFiller(plugin.TransformPlugin, MongoBase):
 
                 time_within_event = self._from_mt(pulse_doc['time']) - t0  # ns
 
-                event.pulses.append(Pulse(left=self._to_mt(time_within_event),
-                                          raw_data=np.fromstring(data,
-                                                                 dtype="<i2"),
-                                          channel=self.pmt_mappings[digitizer_id]))
+                channels.append(self.pmt_mappings[digitizer_id])
+                lefts.append(self._to_mt(time_within_event))
+                # No need to copy the data yet, from_raw_data does that
+                raw_datas.append(np.frombuffer(data, dtype="<i2"))
             elif digitizer_id not in self.ignored_channels:
                 self.log.warning("Found data from digitizer module %d, channel %d,"
                                  "which doesn't exist according to PMT mapping! Ignoring...",
                                  pulse_doc['module'], pulse_doc['channel'])
                 self.ignored_channels.append(digitizer_id)
+        event.pulses = PulseArray.from_raw_data(channels, lefts, raw_datas).to_pulses()
 
         self.log.debug("%d pulses in event %s" % (len(event.pulses), event.event_number))
         return event
@@ -86,13 +86,13 @@ class EncodeROOTClass(plugin.TransformPlugin):
         """
         obj_name = python_object.__class__.__name__
         fields_to_ignore = self.config['fields_to_ignore']
-        list_field_info = python_object.get_list_field_info()
 
-        for field_name, field_value in python_object.get_fields_data():
+        for field, field_value in python_object.get_fields_with_schema():
+            field_name = field.name
             if field_name in fields_to_ignore:
                 continue
 
-            elif isinstance(field_value, list) or field_name in self.config['structured_array_fields']:
+            elif field.kind == 'list' or field_name in self.config['structured_array_fields']:
                 # Collection field -- recursively initialize collection elements
                 if field_name in self.config['structured_array_fields']:
                     # Convert the entries from numpy structured array to ordinary pax data models
@@ -104,7 +104,7 @@ class EncodeROOTClass(plugin.TransformPlugin):
                     field_value = pax_object_list
 
                 else:
-                    element_model_name = list_field_info[field_name].__name__
+                    element_model_name = field.element_type.__name__
 
                 root_vector = getattr(root_object, field_name)
 
@@ -115,7 +115,7 @@ class EncodeROOTClass(plugin.TransformPlugin):
                     root_vector.push_back(element_root_object)
                 self.last_collection[element_model_name] = field_value
 
-            elif isinstance(field_value, np.ndarray):
+            elif field.kind == 'array':
                 # Unfortunately we can't store numpy arrays directly into ROOT's ROOT.PyXXXBuffer.
                 # Doing so will not give an error, but the data will be mangled!
                 # Instead we have to use python's old array module...
@@ -213,15 +213,16 @@ class TableWriter(plugin.OutputPlugin):
             }
             first_time_seen = True
 
-        for field_name, field_value in m.get_fields_data():
+        for field, field_value in m.get_fields_with_schema():
+            field_name = field.name
 
             if field_name in self.config['fields_to_ignore']:
                 continue
 
-            if isinstance(field_value, list):
+            if field.kind == 'list':
                 # This is a model collection field.
                 # Get its type (can't get from the list itself, could be empty)
-                child_class_name = m.get_list_field_info()[field_name]
+                child_class_name = field.element_type
 
                 # Store the absolute start index & number of children
                 child_start = self.get_index_of(child_class_name)
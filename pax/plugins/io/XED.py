@@ -25,7 +25,8 @@ import six
 import numpy as np
 
 from pax import units
-from pax.datastructure import Event, Pulse, EventProxy
+from pax.datastructure import Event, EventProxy
+from pax.pulse_array import PulseArray
 
 from pax.FolderIO import InputFromFolder, WriteToFolder
 from pax import plugin
@@ -207,13 +208,15 @@ class DecodeXED(plugin.TransformPlugin):
                       length=metadata['samples_in_event'])
 
         if xed_type == 'raw':
-            data = np.reshape(data, (metadata['channels'], metadata['samples_in_event']))
-            for ch_i, chdata in enumerate(data):
-                event.pulses.append(Pulse(
-                    channel=ch_i + 1,       # +1 as first channel is 1 in Xenon100
-                    left=0,
-                    raw_data=chdata
-                ))
+            # The data is already one buffer, with all samples of one channel, then the next channel, etc.
+            n_channels, n_samples = metadata['channels'], metadata['samples_in_event']
+            pulses = PulseArray.empty_data(n_channels)
+            pulses['channel'] = np.arange(n_channels) + 1       # +1 as first channel is 1 in Xenon100
+            pulses['left'] = 0
+            pulses['right'] = n_samples - 1
+            pulses['offset'] = np.arange(n_channels) * n_samples
+            pulses['length'] = n_samples
+            event.pulses = PulseArray(pulses, data.astype(np.int16, copy=False)).to_pulses()
 
         elif xed_type == 'zle':
             # Decompress event data into fake binary file (io.BytesIO)
@@ -224,6 +227,9 @@ class DecodeXED(plugin.TransformPlugin):
                 # TODO: figure this out from flags
                 chunk_fake_file = six.BytesIO(data)
 
+            # Collect the pulses, then put all their data in one buffer
+            channels, lefts, raw_datas = [], [], []
+
             # Loop over all channels in the event to get the pulses
             for channel_id in event_proxy.data['channels_included']:
                 # Read channel size (in 4bit words), subtract header size, convert
@@ -256,18 +262,18 @@ class DecodeXED(plugin.TransformPlugin):
                         # Subtract the control word flag
                         data_samples = 2 * (control_word - (2 ** 31))
 
-                        # Note endianness
-                        samples_pulse = np.fromstring(channel_fake_file.read(2 * data_samples),
+                        # Note endianness. No need to copy the data yet, from_raw_data does that.
+                        samples_pulse = np.frombuffer(channel_fake_file.read(2 * data_samples),
                                                       dtype="<i2")
 
-                        event.pulses.append(Pulse(
-                            channel=channel_id,
-                            left=sample_position,
-                            raw_data=samples_pulse
-                        ))
+                        channels.append(channel_id)
+                        lefts.append(sample_position)
+                        raw_datas.append(samples_pulse)
 
                         sample_position += len(samples_pulse)
 
+            event.pulses = PulseArray.from_raw_data(channels, lefts, raw_datas).to_pulses()
+
         return event
 
 
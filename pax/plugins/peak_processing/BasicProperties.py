@@ -1,7 +1,8 @@
 import numpy as np
 # import numba
 
-from pax import plugin, dsputils
+from pax import plugin
+from pax.peak_array import PeakArray
 
 
 class BasicProperties(plugin.TransformPlugin):
@@ -14,53 +15,77 @@ class BasicProperties(plugin.TransformPlugin):
     def transform_event(self, event):
         first_top_ch = np.min(np.array(self.config['channels_top']))
         last_top_ch = np.max(np.array(self.config['channels_top']))
+        top = slice(first_top_ch, last_top_ch + 1)
+        peaks = event.peaks
+        if not len(peaks):
+            return event
+
+        # Compute the properties of all peaks at once, from the hits of all peaks together
+        n_hits_per_peak = np.array([len(peak.hits) for peak in peaks])
+        if np.any(n_hits_per_peak == 0):
+            raise ValueError("Can't compute properties of an empty peak!")
+        hits = np.concatenate([peak.hits for peak in peaks])
+        peak_index = np.repeat(np.arange(len(peaks)), n_hits_per_peak)
+        first_hit_index = np.cumsum(n_hits_per_peak) - n_hits_per_peak
+
+        # Per-channel quantities, as (n_peaks, n_channels) matrices. Each peak gets a row of these.
+        area_per_channel = count_hits_per_peak_and_channel(peak_index, hits, self.config, weights=hits['area'])
+        hits_per_channel = count_hits_per_peak_and_channel(peak_index, hits, self.config).astype(np.int16)
+        n_saturated_per_channel = count_hits_per_peak_and_channel(peak_index, hits, self.config,
+                                                                  weights=hits['n_saturated']).astype(np.int16)
+
+        area = area_per_channel.sum(axis=1)
+        n_contributing_channels = np.sum(area_per_channel > 0, axis=1)
+        if np.any(n_contributing_channels == 0):
+            raise RuntimeError("Every peak should have at least one contributing channel... what's going on?")
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Weighted means over the hits in each peak, weighted by the hit area
+            area_of_hits = np.bincount(peak_index, weights=hits['area'])
+            mean_amplitude_to_noise = np.bincount(peak_index, weights=hits['height'] / hits['noise_sigma'] *
+                                                  hits['area']) / area_of_hits
+            hit_time_mean = np.bincount(peak_index, weights=hits['center'] * hits['area']) / area_of_hits
+            hit_time_variance = np.bincount(peak_index, weights=(hits['center'] - hit_time_mean[peak_index])**2 *
+                                            hits['area']) / area_of_hits
+
+            result = PeakArray.from_columns(
+                left=np.minimum.reduceat(hits['left'], first_hit_index),
+                right=np.maximum.reduceat(hits['right'], first_hit_index),
+                area_per_channel=area_per_channel,
+                hits_per_channel=hits_per_channel,
+                n_saturated_per_channel=n_saturated_per_channel,
+                area=area,
+                n_hits=hits_per_channel.sum(axis=1),
+                n_saturated_samples=n_saturated_per_channel.sum(axis=1),
+                n_saturated_channels=np.sum(n_saturated_per_channel != 0, axis=1),
+                n_contributing_channels=n_contributing_channels,
+                mean_amplitude_to_noise=mean_amplitude_to_noise / area,
+                area_fraction_top=area_per_channel[:, top].sum(axis=1) / area,
+                hits_fraction_top=hits_per_channel[:, top].sum(axis=1) / area,
+                hit_time_mean=hit_time_mean,
+                hit_time_std=hit_time_variance ** 0.5,
+                n_contributing_channels_top=np.sum(area_per_channel[:, top] > 0, axis=1))
+        result.update_peaks(peaks)
+
+        for i in np.where(n_contributing_channels == 1)[0]:
+            peak = peaks[i]
+            peak.type = 'lone_hit'
+            channel = peak.hits[0]['channel']
+            event.lone_hits_per_channel[channel] += 1
+            peak.lone_hit_channel = channel
 
-        for peak in event.peaks:
-            hits = peak.hits
-            if len(hits) == 0:
-                raise ValueError("Can't compute properties of an empty peak!")
-
-            peak.left = hits['left'].min()
-            peak.right = hits['right'].max()
-
-            peak.area_per_channel = dsputils.count_hits_per_channel(peak, self.config, weights=hits['area'])
-            peak.hits_per_channel = dsputils.count_hits_per_channel(peak, self.config).astype(np.int16)
-            n_saturated_tot = hits['n_saturated'].sum()
-            if n_saturated_tot:
-                peak.n_saturated_per_channel = dsputils.count_hits_per_channel(
-                    peak, self.config, weights=hits['n_saturated']).astype(np.int16)
-            else:
-                peak.n_saturated_per_channel = np.zeros(self.config['n_channels'], dtype=np.int16)
-
-            with np.errstate(divide='ignore', invalid='ignore'):
-                peak.mean_amplitude_to_noise = np.average(hits['height']/hits['noise_sigma'], weights=hits['area'])
-
-            peak.area = np.sum(peak.area_per_channel)
-            peak.n_hits = np.sum(peak.hits_per_channel)
-            peak.n_saturated_samples = np.sum(peak.n_saturated_per_channel)
-            peak.n_saturated_channels = len(np.where(peak.n_saturated_per_channel)[0])
-            peak.n_contributing_channels = len(peak.contributing_channels)
-            peak.mean_amplitude_to_noise /= peak.area
-
-            # Compute top fraction
-            peak.area_fraction_top = np.sum(peak.area_per_channel[first_top_ch:last_top_ch + 1]) / peak.area
-            peak.hits_fraction_top = np.sum(peak.hits_per_channel[first_top_ch:last_top_ch + 1]) / peak.area
-
-            # Compute timing quantities
-            peak.hit_time_mean, peak.hit_time_std = weighted_mean_variance(hits['center'], hits['area'])
-            peak.hit_time_std **= 0.5  # Convert variance to std
-            peak.n_contributing_channels_top = np.sum((peak.area_per_channel[first_top_ch:last_top_ch + 1] > 0))
-
-            if peak.n_contributing_channels == 0:
-                raise RuntimeError("Every peak should have at least one contributing channel... what's going on?")
+        return event
 
-            if peak.n_contributing_channels == 1:
-                peak.type = 'lone_hit'
-                channel = hits[0]['channel']
-                event.lone_hits_per_channel[channel] += 1
-                peak.lone_hit_channel = channel
 
-        return event
+def count_hits_per_peak_and_channel(peak_index, hits, config, weights=None):
+    """Like dsputils.count_hits_per_channel, for many peaks at once.
+    Returns (n_peaks, n_channels) matrix; peak_index gives the index of the peak each of the hits belongs to.
+    """
+    n_peaks = peak_index[-1] + 1
+    n_channels = config['n_channels']
+    counts = np.bincount(peak_index * n_channels + hits['channel'].astype(np.int64),
+                         minlength=n_peaks * n_channels, weights=weights)
+    return counts.reshape(n_peaks, n_channels)
 
 
 class SumWaveformProperties(plugin.TransformPlugin):
@@ -115,10 +140,8 @@ class SumWaveformProperties(plugin.TransformPlugin):
             peak.area_midpoint += peak.left * dt
 
             # Store the waveform; for tpc also store the top waveform
-            self.log.debug("Storing sum waveform for peak %d-%d-%d in %s" % (peak.left,
-                                                                             int(round(peak.center_time / dt)),
-                                                                             peak.right,
-                                                                             peak.detector))
+            self.log.debug("Storing sum waveform for peak %d-%d-%d in %s",
+                           peak.left, int(round(peak.center_time / dt)), peak.right, peak.detector)
             put_w_in_center_of_field(w, peak.sum_waveform, cog_idx)
             if peak.detector == 'tpc':
                 put_w_in_center_of_field(event.get_sum_waveform('tpc_top').samples[peak.left:peak.right + 1],
@@ -209,14 +232,3 @@ def put_w_in_center_of_field(w, field, center_index):
 
     start_idx = field_center - center_index
     field[start_idx:start_idx + len(w)] = w
-
-
-def weighted_mean_variance(values, weights):
-    """
-    Return the weighted mean, and the weighted sum square deviation from the weighted mean.
-    values, weights -- Numpy ndarrays with the same shape.
-    Stolen from http://stackoverflow.com/questions/2413522/weighted-standard-deviation-in-numpy
-    """
-    weighted_mean = np.average(values, weights=weights)
-    weighted_variance = np.average((values-weighted_mean)**2, weights=weights)  # Fast and numerically precise
-    return weighted_mean, weighted_variance
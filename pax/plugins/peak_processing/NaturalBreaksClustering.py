@@ -45,7 +45,7 @@ class NaturalBreaksClustering(plugin.TransformPlugin):
             # Lone hit: can't cluster any more!
             return [peak]
 
-        self.log.debug("Clustering hits %d-%d" % (hits[0]['center'], hits[-1]['center']))
+        self.log.debug("Clustering hits %d-%d", hits[0]['center'], hits[-1]['center'])
         area_tot = np.sum(hits['area'])
 
         # Compute gaps between hits, select large enough gaps to test
@@ -69,19 +69,21 @@ class NaturalBreaksClustering(plugin.TransformPlugin):
 
             # Should we split? If so, recurse.
             if split_goodness > split_threshold:
-                self.log.debug("SPLITTING at %d  (%s > %s)" % (split_i, split_goodness, split_threshold))
-                peak_l = datastructure.Peak(hits=hits[:split_i],
-                                            detector=peak.detector,
-                                            birthing_split_goodness=split_goodness,
-                                            birthing_split_fraction=np.sum(hits['area'][:split_i]) / area_tot)
-                peak_r = datastructure.Peak(hits=hits[split_i:],
-                                            detector=peak.detector,
-                                            birthing_split_goodness=split_goodness,
-                                            birthing_split_fraction=np.sum(hits['area'][split_i:]) / area_tot)
+                self.log.debug("SPLITTING at %d  (%s > %s)", split_i, split_goodness, split_threshold)
+                peak_l = datastructure.Peak.construct(
+                    hits=hits[:split_i],
+                    detector=peak.detector,
+                    birthing_split_goodness=float(split_goodness),
+                    birthing_split_fraction=float(np.sum(hits['area'][:split_i]) / area_tot))
+                peak_r = datastructure.Peak.construct(
+                    hits=hits[split_i:],
+                    detector=peak.detector,
+                    birthing_split_goodness=float(split_goodness),
+                    birthing_split_fraction=float(np.sum(hits['area'][split_i:]) / area_tot))
                 return self.cluster(peak_l) + self.cluster(peak_r)
             else:
-                self.log.debug("Proposed split at %d not good enough (%0.3f < %0.3f)" % (
-                    split_i, split_goodness, split_threshold))
+                self.log.debug("Proposed split at %d not good enough (%0.3f < %0.3f)",
+                               split_i, split_goodness, split_threshold)
 
             # If we get here, no clustering was needed
             peak.interior_split_goodness = split_goodness
@@ -92,7 +94,7 @@ class NaturalBreaksClustering(plugin.TransformPlugin):
 
 
 @numba.jit(numba.float64(numba.float64[:], numba.float64[:], numba.float64[:]),
-           nopython=True)
+           nopython=True, cache=True)
 def _sad_fallback(x, areas, fallback):
     # While there is a one-pass algorithm for variance, I haven't found one for sad.. maybe it doesn't exists
     # First calculate the weighted mean.
@@ -113,7 +115,7 @@ def _sad_fallback(x, areas, fallback):
 @numba.jit(numba.float64(numba.int64[:], numba.int64[:],
                          numba.float64[:], numba.float64[:], numba.float64[:],
                          numba.float64[:]),
-           nopython=False)
+           nopython=False, cache=True)
 def compute_every_split_goodness(gaps, split_indices,
                                  center, deviation, area,
                                  results):
@@ -125,7 +127,7 @@ def compute_every_split_goodness(gaps, split_indices,
 
 
 @numba.jit(numba.float64(numba.int64, numba.float64[:], numba.float64[:], numba.float64[:]),
-           nopython=False)
+           nopython=False, cache=True)
 def compute_split_goodness(split_index, center, deviation, area):
     """Return "goodness of split" for splitting hits >= split_index into right cluster, < into left.
        left, right: left, right indices of hits
@@ -23,7 +23,7 @@ class RejectNoiseHits(plugin.TransformPlugin):
 
         # Penalty for each lone hit
         lone_hits = event.get_peaks_by_type(desired_type='lone_hit', detector='all')
-        self.log.debug("This event has %d lone hits" % len(lone_hits))
+        self.log.debug("This event has %d lone hits", len(lone_hits))
         for lone_hit_peak in lone_hits:
             channel = lone_hit_peak.hits[0]['channel']
             event.lone_hits_per_channel_before[channel] += 1
@@ -67,7 +67,7 @@ class RejectNoiseHits(plugin.TransformPlugin):
             # Has the peak become empty? Then mark it for deletion.
             # We can't delete it now since we're iterating over event.peaks
             if len(peak.hits) == 0:
-                self.log.debug('Peak %d consists completely of rejected hits and will be deleted!' % peak_i)
+                self.log.debug('Peak %d consists completely of rejected hits and will be deleted!', peak_i)
                 peaks_to_delete.append(peak_i)
                 continue
 
@@ -1,8 +1,6 @@
 import os
 from textwrap import dedent
 
-from tqdm import tqdm
-import matplotlib.pyplot as plt
 import numpy as np
 
 from pax import plugin, datastructure, dsputils
@@ -35,6 +33,9 @@ class HitfinderDiagnosticPlots(plugin.TransformPlugin):
     def transform_event(self, event):
         if self.make_diagnostic_plots == 'never':
             return event
+        # These are slow to import, so only do it when we actually plot
+        from tqdm import tqdm
+        import matplotlib.pyplot as plt
 
         # Get the pulse-to-hit mapping
         # Note this relies on the hits being sorted by found_in_pulse
@@ -28,8 +28,8 @@ class GapSizeClustering(plugin.TransformPlugin):
             cluster_indices = [0] + np.where(gaps > self.gap_threshold)[0].tolist() + [len(hits)]
             for i in range(len(cluster_indices) - 1):
                 hits_in_this_peak = hits[cluster_indices[i]:cluster_indices[i + 1]]
-                peak = datastructure.Peak(detector=detector,
-                                          hits=hits_in_this_peak)
+                peak = datastructure.Peak.construct(detector=detector,
+                                                    hits=hits_in_this_peak)
 
                 # Area per channel must be computed here so RejectNoiseHits can use it
                 # unfortunate code duplication with BasicProperties!
@@ -33,8 +33,8 @@ class ConcatenateAdjacentPulses(plugin.TransformPlugin):
 
             if pulse.channel == prev_pulse.channel and pulse.left == prev_pulse.right + 1:
                 # Pulse is directly adjacent to previous one in same channel: merge it
-                self.log.debug("Concatenating adjacent DAQ pulses %d-%d and %d-%d in channel %s" % (
-                    prev_pulse.left, prev_pulse.right, pulse.left, pulse.right, pulse.channel))
+                self.log.debug("Concatenating adjacent DAQ pulses %d-%d and %d-%d in channel %s",
+                               prev_pulse.left, prev_pulse.right, pulse.left, pulse.right, pulse.channel)
                 prev_pulse.right = pulse.right
                 prev_pulse.raw_data = np.concatenate((prev_pulse.raw_data, pulse.raw_data))
                 # If there are no pulses after this, add the merged pulse to the good pulses list
@@ -124,10 +124,10 @@ class CheckBounds(plugin.TransformPlugin):
                     end_index = event_length - 1
 
                 # Update the pulse data, so hit finder won't look at old un-truncated pulse
-                event.pulses[pulse_i] = datastructure.Pulse(left=start_index,
-                                                            right=end_index,
-                                                            channel=channel,
-                                                            raw_data=pulse_wave)
+                event.pulses[pulse_i] = datastructure.Pulse.construct(left=int(start_index),
+                                                                      right=int(end_index),
+                                                                      channel=channel,
+                                                                      raw_data=pulse_wave)
 
         # Remove the to-be-ignored-pulses
         event.pulses = [p for p_i, p in enumerate(event.pulses) if p_i not in pulses_to_ignore]
@@ -3,7 +3,6 @@ import numba
 
 # For diagnostic plotting:
 from textwrap import dedent
-import matplotlib.pyplot as plt
 import os
 
 from pax import plugin, datastructure, dsputils
@@ -147,8 +146,8 @@ class FindHits(plugin.TransformPlugin):
             elif n_hits_found >= self.max_hits_per_pulse:
                 self.log.debug("Pulse %s-%s in channel %s has more than %s hits. "
                                "This usually indicates a zero-length encoding breakdown after a very large S2. "
-                               "Further hits in this pulse have been ignored." % (start, stop, channel,
-                                                                                  self.max_hits_per_pulse))
+                               "Further hits in this pulse have been ignored.", start, stop, channel,
+                               self.max_hits_per_pulse)
 
             # Store the found hits in the datastructure
             # Convert area, noise_sigma and height from adc counts -> pe
@@ -201,6 +200,7 @@ class FindHits(plugin.TransformPlugin):
                 if self.make_diagnostic_plots != 'always':
                     raise ValueError("Invalid make_diagnostic_plots option: %s!" % self.make_diagnostic_plots)
 
+            import matplotlib.pyplot as plt     # Slow to import, so only do it when we actually plot
             plt.figure(figsize=(14, 10))
             data_for_title = (event.event_number, start, stop, channel)
             plt.title('Event %s, pulse %d-%d, Channel %d' % data_for_title)
@@ -261,7 +261,7 @@ class FindHits(plugin.TransformPlugin):
 
         if len(hits_per_pulse):
             event.all_hits = np.concatenate(hits_per_pulse)
-            self.log.debug("Found %d hits in %d pulses" % (len(event.all_hits), len(event.pulses)))
+            self.log.debug("Found %d hits in %d pulses", len(event.all_hits), len(event.pulses))
         else:
             self.log.warning("Event has no pulses??!")
 
@@ -271,7 +271,7 @@ class FindHits(plugin.TransformPlugin):
 @numba.jit(numba.void(numba.float64[:], numba.int64[:, :],
                       numba.from_dtype(datastructure.Hit.get_dtype())[:],
                       numba.float64, numba.int64, numba.float64, numba.int64, numba.int64, numba.int64),
-           nopython=True)
+           nopython=True, cache=True)
 def build_hits(w, hit_bounds, hits_buffer, adc_to_pe, channel, noise_sigma_pe, dt, start, pulse_i):
     """Populates hits_buffer with properties from hits indicated by hit_bounds.
         hit_bounds should be a numpy array of (left, right) bounds (inclusive)
@@ -310,7 +310,7 @@ def build_hits(w, hit_bounds, hits_buffer, adc_to_pe, channel, noise_sigma_pe, d
 
 
 @numba.jit(numba.typeof((1.0, 1.0, 1.0, 1.0))(numba.float64[:], numba.int64),
-           nopython=True)
+           nopython=True, cache=True)
 def compute_pulse_properties(w, initial_baseline_samples):
     """Compute basic pulse properties quickly
     :param w: Raw pulse waveform in ADC counts
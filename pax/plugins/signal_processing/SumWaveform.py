@@ -1,7 +1,8 @@
 import numpy as np
 import numba
 
-from pax import plugin, datastructure, recarray_tools, dsputils
+from pax import plugin, datastructure, dsputils
+from pax.pulse_array import PulseArray
 
 
 class SumWaveform(plugin.TransformPlugin):
@@ -9,75 +10,69 @@ class SumWaveform(plugin.TransformPlugin):
     def startup(self):
         self.detector_by_channel = dsputils.get_detector_by_channel(self.config)
 
-    def transform_event(self, event):
-        # Initialize empty waveforms for each detector
-        # One with only hits, one with raw data
+        # Name, channels and detector of the sum waveforms we make, in the order we add them to the event:
+        # one with only hits and one with raw data for each detector, then the top and bottom tpc sum waveforms
+        self.sum_waveform_specs = []
         for postfix in ('', '_raw'):
             for detector, chs in self.config['channels_in_detector'].items():
-                event.sum_waveforms.append(datastructure.SumWaveform(
-                    samples=np.zeros(event.length(), dtype=np.float32),
-                    name=detector + postfix,
-                    channel_list=np.array(list(chs), dtype=np.uint16),
-                    detector=detector
-                ))
-
-        # Make dictionary mapping pulse -> non-rejected hits found in pulse
-        # Assumes hits are still sorted by pulse
-        hits_per_pulse = recarray_tools.dict_group_by(event.all_hits[True ^ event.all_hits['is_rejected']],
-                                                      'found_in_pulse')
-
-        # Add top and bottom tpc sum waveforms
+                self.sum_waveform_specs.append((detector + postfix, list(chs), detector))
         for q in ('top', 'bottom'):
-            event.sum_waveforms.append(datastructure.SumWaveform(
-                samples=np.zeros(event.length(), dtype=np.float32),
-                name='tpc_%s' % q,
-                channel_list=np.array(self.config['channels_%s' % q], dtype=np.uint16),
-                detector='tpc'
-            ))
-
-        for pulse_i, pulse in enumerate(event.pulses):
-            channel = pulse.channel
-
-            # Do some initialization only when we switch channel
-            # The 'current_channel' variable can't be pulled outside the loop, that would hurt performance
-            # (trust me, try it and time it)
-            if pulse_i == 0 or channel != current_channel:      # noqa
-                current_channel = channel                       # noqa
-                detector = self.detector_by_channel[channel]
-                adc_to_pe = dsputils.adc_to_pe(self.config, pulse.channel)
-                gain = self.config['gains'][channel]
-
-                if detector == 'tpc':
-                    if channel in self.config['channels_top']:
-                        sum_w = event.get_sum_waveform('tpc_top')
-                    else:
-                        sum_w = event.get_sum_waveform('tpc_bottom')
-                else:
-                    sum_w = event.get_sum_waveform(detector)
-
-            # Don't consider dead channels
-            if gain == 0:
-                continue
-
-            baseline_to_subtract = self.config['digitizer_reference_baseline'] - pulse.baseline
-
-            w = baseline_to_subtract - pulse.raw_data.astype(np.float32)
-            w *= adc_to_pe
-
-            sum_w_raw = event.get_sum_waveform(detector+'_raw').samples
-            sum_w_raw[pulse.left:pulse.right+1] += w
-
-            hits = hits_per_pulse.get(pulse_i, None)
-            if hits is None:
+            self.sum_waveform_specs.append(('tpc_%s' % q, self.config['channels_%s' % q], 'tpc'))
+        index_of = {name: i for i, (name, _, _) in enumerate(self.sum_waveform_specs)}
+
+        # For each channel, the index of the sum waveforms to which we add its raw data and its hits
+        # (-1 for dead channels and channels not in any detector), and the ADC count -> pe/bin conversion factor
+        n_channels = self.config['n_channels']
+        self.raw_sum_waveform_of_channel = -1 * np.ones(n_channels, dtype=np.int64)
+        self.hits_sum_waveform_of_channel = -1 * np.ones(n_channels, dtype=np.int64)
+        self.adc_to_pe_of_channel = np.zeros(n_channels, dtype=np.float64)
+        for channel in range(n_channels):
+            detector = self.detector_by_channel.get(channel)
+            if detector is None or self.config['gains'][channel] == 0:
                 continue
+            self.raw_sum_waveform_of_channel[channel] = index_of[detector + '_raw']
+            if detector == 'tpc':
+                if channel in self.config['channels_top']:
+                    self.hits_sum_waveform_of_channel[channel] = index_of['tpc_top']
+                else:
+                    self.hits_sum_waveform_of_channel[channel] = index_of['tpc_bottom']
+            else:
+                self.hits_sum_waveform_of_channel[channel] = index_of[detector]
+            self.adc_to_pe_of_channel[channel] = dsputils.adc_to_pe(self.config, channel)
 
-            w_hits_only = w.copy()
-            # Obtain an array of same length as w, indicating whether the sample is in a hit or not
-            mask = np.zeros(len(w), dtype=np.bool)
-            set_if_in_ranges(mask, hits['left'] - pulse.left, hits['right'] - pulse.left)
-            w_hits_only[True ^ mask] = 0
+    def transform_event(self, event):
+        # Compute all sum waveforms at once, as rows of one matrix
+        samples = np.zeros((len(self.sum_waveform_specs), event.length()), dtype=np.float32)
+        for i, (name, channel_list, detector) in enumerate(self.sum_waveform_specs):
+            event.sum_waveforms.append(datastructure.SumWaveform(
+                samples=samples[i],
+                name=name,
+                channel_list=np.array(channel_list, dtype=np.uint16),
+                detector=detector
+            ))
 
-            sum_w.samples[pulse.left:pulse.right+1] += w_hits_only
+        if len(event.pulses):
+            pulse_array = PulseArray.from_pulses(event.pulses, fields=['baseline'])
+            pulses = pulse_array.data
+            if pulses['left'].min() < 0 or pulses['right'].max() >= event.length():
+                raise ValueError("Pulses extend beyond the event, can't make sum waveforms. "
+                                 "Use CheckPulses.CheckBounds to truncate them.")
+            if np.any(pulses['length'] != pulses['right'] - pulses['left'] + 1):
+                raise ValueError("The raw data of some pulses does not match their left and right, "
+                                 "can't make sum waveforms.")
+
+            # Non-rejected hits, grouped by the pulse they were found in.
+            # The hits in pulse i are hits[hits_start[i]:hits_start[i + 1]]
+            hits = event.all_hits[True ^ event.all_hits['is_rejected']]
+            hits = hits[np.argsort(hits['found_in_pulse'], kind='mergesort')]
+            hits_start = np.searchsorted(hits['found_in_pulse'], np.arange(len(pulses) + 1))
+
+            add_pulses_to_sum_waveforms(pulse_array.buffer, pulses['offset'], pulses['left'], pulses['length'],
+                                        self.config['digitizer_reference_baseline'] - pulses['baseline'],
+                                        self.adc_to_pe_of_channel[pulses['channel']],
+                                        self.raw_sum_waveform_of_channel[pulses['channel']],
+                                        self.hits_sum_waveform_of_channel[pulses['channel']],
+                                        hits_start, hits['left'], hits['right'], samples)
 
         # Sum the tpc top and bottom tpc waveforms
         event.get_sum_waveform('tpc').samples = event.get_sum_waveform('tpc_top').samples + \
@@ -86,8 +81,36 @@ class SumWaveform(plugin.TransformPlugin):
         return event
 
 
-@numba.jit(numba.void(numba.bool_[:], numba.int64[:], numba.int64[:]), nopython=True)
-def set_if_in_ranges(w, left, right):
-    """Set samples in w to True between ranges indicated by left and right (both inclusive)"""
-    for i in range(len(left)):
-        w[left[i]:right[i]+1] = True
+@numba.jit(nopython=True, cache=True)
+def add_pulses_to_sum_waveforms(buffer, offsets, lefts, lengths, baselines_to_subtract, adc_to_pe,
+                                raw_sum_waveform, hits_sum_waveform, hits_start, hit_lefts, hit_rights, samples):
+    """Add the pulses (raw data in buffer from offsets, in the event from lefts, with lengths samples) in pe/bin
+    to the rows raw_sum_waveform of samples, and the parts of them in a hit to the rows hits_sum_waveform.
+    Skips pulses for which raw_sum_waveform is -1. The hits in pulse i are from hits_start[i] to hits_start[i + 1].
+    Computes in float32, like numpy would if you did this pulse by pulse with float32 arrays.
+    """
+    max_length = 0
+    for pulse_i in range(len(offsets)):
+        max_length = max(max_length, lengths[pulse_i])
+    in_hit = np.zeros(max_length, dtype=np.bool_)
+
+    for pulse_i in range(len(offsets)):
+        if raw_sum_waveform[pulse_i] == -1:
+            continue
+        left = lefts[pulse_i]
+        length = lengths[pulse_i]
+        offset = offsets[pulse_i]
+        baseline_to_subtract = np.float32(baselines_to_subtract[pulse_i])
+        to_pe = np.float32(adc_to_pe[pulse_i])
+        raw_row = raw_sum_waveform[pulse_i]
+        hits_row = hits_sum_waveform[pulse_i]
+
+        for hit_i in range(hits_start[pulse_i], hits_start[pulse_i + 1]):
+            in_hit[max(hit_lefts[hit_i] - left, 0):min(hit_rights[hit_i] - left + 1, length)] = True
+
+        for i in range(length):
+            w = (baseline_to_subtract - np.float32(buffer[offset + i])) * to_pe
+            samples[raw_row, left + i] += w
+            if in_hit[i]:
+                samples[hits_row, left + i] += w
+                in_hit[i] = False
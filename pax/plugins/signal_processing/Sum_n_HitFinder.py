@@ -2,7 +2,6 @@ import numpy as np
 import numba
 
 # For diagnostic plotting:
-import matplotlib.pyplot as plt
 import os
 
 from pax import plugin, datastructure, utils
@@ -245,6 +244,7 @@ class FindHits(plugin.TransformPlugin):
                     raise ValueError("Invalid make_diagnostic_plots option: %s!" % self.make_diagnostic_plots)
 
             # Setup the twin-y-axis plot
+            import matplotlib.pyplot as plt     # Slow to import, so only do it when we actually plot
             fig, ax1 = plt.subplots(figsize=(10, 7))
             ax2 = ax1.twinx()
             ax1.set_xlabel("Sample number (%s ns)" % event.sample_duration)
@@ -279,7 +279,7 @@ class FindHits(plugin.TransformPlugin):
         return event
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def find_intervals_above_threshold(w, high_threshold, low_threshold, result_buffer, dynamic_low_threshold_coeff=0):
     """Fills result_buffer with l, r bounds of intervals in w > low_threshold which exceed high_threshold somewhere
         result_buffer: numpy N*2 array of ints, will be filled by function.
@@ -338,7 +338,7 @@ def find_intervals_above_threshold(w, high_threshold, low_threshold, result_buff
     return current_interval
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def compute_hit_properties(w, raw_hits, argmaxes, areas, centers):
     """Finds argmax, area and center of gravity of hits in w indicated by (l, r) bounds in raw_hits.
     raw_hits should be a numpy array of (left, right) bounds (inclusive)
@@ -362,7 +362,7 @@ def compute_hit_properties(w, raw_hits, argmaxes, areas, centers):
         centers[hit_i] = current_center / current_area
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def compute_pulse_properties(w, initial_baseline_samples):
     """Compute basic pulse properties quickly
     :param w: Raw pulse waveform in ADC counts
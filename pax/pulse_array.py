@@ -0,0 +1,109 @@
+"""Pulses of an event in one contiguous buffer, rather than a separate numpy array in each Pulse object
+
+A PulseArray holds:
+  - buffer: 1d int16 array with the raw data of all pulses
+  - data: structured array with one row per pulse: channel, left, right, offset (index in buffer of the first sample
+    of the pulse), length (number of samples of the pulse in buffer), and the other scalar fields of Pulse
+    (baseline, noise_sigma, ...)
+The length is stored separately from left and right: they need not match, e.g. for pulses without raw data.
+
+The readers build one for each event, and give the event Pulse objects whose raw_data are views of the buffer
+(see to_pulses), so an event with 10^4 pulses needs one allocation for its raw data rather than 10^4.
+Events pickle their pulses as a PulseArray, so sending them between processes or writing them to zipped pickles
+pickles one buffer instead of 10^4 arrays. Plugins which process all pulses at once (e.g. SumWaveform) use
+PulseArray.from_pulses to get the columns and one buffer they can pass to numba.
+"""
+import numpy as np
+
+from pax.datastructure import Pulse
+from pax.peak_array import scalar_types
+
+
+def _make_dtype():
+    dtype = [('offset', np.int64), ('length', np.int64)]
+    for field in Pulse.get_field_schema():
+        if field.kind == 'value' and type(field.default).__name__ in scalar_types:
+            dtype.append((field.name, scalar_types[type(field.default).__name__]))
+    return np.dtype(dtype)
+
+
+# Fields of the structured array of a PulseArray
+pulse_array_dtype = _make_dtype()
+
+
+class PulseArray(object):
+
+    def __init__(self, data, buffer):
+        self.data = data
+        self.buffer = buffer
+
+    @staticmethod
+    def empty_data(n_pulses):
+        """Return structured array for n_pulses pulses, with the default values of the fields of Pulse"""
+        data = np.zeros(n_pulses, dtype=pulse_array_dtype)
+        for name in pulse_array_dtype.names:
+            if name not in ('offset', 'length'):
+                data[name] = getattr(Pulse, name)
+        return data
+
+    @classmethod
+    def from_raw_data(cls, channels, lefts, raw_datas):
+        """Return a PulseArray with pulses in channels, starting at lefts, with raw data raw_datas (list of int16
+        arrays). The raw data is copied into one new buffer.
+        """
+        data = cls.empty_data(len(raw_datas))
+        data['channel'] = channels
+        data['left'] = lefts
+        lengths = np.array([len(w) for w in raw_datas], dtype=np.int64)
+        data['length'] = lengths
+        data['right'] = data['left'] + lengths - 1
+        data['offset'] = np.cumsum(lengths) - lengths
+        if len(raw_datas):
+            buffer = np.concatenate(raw_datas)
+            if buffer.dtype != np.int16:
+                raise ValueError("Pulse raw data must be int16, not %s" % buffer.dtype)
+        else:
+            buffer = np.zeros(0, dtype=np.int16)
+        return cls(data, buffer)
+
+    @classmethod
+    def from_pulses(cls, pulses, fields=None):
+        """Return a PulseArray with the pulses (list of Pulse objects). Besides channel, left and right, only includes
+        the scalar fields listed in fields (default: all). Copies the raw data into one new buffer.
+        """
+        data = np.zeros(len(pulses), dtype=pulse_array_dtype)
+        names = [name for name in pulse_array_dtype.names if name not in ('offset', 'length')]
+        if fields is not None:
+            names = [name for name in names if name in ('channel', 'left', 'right') or name in fields]
+        for name in names:
+            data[name] = [getattr(pulse, name) for pulse in pulses]
+
+        result = cls.from_raw_data(data['channel'], data['left'], [pulse.raw_data for pulse in pulses])
+        data['offset'] = result.data['offset']
+        data['length'] = result.data['length']
+        result.data = data
+        return result
+
+    def __len__(self):
+        return len(self.data)
+
+    def raw_data(self, index):
+        """Return the raw data of pulse index (a view of the buffer)"""
+        pulse = self.data[index]
+        return self.buffer[pulse['offset']:pulse['offset'] + pulse['length']]
+
+    def to_pulses(self):
+        """Return list of Pulse objects with our pulses. Their raw_data are views of our buffer."""
+        buffer = self.buffer
+        names = pulse_array_dtype.names
+        pulses = []
+        for row in self.data.tolist():
+            fields = dict(zip(names, row))
+            offset = fields.pop('offset')
+            fields['raw_data'] = buffer[offset:offset + fields.pop('length')]
+            # Set the fields directly, as unpickling does: they come from Pulse objects, or are set by the readers
+            # (which check them), so we don't need the type checks of the constructor.
+            pulse = Pulse.__new__(Pulse)
+            pulse.__dict__.update(fields)
+            pulses.append(pulse)
+        return pulses
@@ -0,0 +1,44 @@
+"""Dead letter file for events on which a plugin failed
+
+With quarantine_failed_events = True, pax does not stop when a plugin fails on an event. Instead, it writes a record
+of the event to the dead letter file (a sequence of pickles) and goes on with the next event. Each record is a dict:
+  - event_number: number of the event
+  - plugin: name of the plugin which failed (None if we don't know, e.g. when the event timed out)
+  - traceback: traceback of the error, as a string
+  - worker_id: the pax process in which the plugin failed
+  - retried: whether the event was tried again in a fresh worker (and failed again)
+  - event: pickle of the event as it was before processing; you can process it again with Processor.process_event
+"""
+import os
+import pickle
+
+
+class DeadLetterFile(object):
+    """Writes records to the dead letter file filename. Unless append is True (e.g. when resuming a run),
+    the records already in it, from an earlier run, are removed."""
+
+    def __init__(self, filename, append=False):
+        self.filename = filename
+        self.n_records = 0
+        if not append and os.path.exists(filename):
+            open(filename, mode='wb').close()
+
+    def write(self, record):
+        # Open and close the file for every record: there should be few, and we don't want to lose any if we die
+        with open(self.filename, mode='ab') as outfile:
+            pickle.dump(record, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        self.n_records += 1
+
+
+def read_dead_letters(filename):
+    """Iterate over the records in the dead letter file filename"""
+    with open(filename, mode='rb') as infile:
+        while True:
+            try:
+                yield pickle.load(infile)
+            except EOFError:
+                return
+
+
+def dead_letter_file_name(output_name):
+    return output_name + '_dead_letters.pickles'
@@ -14,6 +14,7 @@ from scipy import stats
 
 from pax import units, utils, datastructure
 from pax.PatternFitter import PatternFitter
+from pax.pulse_array import PulseArray
 from pax.InterpolatingMap import InterpolatingMap
 from pax.utils import Memoize
 
@@ -178,7 +179,8 @@ class Simulator(object):
         dt = self.config['sample_duration']
         dv = self.config['digitizer_voltage_range'] / 2 ** (self.config['digitizer_bits'])
 
-        # Build waveform channel by channel
+        # Build waveform channel by channel. Collect the pulses, then put all their data in one buffer.
+        channels, lefts, raw_datas = [], [], []
         for channel, photon_detection_times in self.arrival_times_per_channel.items():
             # If the channel is dead, we don't do anything.
             if self.config['gains'][channel] == 0 or (self.config['pmt_0_is_fake'] and channel == 0):
@@ -319,10 +321,11 @@ class Simulator(object):
             # Digitizers have finite number of bits per channel, so clip the signal.
             adc_wave = np.clip(adc_wave, 0, 2 ** (self.config['digitizer_bits']))
 
-            event.pulses.append(datastructure.Pulse(
-                channel=channel,
-                left=start_index,
-                raw_data=adc_wave.astype(np.int16)))
+            channels.append(channel)
+            lefts.append(start_index)
+            raw_datas.append(adc_wave.astype(np.int16))
+
+        event.pulses = PulseArray.from_raw_data(channels, lefts, raw_datas).to_pulses()
 
         log.debug("Simulated pax event of %s samples length and %s pulses "
                   "created." % (event.length(), len(event.pulses)))
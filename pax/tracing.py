@@ -0,0 +1,41 @@
+"""Traces of where the time goes on individual events, in the Chrome trace format
+
+With trace_file set in the pax config, every process records spans for the input plugin reading an event, each plugin
+call, and the packing, unpacking, sending, receiving and waiting for event blocks. Open the trace file in
+https://ui.perfetto.dev or chrome://tracing to see them on a timeline, with a track for each process.
+
+To keep the trace small and the overhead low, only every trace_every-th event (by event number) is traced, together
+with the event blocks that contain it. Since the choice depends only on the event number, the same events are traced
+in all processes. Workers send their spans to the master in their end-of-run report; the master writes the file.
+"""
+import json
+import os
+
+
+class Tracer(object):
+    """Records spans of the process it is created in, for the events with event_number % every == 0"""
+
+    def __init__(self, process_name, every=1):
+        self.every = max(int(every), 1)
+        self.pid = os.getpid()
+        self.spans = [dict(name='process_name', ph='M', pid=self.pid, tid=0, args=dict(name=process_name))]
+
+    def traces(self, event):
+        """Return whether we trace event"""
+        event_number = getattr(event, 'event_number', None)
+        return event_number is not None and event_number % self.every == 0
+
+    def traces_any(self, events):
+        """Return whether we trace any of events (e.g. an event block)"""
+        return any([self.traces(event) for event in events])
+
+    def add(self, name, category, start, end, **args):
+        """Record a span called name which ran from start to end (time.time() values)"""
+        self.spans.append(dict(name=name, cat=category, ph='X', pid=self.pid, tid=0,
+                               ts=start * 1e6, dur=(end - start) * 1e6, args=args))
+
+
+def write_trace(filename, spans):
+    """Write spans (from one or more Tracers) to filename in the Chrome trace format"""
+    with open(filename, mode='w') as outfile:
+        json.dump(dict(traceEvents=spans, displayTimeUnit='ms'), outfile)
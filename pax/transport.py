@@ -0,0 +1,205 @@
+"""Transport of event blocks between the pax multiprocessing workers
+
+By default, event blocks are put on the (multiprocessing manager) queues as they are. The queue then pickles them,
+ships the pickle through the manager process, and unpickles it on the other side. For events with many or long pulses,
+this means every Pulse.raw_data array is copied through the manager process several times.
+
+The shared memory transport instead puts large numpy arrays in a shared memory segment,
+and only sends a small descriptor of the block (a SharedBlock) through the queues.
+The receiving process maps the segment and reconstructs the arrays without copying them.
+
+The binary transport encodes the events in the pax binary format (see binary_format.py) before they go on the queues.
+Pickling the encoded events is then just copying bytes, and the arrays of the decoded events are views of them.
+
+Select the transport with the 'transport' setting in the [pax] section of the configuration.
+"""
+from collections import namedtuple
+import os
+import pickle
+
+from pax import binary_format
+from pax.datastructure import Event
+from pax.parallel import approximate_nbytes
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    # Python < 3.8: no shared memory module, no pickle protocol 5
+    shared_memory = None
+
+
+# Descriptor of an event block that lives (in part) in a shared memory segment:
+#   header: pickle of the event block, containing all but the out-of-band buffers
+#   segment_name: name of the shared memory segment holding the out-of-band buffers (None if there are none)
+#   spans: list of (offset, length) of each out-of-band buffer in the segment, in the order pickle needs them
+SharedBlock = namedtuple('SharedBlock', ['header', 'segment_name', 'spans'])
+
+# An event encoded by the binary transport
+BinaryEvent = namedtuple('BinaryEvent', ['data'])
+
+
+class PickleTransport(object):
+    """Puts event blocks on the queues as-is; the queues take care of (un)pickling them."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def pack(self, event_block):
+        """Return what should be put on a queue to send event_block to another process"""
+        return event_block
+
+    def unpack(self, payload):
+        """Return the event block from a payload obtained from a queue"""
+        return payload
+
+    def release(self, payload):
+        """Free any resources held by payload. Call this when you are done with the unpacked event block."""
+        pass
+
+    def nbytes(self, payload):
+        """Return (approximately) how much memory the event block in payload takes up"""
+        return approximate_nbytes(payload)
+
+    def shutdown(self):
+        pass
+
+
+class SharedMemoryTransport(PickleTransport):
+    """Ships the large numpy arrays in event blocks through shared memory segments.
+
+    Each packed block gets one segment. The process which unpacks the block owns the segment from then on,
+    and must call release(payload) once it no longer needs the event block. If a worker crashes,
+    its segments are not cleaned up: check /dev/shm if you see pax crash a lot.
+    """
+    # Segment offsets are aligned to this many bytes, so the arrays we map are well-aligned
+    alignment = 64
+
+    def __init__(self, config):
+        if shared_memory is None:
+            raise RuntimeError("The shared_memory transport requires python 3.8 or later.")
+        PickleTransport.__init__(self, config)
+        # Arrays (buffers) smaller than this are just pickled along with the rest of the block
+        self.min_shared_bytes = config.get('shared_memory_min_bytes', 1024)
+        self.open_segments = {}
+        # Segments we have unlinked, but could not close yet since some arrays still point into them
+        self.lingering_segments = []
+
+    def pack(self, event_block):
+        buffers = []
+
+        def buffer_callback(buffer):
+            if buffer.raw().nbytes < self.min_shared_bytes:
+                return True     # Serialize in-band
+            buffers.append(buffer)
+            return False
+
+        header = pickle.dumps(event_block, protocol=5, buffer_callback=buffer_callback)
+        if not len(buffers):
+            return SharedBlock(header=header, segment_name=None, spans=[])
+
+        spans = []
+        offset = 0
+        for buffer in buffers:
+            n_bytes = buffer.raw().nbytes
+            spans.append((offset, n_bytes))
+            offset += n_bytes + (-n_bytes % self.alignment)
+
+        segment = open_segment(create=True, size=offset)
+        for (offset, n_bytes), buffer in zip(spans, buffers):
+            segment.buf[offset:offset + n_bytes] = buffer.raw()
+        name = segment.name
+        segment.close()
+        return SharedBlock(header=header, segment_name=name, spans=spans)
+
+    def unpack(self, payload):
+        if payload.segment_name is None:
+            return pickle.loads(payload.header)
+        segment = open_segment(name=payload.segment_name)
+        self.open_segments[payload.segment_name] = segment
+        return pickle.loads(payload.header,
+                            buffers=[segment.buf[offset:offset + n_bytes] for offset, n_bytes in payload.spans])
+
+    def release(self, payload):
+        if payload.segment_name is None:
+            return
+        segment = self.open_segments.pop(payload.segment_name, None)
+        if segment is None:
+            # The block was never unpacked (e.g. it was discarded after a crash)
+            segment = open_segment(name=payload.segment_name)
+        unlink_segment(segment)
+        self.lingering_segments.append(segment)
+        self.close_segments()
+
+    def nbytes(self, payload):
+        return len(payload.header) + sum([n_bytes for _, n_bytes in payload.spans])
+
+    def close_segments(self):
+        """Close the mappings of released segments, except those which some arrays still point into
+        (e.g. because a plugin kept a reference to the last event). We'll try those again next time.
+        """
+        still_in_use = []
+        for segment in self.lingering_segments:
+            try:
+                segment.close()
+            except BufferError:
+                still_in_use.append(segment)
+        self.lingering_segments = still_in_use
+
+    def shutdown(self):
+        for name, segment in self.open_segments.items():
+            unlink_segment(segment)
+            self.lingering_segments.append(segment)
+        self.open_segments = {}
+        self.close_segments()
+
+
+class BinaryTransport(PickleTransport):
+    """Encodes the events in event blocks in the pax binary format before they go on the queues.
+    Anything else in the blocks (e.g. EventProxy objects from the input plugin) is pickled as usual.
+    """
+
+    def pack(self, event_block):
+        return [BinaryEvent(binary_format.encode(x)) if isinstance(x, Event) else x for x in event_block]
+
+    def unpack(self, payload):
+        # The encoded events are bytearrays, so the arrays of the decoded events are writable
+        return [binary_format.decode(x.data) if isinstance(x, BinaryEvent) else x for x in payload]
+
+
+def open_segment(name=None, create=False, size=0):
+    """Create or attach to a shared memory segment, without leaving it registered with multiprocessing's resource
+    tracker. The tracker would otherwise unlink segments when the process that happened to create or map them exits,
+    while we pass ownership of the segments between processes ourselves.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument, and registers every segment it creates or attaches to.
+        # Unregister this one segment right away.
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if os.name == 'posix':
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def unlink_segment(segment):
+    """Unlink a segment opened with open_segment"""
+    if getattr(segment, '_track', True) and os.name == 'posix':
+        # Python < 3.13: unlink unregisters the segment, which open_segment already did. Register it again,
+        # so the tracker doesn't complain about an unknown segment.
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+
+transports = {'pickle': PickleTransport,
+              'shared_memory': SharedMemoryTransport,
+              'binary': BinaryTransport}
+
+
+def get_transport(config):
+    """Return an instance of the transport chosen in config (the [pax] section of the configuration)"""
+    name = config.get('transport', 'pickle')
+    if name not in transports:
+        raise ValueError("Invalid configuration: transport %s does not exist. Choose from %s." % (
+            name, ', '.join(sorted(transports.keys()))))
+    return transports[name](config)
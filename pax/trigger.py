@@ -243,7 +243,7 @@ class Trigger(object):
         self.monitor_cache.append((data_type, data))
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def get_pmt_numbers(channels, modules, pmts_buffer, pmt_lookup):
     """Fills pmts_buffer with pmt numbers corresponding to channels, modules according to pmt_lookup matrix:
      - pmt_lookup: lookup matrix for pmt numbers. First index is digitizer module, second is digitizer channel.
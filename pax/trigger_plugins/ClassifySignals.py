@@ -10,7 +10,7 @@ class ClassifySignals(TriggerPlugin):
                          s2_min_pulses=self.config['s2_min_pulses'])
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def classify_signals(signals, s1_max_rms, s2_min_pulses):
     """Set the type field of signals to 0 (unknown), 1 (s1) or 2 (s2). Modifies signals in-place.
     """
@@ -26,7 +26,7 @@ class DecideTriggers(TriggerPlugin):
         flag_triggers(data.signals, p_matrix=self.p_matrix)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def flag_triggers(signals, p_matrix):
     """Decide which signals trigger, modifying signals in-place.
     p_matrix[signal_type][n_pulses] is the probability of a signal of type signal_type and n_pulses pulses to trigger
@@ -134,7 +134,7 @@ def signal_finder(times, signal_separation,
                           area_per_channel, does_channel_contribute)
 
 
-@numba.jit()
+@numba.jit(cache=True)
 def _signal_finder(times, signal_separation,
                    signal_buffer,
                    next_save_time, dark_rate_save_interval,
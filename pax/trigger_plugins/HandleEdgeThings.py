@@ -69,7 +69,7 @@ class HandleEdgeSignals(TriggerPlugin):
         self.trigger.batch_info_doc['signals_saved_for_next_batch'] = len(self.saved_signals)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def find_last_break(times, last_time, break_time):
     """Return the last index in times after which there is a gap >= break_time.
     If the last entry in times is further than signal_separation from last_time,
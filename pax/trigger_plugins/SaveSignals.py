@@ -38,7 +38,7 @@ class SaveSignals(TriggerPlugin):
                 self.trigger.save_monitor_data('trigger_signals_histogram', hist)
 
 
-@numba.jit(nopython=True)
+@numba.jit(nopython=True, cache=True)
 def group_signals(signals, event_ranges, signal_indices_buffer, is_in_event):
     """Fill signal_indices_buffer with array of (left, right) indices
     indicating which signals belong in which event range.
@@ -7,6 +7,7 @@ e.g. a list clustering routine that isn't in some standard, library but several
 import re
 import inspect
 import logging
+import math
 import time
 import os
 import glob
@@ -80,3 +81,60 @@ class Timer:
         result = (now - self.last_t) * 1000
         self.last_t = now
         return result
+
+
+class LatencyHistogram:
+    """Histogram of durations (in ms), with logarithmic bins so it covers microseconds to hours with ~6% resolution.
+    Histograms from different processes can be merged, then queried for percentiles.
+    """
+    bins_per_decade = 40
+    min_ms = 1e-3
+    n_bins = 10 * bins_per_decade     # Up to 1e7 ms. Longer durations go in the last bin.
+
+    def __init__(self):
+        self.counts = [0] * self.n_bins
+        self.n = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ms, n=1):
+        """Add n durations of ms each"""
+        if ms > self.min_ms:
+            i = min(int(math.log10(ms / self.min_ms) * self.bins_per_decade), self.n_bins - 1)
+        else:
+            i = 0
+        self.counts[i] += n
+        self.n += n
+        self.total += ms * n
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        """Add the durations in other to this histogram"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.n += other.n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Return (an upper bound, within the bin resolution, of) the q-th percentile of the durations"""
+        if not self.n:
+            return 0
+        threshold = q / 100. * self.n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold and count:
+                if i == self.n_bins - 1:
+                    return self.max
+                return min(self.min_ms * 10 ** ((i + 1) / float(self.bins_per_decade)), self.max)
+        return self.max
+
+    def summary(self):
+        """Return dict with number of entries, mean, percentiles and max (all in ms)"""
+        return dict(n=self.n,
+                    mean=self.total / float(self.n) if self.n else 0,
+                    p50=self.percentile(50),
+                    p90=self.percentile(90),
+                    p99=self.percentile(99),
+                    max=self.max)
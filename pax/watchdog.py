@@ -0,0 +1,67 @@
+"""Watchdog thread which interrupts plugins that take too long on an event
+
+The processor tells the watchdog which plugin it is running, since when, and how long it may take, by calling
+watch() before and rest() after each plugin. This only stores a tuple, so it costs next to nothing per event.
+The watchdog thread looks at it every check_interval seconds; if the plugin has been running longer than its timeout,
+it raises PluginTimeout in the main thread.
+
+Like the SIGALRM-based timeout this replaces, this can't interrupt a plugin stuck in compiled code (numpy, numba,
+a blocking system call): the exception is raised once the plugin returns to python code.
+"""
+import ctypes
+import logging
+import threading
+import time
+
+log = logging.getLogger('pax_watchdog')
+
+
+class PluginTimeout(Exception):
+    """Raised in the main thread by the watchdog if a plugin exceeds its timeout"""
+    pass
+
+
+class Watchdog(object):
+
+    def __init__(self, check_interval=1):
+        self.check_interval = check_interval
+        # (plugin name, start time, timeout in seconds) of the plugin running now, or None
+        self.current = None
+        # (plugin name, seconds it was running) of the last plugin we interrupted
+        self.fired = None
+        self.lock = threading.Lock()
+        self.main_thread_id = threading.current_thread().ident
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='pax_watchdog')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def watch(self, plugin_name, start_time, timeout):
+        """Note plugin_name started running at start_time (time.time()) and may take timeout seconds"""
+        self.current = (plugin_name, start_time, timeout)
+
+    def rest(self):
+        """Note the plugin we were watching is done"""
+        # Take the lock, so we can't fire on a plugin which is already done
+        with self.lock:
+            self.current = None
+
+    def run(self):
+        while not self.stopped.wait(self.check_interval):
+            with self.lock:
+                if self.current is None:
+                    continue
+                plugin_name, start_time, timeout = self.current
+                running_for = time.time() - start_time
+                if running_for <= timeout:
+                    continue
+                log.error("%s has been running for %0.1f seconds, more than its timeout of %s seconds. "
+                          "Interrupting it." % (plugin_name, running_for, timeout))
+                self.fired = (plugin_name, running_for)
+                self.current = None
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.main_thread_id),
+                                                           ctypes.py_object(PluginTimeout))
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,96 @@
+import pickle
+import unittest
+
+import numpy as np
+from numpy import testing as np_testing
+
+from pax import binary_format
+from pax.datastructure import Event, Peak, Pulse, Hit, ReconstructedPosition, ConfidenceTuple, SumWaveform
+
+
+def make_event():
+    event = Event(n_channels=10, start_time=int(1e18), length=1000, sample_duration=10, event_number=7,
+                  dataset_name='test')
+    for i in range(5):
+        event.pulses.append(Pulse(channel=i, left=10 * i, raw_data=np.arange(i + 3, dtype=np.int16)))
+    event.pulses[2].baseline = 1.5
+    for i in range(3):
+        event.peaks.append(Peak(type='s%d' % i, area=float(i), left=i, area_per_channel=np.ones(10) * i,
+                                hits=np.zeros(i, dtype=Hit.get_dtype()),
+                                reconstructed_positions=[ReconstructedPosition(
+                                    x=float(i), algorithm='test',
+                                    confidence_tuples=[ConfidenceTuple(level=0.5)] * i)]))
+    event.sum_waveforms.append(SumWaveform(name='tpc', samples=np.ones(1000, dtype=np.float32)))
+    event.all_hits = np.zeros(4, dtype=Hit.get_dtype())
+    event.all_hits['area'] = np.arange(4)
+    return event
+
+
+class TestBinaryFormat(unittest.TestCase):
+
+    def test_roundtrip(self):
+        event = make_event()
+        data = binary_format.encode(event)
+        self.assertEqual(bytes(data[:4]), binary_format.magic)
+        decoded = binary_format.decode(data)
+        self.assertIsInstance(decoded, Event)
+        self.assertEqual(decoded.to_json(), event.to_json())
+
+        # Fields have the same types as in the original
+        self.assertIsInstance(decoded.start_time, int)
+        self.assertIsInstance(decoded.pulses[0].channel, int)
+        self.assertIsInstance(decoded.peaks[0].type, str)
+        self.assertEqual(decoded.pulses[2].baseline, 1.5)
+        self.assertEqual(len(decoded.peaks[2].reconstructed_positions[0].confidence_tuples), 2)
+        self.assertEqual(decoded.all_hits.dtype, Hit.get_dtype())
+        np_testing.assert_array_equal(decoded.all_hits['area'], np.arange(4))
+
+    def test_arrays_are_views(self):
+        data = binary_format.encode(make_event())
+        decoded = binary_format.decode(data)
+        # The raw data of all pulses is one buffer inside data
+        buffer = decoded.pulses[0].raw_data.base
+        self.assertIsNotNone(buffer)
+        self.assertTrue(all([p.raw_data.base is buffer for p in decoded.pulses]))
+        data_address = np.frombuffer(data, dtype=np.uint8).ctypes.data
+        self.assertEqual(decoded.pulses[0].raw_data.ctypes.data % binary_format.alignment,
+                         data_address % binary_format.alignment)
+        # Decoding from a bytearray gives writable arrays, from bytes read-only arrays
+        self.assertTrue(decoded.pulses[0].raw_data.flags.writeable)
+        self.assertFalse(binary_format.decode(bytes(data)).pulses[0].raw_data.flags.writeable)
+
+    def test_empty_event(self):
+        event = Event(n_channels=2, start_time=0, length=10, sample_duration=10)
+        decoded = binary_format.decode(binary_format.encode(event))
+        self.assertEqual(decoded.pulses, [])
+        self.assertEqual(decoded.to_json(), event.to_json())
+        # Decoded events can be modified and pickled like any other
+        decoded.pulses.append(Pulse(channel=1, left=0, raw_data=np.zeros(3, dtype=np.int16)))
+        self.assertEqual(len(pickle.loads(pickle.dumps(decoded)).pulses), 1)
+
+    def test_materialize_fields(self):
+        event = make_event()
+        decoded = binary_format.decode(binary_format.encode(event), materialize_fields=['peaks'])
+        self.assertIsInstance(decoded, Event)
+        self.assertIn('peaks', decoded.__dict__)
+        self.assertNotIn('pulses', decoded.__dict__)
+        # Scalar fields are always decoded
+        self.assertIn('event_number', decoded.__dict__)
+        # Other fields are decoded when first accessed
+        np_testing.assert_array_equal(decoded.pulses[3].raw_data, event.pulses[3].raw_data)
+        self.assertIn('pulses', decoded.__dict__)
+        # Encoding the event again decodes everything
+        self.assertEqual(binary_format.decode(binary_format.encode(decoded)).to_json(), event.to_json())
+        self.assertIs(type(decoded), Event)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            binary_format.decode(b'nonsense' * 10)
+        data = binary_format.encode(make_event())
+        data[4] = 99
+        with self.assertRaises(ValueError):
+            binary_format.decode(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
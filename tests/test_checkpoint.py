@@ -0,0 +1,111 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from pax import core, checkpoint
+
+test_plugins = """
+import numpy as np
+from pax import plugin, datastructure
+
+
+class NumberedInput(plugin.InputPlugin):
+
+    def get_events(self):
+        for i in range(20):
+            event = datastructure.Event(n_channels=2, start_time=0, length=10000, sample_duration=10,
+                                        event_number=i)
+            event.pulses.append(datastructure.Pulse(channel=1, left=0, raw_data=i * np.ones(100, dtype=np.int16)))
+            yield event
+
+
+class CrashOnEvent(plugin.TransformPlugin):
+
+    def transform_event(self, event):
+        if event.event_number == self.config.get('crash_on_event'):
+            raise ValueError("Crashing on purpose")
+        return event
+"""
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'temp_checkpoint_plugins.py'), mode='w') as outfile:
+            outfile.write(test_plugins)
+        self.input_dir = os.path.join(self.tempdir, 'input')
+        self.output_dir = os.path.join(self.tempdir, 'output')
+        # Make some input data: 20 events in files of 5 events
+        self.run_pax(input='temp_checkpoint_plugins.NumberedInput', output_name=self.input_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_pax(self, crash_on_event=None, **kwargs):
+        config = {'plugin_group_names': ['input', 'transform', 'output'],
+                  'plugin_paths': [self.tempdir],
+                  'input': 'Zip.ReadZipped',
+                  'decoder_plugin': 'Pickle.DecodeZPickle',
+                  'transform': 'temp_checkpoint_plugins.CrashOnEvent',
+                  'encoder_plugin': 'Pickle.EncodeZPickle',
+                  'output': 'Zip.WriteZipped',
+                  'input_name': self.input_dir,
+                  'output_name': self.output_dir,
+                  'print_timing_report': False}
+        config.update(kwargs)
+        if config['input'] != 'Zip.ReadZipped':
+            config['decoder_plugin'] = None
+        mypax = core.Processor(config_dict={'pax': config,
+                                            'DEFAULT': {'run_number': 0, 'tpc_name': 'test'},
+                                            'Zip.WriteZipped': {'events_per_file': 5},
+                                            'temp_checkpoint_plugins.CrashOnEvent': {
+                                                'crash_on_event': crash_on_event}},
+                               just_testing=True)
+        mypax.run()
+        return mypax
+
+    def read_output(self):
+        config = {'plugin_group_names': ['input'],
+                  'input': 'Zip.ReadZipped',
+                  'decoder_plugin': 'Pickle.DecodeZPickle',
+                  'encoder_plugin': None,
+                  'input_name': self.output_dir}
+        mypax = core.Processor(config_dict={'pax': config}, just_testing=True)
+        return [mypax.process_event(e).event_number for e in mypax.get_events()]
+
+    def test_resume(self):
+        with self.assertRaises(ValueError):
+            self.run_pax(crash_on_event=12, write_checkpoint=True)
+        cp = checkpoint.load_checkpoint(self.output_dir)
+        # Only the files with events 0-4 and 5-9 were finished
+        self.assertEqual(cp['last_event'], 9)
+        self.assertEqual(len(cp['output_files']), 2)
+
+        mypax = self.run_pax(resume=True, n_cpus=2)
+        # Files with events 0-4 and 5-9 were skipped
+        self.assertEqual(mypax.input_plugin.number_of_events, 10)
+        self.assertEqual(self.read_output(), list(range(20)))
+        cp = checkpoint.load_checkpoint(self.output_dir)
+        self.assertEqual(cp['last_event'], 19)
+        self.assertEqual(len(cp['output_files']), 4)
+
+    def test_resume_without_checkpoint(self):
+        self.run_pax(resume=True)
+        self.assertEqual(self.read_output(), list(range(20)))
+
+    def test_sharded_checkpoint(self):
+        with self.assertRaises(ValueError):
+            self.run_pax(write_checkpoint=True, n_cpus=2, n_output_workers=2)
+
+    def test_output_without_checkpoint_support(self):
+        # Dummy output doesn't finalize files: we can't know which events are in its output, or add to it
+        for n_cpus in (1, 2):
+            for option in ('write_checkpoint', 'resume'):
+                with self.assertRaises(ValueError):
+                    self.run_pax(output='Dummy.DummyOutput', encoder_plugin=None, n_cpus=n_cpus, **{option: True})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,13 @@ test_pax
 
 Tests for `pax` module.
 """
+import pickle
 import unittest
 
 import numpy as np
 
-from pax.datastructure import Event, Peak, SumWaveform
+from pax import data_model
+from pax.datastructure import Event, Peak, Pulse, SumWaveform, ReconstructedPosition
 
 
 class TestDatastructure(unittest.TestCase):
@@ -139,6 +141,88 @@ class TestDatastructure(unittest.TestCase):
         self.assertIsInstance(w.samples, np.ndarray)
         self.assertEqual(w.samples.dtype, np.float32)
 
+    def test_field_schema(self):
+        fields = {f.name: f for f in Peak.get_field_schema()}
+        self.assertEqual(list(fields.keys()), sorted(fields.keys()))
+        self.assertEqual(fields['area'].kind, 'value')
+        self.assertEqual(fields['area_per_channel'].kind, 'array')
+        self.assertEqual(fields['area_per_channel'].dtype, Peak.area_per_channel.dtype)
+        self.assertEqual(fields['reconstructed_positions'].kind, 'list')
+        self.assertIs(fields['reconstructed_positions'].element_type, ReconstructedPosition)
+        # Methods and properties are not fields
+        self.assertNotIn('get_position_from_preferred_algorithm', fields)
+        self.assertNotIn('range_50p_area', fields)
+
+        p = Peak(area=3.0, detector='tpc', reconstructed_positions=[{'x': 1.0}])
+        data = dict(p.get_fields_data())
+        self.assertEqual(list(data.keys()), list(fields.keys()))
+        self.assertEqual(data['area'], 3.0)
+        self.assertIs(data['area_per_channel'], Peak.area_per_channel)
+        self.assertEqual(p.to_dict()['reconstructed_positions'][0]['x'], 1.0)
+
+    def test_to_dict_roundtrip(self):
+        e = Event.empty_event()
+        e.peaks = [Peak(area=3.0, detector='tpc', area_per_channel=np.arange(3, dtype=np.float64))]
+        e2 = Event(**e.to_dict(convert_numpy_arrays_to='bytes'))
+        self.assertEqual(e2.peaks[0].area, 3.0)
+        np.testing.assert_array_equal(e2.peaks[0].area_per_channel, np.arange(3))
+
+    def test_construct(self):
+        kwargs = dict(area=3.0, detector='tpc', area_per_channel=np.arange(3, dtype=np.float64))
+        p = Peak.construct(**kwargs)
+        self.assertIsInstance(p, Peak)
+        self.assertEqual(p.to_dict(), Peak(**kwargs).to_dict())
+        # List fields are not shared between instances
+        p.reconstructed_positions.append(ReconstructedPosition(x=1.0))
+        self.assertEqual(len(Peak.construct().reconstructed_positions), 0)
+        # Assignments after construction are still checked
+        with self.assertRaises(TypeError):
+            p.area = 'a string'
+
+    def test_construct_validated(self):
+        # Without validation, construct trusts you...
+        self.assertEqual(Pulse.construct(channel=1, left=0, right='nonsense').right, 'nonsense')
+        data_model.validate_construct = True
+        try:
+            # ... with validation, it checks the types and runs __init__ like the normal constructor
+            with self.assertRaises(TypeError):
+                Pulse.construct(channel=1, left=0, right='nonsense')
+            self.assertEqual(Pulse.construct(channel=1, left=0, raw_data=np.zeros(10, np.int16)).right, 9)
+        finally:
+            data_model.validate_construct = False
+
+    def test_lazy_fields(self):
+        e = Event.empty_event()
+        e.peaks = [Peak(area=3.0, detector='tpc', area_per_channel=np.arange(3, dtype=np.float64))]
+        e.pulses = [Pulse(channel=1, left=0, raw_data=np.zeros(10, np.int16))]
+        e_dict = e.to_dict(convert_numpy_arrays_to='bytes')
+        decoded = []
+
+        def decode_pulses():
+            decoded.append('pulses')
+            return Event.convert_field_value(Event.get_field_schema_by_name()['pulses'], e_dict['pulses'])
+
+        e2 = Event.from_dict(e_dict, materialize_fields=['peaks'])
+        data_model.make_lazy(e2, {'pulses': decode_pulses})
+        self.assertIsInstance(e2, Event)
+        self.assertEqual(e2.peaks[0].area, 3.0)
+        self.assertEqual(decoded, [])
+        self.assertEqual(e2.pulses[0].right, 9)
+        self.assertEqual(decoded, ['pulses'])
+
+        # Setting a lazy field doesn't decode it, but is still type checked
+        with self.assertRaises(TypeError):
+            e2.all_hits = np.zeros(3)
+        e2.sum_waveforms = []
+        self.assertEqual(e2.sum_waveforms, [])
+
+        # Dumping or pickling the event decodes all fields
+        self.assertEqual(e2.to_json(), e.to_json())
+        self.assertIs(type(e2), Event)
+        e3 = Event.from_dict(e_dict, materialize_fields=[])
+        self.assertIs(type(pickle.loads(pickle.dumps(e3))), Event)
+        self.assertIs(type(e3), Event)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from six.moves.urllib.request import urlopen
+from six.moves.urllib.error import HTTPError
+
+from pax import metrics
+
+example_metrics = [('pax_events_read_total', 'counter', 'Events read', [({}, 20)]),
+                   ('pax_queue_blocks', 'gauge', 'Blocks on queue', [({'queue': 'stage_0'}, 3),
+                                                                     ({'queue': 'out"put'}, 0)])]
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEqual(metrics.format_metrics(example_metrics),
+                         '# HELP pax_events_read_total Events read\n'
+                         '# TYPE pax_events_read_total counter\n'
+                         'pax_events_read_total 20.0\n'
+                         '# HELP pax_queue_blocks Blocks on queue\n'
+                         '# TYPE pax_queue_blocks gauge\n'
+                         'pax_queue_blocks{queue="stage_0"} 3.0\n'
+                         'pax_queue_blocks{queue="out\\"put"} 0.0\n')
+
+    def test_file(self):
+        tempdir = tempfile.mkdtemp()
+        filename = os.path.join(tempdir, 'pax.prom')
+        exporter = metrics.MetricsExporter(filename=filename)
+        exporter.update(example_metrics)
+        with open(filename) as infile:
+            self.assertEqual(infile.read(), metrics.format_metrics(example_metrics))
+        self.assertEqual(os.listdir(tempdir), ['pax.prom'])
+        shutil.rmtree(tempdir)
+
+    def test_http(self):
+        exporter = metrics.MetricsExporter(port=0)
+        try:
+            exporter.update(example_metrics)
+            url = 'http://127.0.0.1:%d' % exporter.port
+            self.assertEqual(urlopen(url + '/metrics').read().decode('utf-8'),
+                             metrics.format_metrics(example_metrics))
+            with self.assertRaises(HTTPError):
+                urlopen(url + '/nothing_here')
+        finally:
+            exporter.shutdown()
+
+    def test_process_rss(self):
+        self.assertGreater(metrics.process_rss(os.getpid()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
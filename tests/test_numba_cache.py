@@ -0,0 +1,35 @@
+import unittest
+
+import pax
+from pax import numba_cache
+from pax.plugins.signal_processing import Sum_n_HitFinder
+from pax.trigger_plugins import FindSignals, SaveSignals, DecideTriggers
+
+
+class TestNumbaCache(unittest.TestCase):
+
+    def test_precompile(self):
+        pax.precompile()
+        # Functions without an explicit signature should now have been compiled
+        for f in (Sum_n_HitFinder.find_intervals_above_threshold,
+                  FindSignals._signal_finder,
+                  SaveSignals.group_signals,
+                  DecideTriggers.flag_triggers):
+            self.assertGreater(len(f.signatures), 0)
+            # ... and be cached on disk
+            self.assertNotEqual(type(f._cache).__name__, 'NullCache')
+
+    def test_precompile_failure(self):
+        # Functions which don't compile are logged and skipped, rather than stopping the warmup
+        def fail():
+            raise RuntimeError("Can't compile this")
+        original = numba_cache.precompile_trigger
+        numba_cache.precompile_trigger = fail
+        try:
+            numba_cache.precompile()
+        finally:
+            numba_cache.precompile_trigger = original
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,495 @@
+import unittest
+import json
+import os
+import multiprocessing
+import pickle
+import shutil
+import socket
+import tempfile
+import time
+
+import numpy as np
+import six
+
+from pax import core, parallel, transport, quarantine
+from pax.datastructure import Event, Pulse
+
+plugins_for_multiprocessing = """
+import time
+import numpy as np
+from pax import plugin, datastructure
+
+
+class NumberedInput(plugin.InputPlugin):
+
+    def startup(self):
+        self.number_of_events = self.config['n_events']
+
+    def get_events(self):
+        for i in range(self.number_of_events):
+            time.sleep(self.config.get('delay', 0))
+            event = datastructure.Event(n_channels=2, start_time=0, length=10000, sample_duration=10,
+                                        event_number=i)
+            event.pulses.append(datastructure.Pulse(channel=1, left=0, raw_data=i * np.ones(100, dtype=np.int16)))
+            yield event
+
+
+class SlowStart(plugin.TransformPlugin):
+    \"\"\"Makes the first event slow, so later blocks overtake it\"\"\"
+
+    def transform_event(self, event):
+        if event.event_number == 0:
+            # Busy-wait rather than sleep, so the watchdog can interrupt us
+            end = time.time() + self.config.get('sleep', 1)
+            while time.time() < end:
+                pass
+        return event
+
+
+class CrashOnEvent(plugin.TransformPlugin):
+
+    def transform_event(self, event):
+        if event.event_number == self.config['crash_on_event']:
+            raise ValueError("Crashing on purpose")
+        return event
+
+
+class CrashOnEventInBlock(plugin.TransformPlugin):
+    \"\"\"Like CrashOnEvent, but processes event blocks at once. Writes the block sizes it got to block_sizes_file\"\"\"
+
+    def startup(self):
+        self.block_sizes = []
+
+    def transform_events(self, events):
+        self.block_sizes.append(len(events))
+        for event in events:
+            if event.event_number == self.config['crash_on_event']:
+                raise ValueError("Crashing on purpose")
+        return events
+
+    def shutdown(self):
+        with open(self.config['block_sizes_file'], mode='a') as outfile:
+            outfile.write(''.join(["%d\\n" % n for n in self.block_sizes]))
+
+
+class CrashWhenTired(plugin.TransformPlugin):
+    \"\"\"Crashes on event 5, unless it is the first event it sees\"\"\"
+
+    def startup(self):
+        self.n_seen = 0
+
+    def transform_event(self, event):
+        self.n_seen += 1
+        if event.event_number == 5 and self.n_seen > 1:
+            raise ValueError("Crashing on purpose")
+        return event
+
+
+leaked_memory = []
+
+
+class Leaky(plugin.TransformPlugin):
+    \"\"\"Leaks 8 MB on every event\"\"\"
+
+    def transform_event(self, event):
+        leaked_memory.append(np.ones(int(1e6), dtype=np.float64))
+        return event
+
+    def shutdown(self):
+        del leaked_memory[:]
+
+
+class EventNumbersOutput(plugin.OutputPlugin):
+
+    def startup(self):
+        self.outfile = open(self.config['output_name'], mode='w')
+
+    def write_event(self, event):
+        self.outfile.write("%d\\n" % event.event_number)
+
+    def shutdown(self):
+        self.outfile.close()
+"""
+
+
+def make_block(first_event, n_events=2):
+    block = []
+    for i in range(first_event, first_event + n_events):
+        event = Event(n_channels=2, start_time=0, length=10000, sample_duration=10, event_number=i)
+        event.pulses.append(Pulse(channel=1, left=0, raw_data=np.ones(1000, dtype=np.int16)))
+        block.append(event)
+    return block
+
+
+class TestReorderBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.transport = transport.get_transport({})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_approximate_nbytes(self):
+        empty_event = Event(n_channels=2, start_time=0, length=10000, sample_duration=10)
+        self.assertEqual(parallel.approximate_nbytes(make_block(0, 3)),
+                         3 * (2000 + parallel.approximate_nbytes(empty_event)))
+
+    def test_reorder(self):
+        rb = parallel.ReorderBuffer(self.transport)
+        for block_id in (2, 1):
+            rb.push(block_id, make_block(2 * block_id))
+        self.assertFalse(rb.next_block_available())
+        rb.push(0, make_block(0))
+        self.assertEqual(rb.nbytes, 3 * parallel.approximate_nbytes(make_block(0)))
+        for block_id in range(3):
+            self.assertTrue(rb.next_block_available())
+            b_id, event_block, payload = rb.pop()
+            self.assertEqual(b_id, block_id)
+            self.assertEqual(event_block[0].event_number, 2 * block_id)
+        self.assertEqual(rb.nbytes, 0)
+
+    def test_spill(self):
+        block_size = parallel.approximate_nbytes(make_block(0))
+        rb = parallel.ReorderBuffer(self.transport, max_bytes=1.5 * block_size, spill_dir=self.tempdir)
+        for block_id in (3, 2, 1):
+            rb.push(block_id, make_block(2 * block_id))
+        # Only one block fits in memory: the earliest one is kept, the later ones are spilled
+        self.assertEqual(rb.nbytes, block_size)
+        self.assertEqual(sorted(rb.spilled.keys()), [2, 3])
+        rb.push(0, make_block(0))
+        for block_id in range(4):
+            b_id, event_block, payload = rb.pop()
+            self.assertEqual(b_id, block_id)
+            self.assertEqual([e.event_number for e in event_block], [2 * block_id, 2 * block_id + 1])
+            self.assertEqual(payload is None, block_id != 0)
+        rb.shutdown()
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+
+class TestBlockSizer(unittest.TestCase):
+
+    def fill_block(self, sizer, event):
+        for i in range(10000):
+            if sizer.add(event):
+                return i + 1
+
+    def test_fixed_size(self):
+        sizer = parallel.BlockSizer({'event_block_size': 3})
+        self.assertFalse(sizer.adaptive)
+        self.assertEqual([self.fill_block(sizer, None) for _ in range(3)], [3, 3, 3])
+
+    def test_target_bytes(self):
+        event = make_block(0, 1)[0]
+        sizer = parallel.BlockSizer({'target_block_bytes': 10 * parallel.approximate_nbytes(event)})
+        self.assertEqual(self.fill_block(sizer, event), 10)
+        sizer = parallel.BlockSizer({'target_block_bytes': 10 * parallel.approximate_nbytes(event),
+                                     'max_event_block_size': 4})
+        self.assertEqual(self.fill_block(sizer, event), 4)
+
+    def test_target_seconds(self):
+        block_stats = {}
+        sizer = parallel.BlockSizer({'event_block_size': 5, 'target_block_seconds': 1}, block_stats)
+        self.assertEqual(self.fill_block(sizer, None), 5)
+        block_stats.update({'processing_0': 0.01, 'processing_1': 0.03})
+        self.assertEqual(self.fill_block(sizer, None), 5)
+        self.assertEqual(self.fill_block(sizer, None), 50)
+        block_stats.update({'processing_0': 10, 'processing_1': 10})
+        self.assertEqual(self.fill_block(sizer, None), 50)
+        self.assertEqual(self.fill_block(sizer, None), 1)
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'temp_parallel_plugins.py'), mode='w') as outfile:
+            outfile.write(plugins_for_multiprocessing)
+        self.output_file = os.path.join(self.tempdir, 'event_numbers.txt')
+        self.block_sizes_file = os.path.join(self.tempdir, 'block_sizes.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_pax(self, n_events=20, remote_worker=False, slow_start=1, input_delay=0, **kwargs):
+        config = {'plugin_group_names': ['input', 'transform', 'output'],
+                  'plugin_paths': [self.tempdir],
+                  'input': 'temp_parallel_plugins.NumberedInput',
+                  'transform': 'temp_parallel_plugins.SlowStart',
+                  'output': 'temp_parallel_plugins.EventNumbersOutput',
+                  'output_name': self.output_file,
+                  'n_cpus': 2,
+                  'event_block_size': 2,
+                  'print_timing_report': False}
+        config.update(kwargs)
+        mypax = core.Processor(config_dict={'pax': config,
+                                            'temp_parallel_plugins.NumberedInput': {
+                                                'n_events': n_events,
+                                                'delay': input_delay},
+                                            'temp_parallel_plugins.SlowStart': {'sleep': slow_start},
+                                            'temp_parallel_plugins.CrashOnEvent': {'crash_on_event': 5},
+                                            'temp_parallel_plugins.CrashOnEventInBlock': {
+                                                'crash_on_event': 5,
+                                                'block_sizes_file': self.block_sizes_file}},
+                               just_testing=True)
+        if remote_worker:
+            # A worker on 'another host', which connects to the broker of the master
+            remote = multiprocessing.Process(target=core.run_remote_worker,
+                                             args=(config['broker_address'], config['broker_authkey']))
+            n_local_workers = mypax.stage_workers[0].value
+            remote.start()
+            # Don't start sending out events before it has joined
+            while mypax.stage_workers[0].value == n_local_workers:
+                time.sleep(0.1)
+        mypax.run()
+        self.worker_reports = getattr(mypax, 'worker_reports', [])
+        if remote_worker:
+            remote.join()
+        if os.path.exists(self.output_file):
+            with open(self.output_file) as infile:
+                return [int(x) for x in infile.readlines()]
+
+    def test_bounded_reorder_buffer(self):
+        self.assertEqual(self.run_pax(max_reorder_blocks=2), list(range(20)))
+
+    def test_reorder_spill(self):
+        self.assertEqual(self.run_pax(max_reorder_bytes=1, reorder_spill_dir=self.tempdir), list(range(20)))
+
+    def test_adaptive_block_size(self):
+        self.assertEqual(self.run_pax(target_block_seconds=0.1, target_block_bytes=10000), list(range(20)))
+
+    def test_sharded_output(self):
+        self.run_pax(n_output_workers=2, max_reorder_blocks=2)
+        with open(self.output_file + '_manifest.json') as infile:
+            manifest = json.load(infile)
+        self.assertEqual(manifest['output_name'], self.output_file)
+        all_events = []
+        for shard, shard_info in enumerate(manifest['shards']):
+            self.assertEqual(shard_info['output_name'], self.output_file + '_shard%d' % shard)
+            with open(shard_info['output_name']) as infile:
+                event_numbers = [int(x) for x in infile.readlines()]
+            # Blocks of two events are dealt out to the shards in turn, and each shard is in order
+            self.assertEqual(event_numbers, [i for i in range(20) if (i // 2) % 2 == shard])
+            self.assertEqual(shard_info['event_ranges'], [[i, i + 1] for i in event_numbers[::2]])
+            self.assertEqual(shard_info['n_events'], 10)
+            all_events += event_numbers
+        self.assertEqual(sorted(all_events), list(range(20)))
+
+    def test_latency_report(self):
+        for n_cpus in (1, 2):
+            self.run_pax(n_events=10, n_cpus=n_cpus, write_latency_report=True, print_timing_report=True)
+            with open(self.output_file + '_latency.json') as infile:
+                report = json.load(infile)
+            self.assertEqual(list(report.keys()), ['NumberedInput', 'SlowStart', 'EventNumbersOutput'])
+            for name, summary in report.items():
+                self.assertEqual(summary['n'], 10)
+            # Event 0 takes a second in SlowStart, the others hardly any time
+            self.assertLess(report['SlowStart']['p50'], 100)
+            self.assertGreater(report['SlowStart']['max'], 900)
+
+    def test_memory_report(self):
+        for n_cpus in (1, 2):
+            self.run_pax(n_events=10, n_cpus=n_cpus, transform='temp_parallel_plugins.Leaky',
+                         memory_profile_interval=2)
+            with open(self.output_file + '_memory.json') as infile:
+                report = json.load(infile)
+            self.assertEqual(list(report.keys()), ['Leaky', 'EventNumbersOutput'])
+            self.assertEqual(report['Leaky']['n'], 5)
+            self.assertGreater(report['Leaky']['later_rss_growth'], 10e6)
+            if six.PY3:
+                self.assertGreater(report['Leaky']['mean_retained'], 8e6)
+            self.assertLess(report['EventNumbersOutput']['later_rss_growth'], 1e6)
+
+    def test_pipeline_stages(self):
+        stages = [{'groups': ['transform'], 'n_cpus': 2},
+                  {'groups': ['transform_2'], 'n_cpus': 3}]
+        self.assertEqual(self.run_pax(plugin_group_names=['input', 'transform', 'transform_2', 'output'],
+                                      transform_2='temp_parallel_plugins.SlowStart',
+                                      pipeline_stages=stages,
+                                      max_reorder_blocks=2,
+                                      transport='shared_memory',
+                                      shared_memory_min_bytes=0),
+                         list(range(20)))
+
+    def test_pipeline_stage_crash(self):
+        stages = [{'groups': ['transform'], 'n_cpus': 2},
+                  {'groups': ['transform_2'], 'n_cpus': 1}]
+        with self.assertRaises(RuntimeError):
+            self.run_pax(plugin_group_names=['input', 'transform', 'transform_2', 'output'],
+                         transform_2='temp_parallel_plugins.CrashOnEvent',
+                         pipeline_stages=stages)
+
+    def test_invalid_pipeline_stages(self):
+        with self.assertRaises(ValueError):
+            self.run_pax(pipeline_stages=[{'groups': ['output'], 'n_cpus': 2}])
+
+    def test_broker(self):
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.assertEqual(self.run_pax(n_events=40, remote_worker=True,
+                                      broker_address='localhost:%d' % port, broker_authkey='test'),
+                         list(range(40)))
+        remote_reports = [r for r in self.worker_reports if r['worker_id'].startswith('remote_')]
+        self.assertEqual(len(remote_reports), 1)
+
+    def test_broker_needs_authkey(self):
+        with self.assertRaises(ValueError):
+            self.run_pax(broker_address='localhost:0')
+
+    def test_crash(self):
+        start = time.time()
+        with self.assertRaises(RuntimeError):
+            self.run_pax(transform='temp_parallel_plugins.CrashOnEvent')
+        # Processes waiting for blocks should wake up right away, not time out
+        self.assertLess(time.time() - start, 5)
+        # Without multiprocessing, we get the plugin's own exception
+        with self.assertRaises(ValueError):
+            self.run_pax(n_cpus=1, transform='temp_parallel_plugins.CrashOnEvent')
+
+    def test_quarantine(self):
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        for n_cpus in (1, 2):
+            self.assertEqual(self.run_pax(n_cpus=n_cpus,
+                                          transform='temp_parallel_plugins.CrashOnEvent',
+                                          quarantine_failed_events=True,
+                                          dead_letter_file=dead_letter_file),
+                             [i for i in range(20) if i != 5])
+            records = list(quarantine.read_dead_letters(dead_letter_file))
+            self.assertEqual(len(records), 1)
+            self.assertEqual(records[0]['event_number'], 5)
+            self.assertEqual(records[0]['plugin'], 'CrashOnEvent')
+            self.assertIn('Crashing on purpose', records[0]['traceback'])
+            self.assertEqual(pickle.loads(records[0]['event']).event_number, 5)
+            os.remove(dead_letter_file)
+
+    def test_dead_letter_file_rerun(self):
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        for _ in range(2):
+            self.run_pax(transform='temp_parallel_plugins.CrashOnEvent',
+                         quarantine_failed_events=True,
+                         dead_letter_file=dead_letter_file)
+        # The second run starts a fresh dead letter file, rather than adding to that of the first run
+        self.assertEqual([r['event_number'] for r in quarantine.read_dead_letters(dead_letter_file)], [5])
+        # When resuming, we add to it
+        dead_letters = quarantine.DeadLetterFile(dead_letter_file, append=True)
+        dead_letters.write(dict(event_number=6))
+        self.assertEqual([r['event_number'] for r in quarantine.read_dead_letters(dead_letter_file)], [5, 6])
+
+    def test_metrics_file(self):
+        metrics_file = os.path.join(self.tempdir, 'pax.prom')
+        self.assertEqual(self.run_pax(transform='temp_parallel_plugins.CrashOnEvent',
+                                      quarantine_failed_events=True,
+                                      dead_letter_file=os.path.join(self.tempdir, 'dead_letters.pickles'),
+                                      metrics_file=metrics_file),
+                         [i for i in range(20) if i != 5])
+        with open(metrics_file) as infile:
+            values = dict([line.rsplit(' ', 1) for line in infile.read().splitlines() if not line.startswith('#')])
+        self.assertEqual(float(values['pax_events_read_total']), 20)
+        self.assertEqual(float(values['pax_events_processed_total{worker="output"}']), 19)
+        self.assertEqual(float(values['pax_events_processed_total{worker="processing_0"}']) +
+                         float(values['pax_events_processed_total{worker="processing_1"}']), 19)
+        self.assertEqual(float(values['pax_failed_events_total{worker="processing_0"}']) +
+                         float(values['pax_failed_events_total{worker="processing_1"}']), 1)
+        self.assertEqual(float(values['pax_quarantined_events_total']), 1)
+        self.assertEqual(float(values['pax_worker_crashes_total']), 0)
+        self.assertEqual(float(values['pax_queue_blocks{queue="stage_0"}']), 0)
+        self.assertGreater(float(values['pax_rss_bytes{worker="master"}']), 0)
+        self.assertIn('pax_plugin_seconds_total{plugin="CrashOnEvent",worker="processing_0"}', values)
+        self.assertIn('pax_events_per_second', values)
+        self.assertEqual(float(values['pax_status{status="processing_done"}']), 1)
+
+    def test_trace(self):
+        trace_file = os.path.join(self.tempdir, 'trace.json')
+        for n_cpus in (1, 2):
+            self.assertEqual(self.run_pax(n_cpus=n_cpus, trace_file=trace_file, trace_every=5), list(range(20)))
+            with open(trace_file) as infile:
+                spans = json.load(infile)['traceEvents']
+            processes = sorted([s['args']['name'] for s in spans if s['ph'] == 'M'])
+            self.assertEqual(processes,
+                             ['master'] if n_cpus == 1 else ['master', 'output', 'processing_0', 'processing_1'])
+            spans = [s for s in spans if s['ph'] == 'X']
+            for s in spans:
+                self.assertGreaterEqual(s['dur'], 0)
+            self.assertEqual(sorted([s['args']['event_number'] for s in spans if s['cat'] == 'input']),
+                             [0, 5, 10, 15])
+            # With multiprocessing, both the processing and the output workers process the events
+            n_processes = 1 if n_cpus == 1 else 2
+            self.assertEqual(sorted([s['name'] for s in spans if s['cat'] == 'event']),
+                             sorted(['Event %d' % i for i in (0, 5, 10, 15)] * n_processes))
+            for plugin_name in ('SlowStart', 'EventNumbersOutput'):
+                self.assertEqual(len([s for s in spans if s['cat'] == 'plugin' and s['name'] == plugin_name]), 4)
+            if n_cpus > 1:
+                # The blocks (of two events) with the traced events, on their way from the master to the output
+                self.assertEqual(sorted([s['name'] for s in spans if s['name'].startswith('Get block')]),
+                                 sorted(['Get block %d' % i for i in (0, 2, 5, 7)] * 2))
+                self.assertEqual(len([s for s in spans if s['name'].startswith('Put block')]), 8)
+
+    def test_quarantine_retry(self):
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        for n_cpus in (1, 2):
+            self.assertEqual(self.run_pax(n_cpus=n_cpus,
+                                          transform='temp_parallel_plugins.CrashWhenTired',
+                                          quarantine_failed_events=True,
+                                          retry_failed_events=True,
+                                          dead_letter_file=dead_letter_file),
+                             list(range(20)))
+            self.assertFalse(os.path.exists(dead_letter_file))
+
+    def test_plugin_timeout(self):
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        start = time.time()
+        self.assertEqual(self.run_pax(slow_start=20,
+                                      plugin_timeouts={'SlowStart': 0.2},
+                                      quarantine_failed_events=True,
+                                      dead_letter_file=dead_letter_file),
+                         list(range(1, 20)))
+        records = list(quarantine.read_dead_letters(dead_letter_file))
+        self.assertEqual([r['event_number'] for r in records], [0])
+        self.assertEqual(records[0]['plugin'], 'SlowStart')
+        self.assertIn('PluginTimeout', records[0]['traceback'])
+        self.assertLess(time.time() - start, 10)
+
+    def test_plugin_timeout_after_failure(self):
+        # A plugin which fails must not leave the watchdog running: it would interrupt the worker
+        # while it waits for the next block (which comes slowly here), and the run would hang.
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        self.assertEqual(self.run_pax(n_events=10,
+                                      transform='temp_parallel_plugins.CrashOnEvent',
+                                      event_block_size=1,
+                                      input_delay=0.3,
+                                      plugin_timeouts={'CrashOnEvent': 0.1},
+                                      quarantine_failed_events=True,
+                                      dead_letter_file=dead_letter_file),
+                         [i for i in range(10) if i != 5])
+        records = list(quarantine.read_dead_letters(dead_letter_file))
+        self.assertEqual([r['event_number'] for r in records], [5])
+        self.assertNotIn('PluginTimeout', records[0]['traceback'])
+
+    def test_block_plugin(self):
+        dead_letter_file = os.path.join(self.tempdir, 'dead_letters.pickles')
+        # Standalone processors have no event blocks. Workers get whole blocks, except when they start a block over
+        # one event at a time to find out which event(s) failed.
+        expected_block_sizes = {1: [1] * 20, 2: [1] * 2 + [2] * 10}
+        for n_cpus in (1, 2):
+            self.assertEqual(self.run_pax(n_cpus=n_cpus,
+                                          transform='temp_parallel_plugins.CrashOnEventInBlock',
+                                          quarantine_failed_events=True,
+                                          dead_letter_file=dead_letter_file),
+                             [i for i in range(20) if i != 5])
+            records = list(quarantine.read_dead_letters(dead_letter_file))
+            self.assertEqual([r['event_number'] for r in records], [5])
+            self.assertEqual(records[0]['plugin'], 'CrashOnEventInBlock')
+            with open(self.block_sizes_file) as infile:
+                self.assertEqual(sorted([int(x) for x in infile.readlines()]), expected_block_sizes[n_cpus])
+            os.remove(dead_letter_file)
+            os.remove(self.block_sizes_file)
+
+    def test_unordered_output(self):
+        event_numbers = self.run_pax(ordered_output=False)
+        self.assertEqual(sorted(event_numbers), list(range(20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,7 +14,7 @@ import tempfile
 import shutil
 import os
 
-from pax import core, plugin, datastructure
+from pax import core, plugin, datastructure, configuration
 
 dummy_plugin = """
 from pax import plugin
@@ -101,6 +101,45 @@ class TestPax(unittest.TestCase):
         self.assertIsInstance(pl, plugin.TransformPlugin)
         self.assertEqual(pl.__class__.__name__, 'DummyTransform2')
 
+    def test_plugin_config(self):
+        mypax = core.Processor(config_dict={'pax': {'plugin_group_names':   ['bla'],
+                                                    'bla':                  ['Dummy.DummyTransform',
+                                                                             'Dummy.DummyTransform2']},
+                                            'DEFAULT': {'a': 'default', 'b': 'default', 'c': 'default'},
+                                            'Dummy': {'b': 'module', 'c': 'module'},
+                                            'Dummy.DummyTransform': {'c': 'plugin'}},
+                               just_testing=True)
+        pl = mypax.get_plugin_by_name('DummyTransform')
+        pl2 = mypax.get_plugin_by_name('DummyTransform2')
+        self.assertEqual((pl.config['a'], pl.config['b'], pl.config['c']), ('default', 'module', 'plugin'))
+        self.assertEqual((pl2.config['a'], pl2.config['b'], pl2.config['c']), ('default', 'module', 'module'))
+        # Changes a plugin makes to its configuration stay with the plugin
+        pl.config['b'] = 'changed'
+        self.assertEqual(pl.config['b'], 'changed')
+        self.assertEqual(pl2.config['b'], 'module')
+        self.assertEqual(mypax.config['Dummy']['b'], 'module')
+
+    def test_config_overlay(self):
+        # The python 2 replacement for ChainMap, which plugin_config uses there
+        default, module = {'a': 'default', 'b': 'default'}, {'b': 'module'}
+        overlay = configuration.ConfigOverlay({}, module, default)
+        self.assertEqual((overlay['a'], overlay['b']), ('default', 'module'))
+        self.assertEqual(overlay.get('c', 'missing'), 'missing')
+        self.assertEqual(sorted(overlay), ['a', 'b'])
+        # The maps are shared, not copied...
+        default['c'] = 'default'
+        self.assertEqual(overlay['c'], 'default')
+        # ... but writes only go to the first map
+        overlay['b'] = 'changed'
+        del overlay['b']
+        overlay['a'] = 'changed'
+        self.assertEqual(overlay['a'], 'changed')
+        self.assertEqual(overlay['b'], 'module')
+        self.assertEqual(default, {'a': 'default', 'b': 'default', 'c': 'default'})
+        self.assertEqual(module, {'b': 'module'})
+        with self.assertRaises(KeyError):
+            del overlay['c']
+
     def test_get_input_plugin_by_name(self):
         mypax = core.Processor(config_dict={'pax': {'plugin_group_names':   ['input'],
                                                     'input':                'Dummy.DummyInput'}},
@@ -156,6 +195,29 @@ class TestPax(unittest.TestCase):
         event = mypax.process_event(event)
         self.assertIsInstance(event, datastructure.Event)
 
+    def test_production_mode(self):
+        for production_mode in (False, True):
+            mypax = core.Processor(config_dict={'pax': {'plugin_group_names':   ['input', 'bla'],
+                                                        'input':                'Dummy.DummyInput',
+                                                        'bla':                  'Dummy.DummyTransform',
+                                                        'production_mode':      production_mode}},
+                                   just_testing=True)
+            pl = mypax.get_plugin_by_name('DummyTransform')
+            self.assertEqual(pl.do_input_check, not production_mode)
+            self.assertEqual(pl.do_output_check, not production_mode)
+            event = next(mypax.get_events())
+            self.assertIs(mypax.process_event(event), event)
+            # The plugin reuses its logging adapter for the next event
+            adapter = pl.log
+            event.event_number = 42
+            mypax.process_event(event)
+            self.assertIs(pl.log, adapter)
+            self.assertEqual(pl.log.extra['event_number'], 42)
+            # Either way, a plugin which gets garbage fails (if only with a less helpful error in production mode)
+            with self.assertRaises(Exception) as cm:
+                mypax.process_event(None)
+            self.assertEqual(cm.exception.plugin_name, 'DummyTransform')
+
     def test_process_single_xed_event(self):
         """ Process the first event from the XED file.
         """
@@ -241,7 +303,7 @@ class TestPax(unittest.TestCase):
     def test_plotting(self):
         """ Plot the first event from the default XED file
         """
-        import matplotlib
+        import matplotlib.pyplot
         # Force matplotlib to switch to a non-GUI backend, so the test runs on Travis
         matplotlib.pyplot.switch_backend('Agg')
         mypax = core.Processor(config_names='XENON100',
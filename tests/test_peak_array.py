@@ -0,0 +1,104 @@
+import unittest
+
+import numpy as np
+from numpy import testing as np_testing
+
+from pax.datastructure import Peak, Hit, ReconstructedPosition
+from pax.peak_array import PeakArray, PeakView
+
+
+class TestPeakArray(unittest.TestCase):
+
+    def setUp(self):
+        self.peaks = [Peak(type='s1', area=float(i), left=i, area_per_channel=np.arange(3, dtype=np.float64) * i,
+                           hits=np.zeros(i + 1, dtype=Hit.get_dtype()),
+                           reconstructed_positions=[ReconstructedPosition(x=float(i))])
+                      for i in range(4)]
+
+    def test_from_peaks(self):
+        pa = PeakArray.from_peaks(self.peaks)
+        self.assertEqual(len(pa), 4)
+        np_testing.assert_array_equal(pa.column('area'), [0, 1, 2, 3])
+        np_testing.assert_array_equal(pa.column('type'), ['s1'] * 4)
+        # Array fields of the same length for all peaks are matrices
+        self.assertEqual(pa.column('area_per_channel').shape, (4, 3))
+        self.assertEqual(pa.column('range_area_decile').shape, (4, 11))
+        self.assertIn('area_per_channel', pa.matrices)
+        # Others are lists
+        self.assertIn('hits', pa.objects)
+        self.assertIn('reconstructed_positions', pa.objects)
+
+        pa = PeakArray.from_peaks(self.peaks, fields=['area'])
+        self.assertEqual(pa.field_names(), ['area'])
+        with self.assertRaises(ValueError):
+            PeakArray.from_peaks(self.peaks, fields=['nonsense'])
+
+    def test_empty(self):
+        pa = PeakArray.from_peaks([])
+        self.assertEqual(len(pa), 0)
+        self.assertEqual(pa.column('area_per_channel').shape, (0, 0))
+        self.assertEqual(pa.to_peaks(), [])
+
+    def test_view(self):
+        pa = PeakArray.from_peaks(self.peaks)
+        view = pa[2]
+        self.assertIsInstance(view, PeakView)
+        self.assertEqual(view.area, 2.0)
+        self.assertEqual(view.reconstructed_positions[0].x, 2.0)
+        # Properties of Peak work too
+        self.assertEqual(view.range_50p_area, 0)
+        np_testing.assert_array_equal(view.contributing_channels, [1, 2])
+        self.assertEqual(pa[-1].left, 3)
+
+        # Setting fields changes the arrays
+        view.area = 10.0
+        view.area_per_channel = np.ones(3)
+        self.assertEqual(pa.column('area')[2], 10.0)
+        np_testing.assert_array_equal(pa.column('area_per_channel')[2], np.ones(3))
+        with self.assertRaises(AttributeError):
+            view.nonsense = 3
+        with self.assertRaises(IndexError):
+            pa[4]
+
+    def test_to_peaks(self):
+        peaks = PeakArray.from_peaks(self.peaks).to_peaks()
+        for peak, original in zip(peaks, self.peaks):
+            self.assertIsInstance(peak, Peak)
+            self.assertEqual(peak.to_json(), original.to_json())
+            self.assertIsInstance(peak.area, float)
+
+    def test_update_peaks(self):
+        pa = PeakArray.from_columns(area=np.array([5.0, 6.0, 7.0, 8.0]),
+                                    n_hits=np.arange(4),
+                                    hits_per_channel=np.ones((4, 2), dtype=np.int16),
+                                    area_per_channel=np.arange(4)[:, np.newaxis] + np.arange(2.0))
+        pa.update_peaks(self.peaks)
+        self.assertEqual(self.peaks[1].area, 6.0)
+        self.assertIsInstance(self.peaks[1].n_hits, int)
+        np_testing.assert_array_equal(self.peaks[3].hits_per_channel, [1, 1])
+        # Fields we don't have are untouched
+        self.assertEqual(self.peaks[3].left, 3)
+
+        # Changing one peak's array doesn't change the others
+        self.peaks[0].area_per_channel[1] = 42
+        np_testing.assert_array_equal(self.peaks[1].area_per_channel, [1, 2])
+        np_testing.assert_array_equal(pa.column('area_per_channel')[0], [0, 1])
+        peaks = pa.to_peaks()
+        peaks[2].area_per_channel[0] = 42
+        np_testing.assert_array_equal(peaks[3].area_per_channel, [3, 4])
+        np_testing.assert_array_equal(pa.column('area_per_channel')[2], [2, 3])
+
+        pa.update_peaks(self.peaks[:3] + [Peak()], fields=['area'])
+        self.assertEqual(self.peaks[3].area, 8.0)
+        with self.assertRaises(ValueError):
+            pa.update_peaks(self.peaks[:2])
+
+    def test_from_columns_errors(self):
+        with self.assertRaises(ValueError):
+            PeakArray.from_columns(nonsense=np.zeros(3))
+        with self.assertRaises(ValueError):
+            PeakArray.from_columns(area=np.zeros(3), left=np.zeros(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
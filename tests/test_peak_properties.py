@@ -4,7 +4,8 @@ import numpy as np
 from numpy import testing as np_testing
 
 from pax.plugins.peak_processing.BasicProperties import integrate_until_fraction, \
-    put_w_in_center_of_field, compute_area_deciles
+    put_w_in_center_of_field, compute_area_deciles, count_hits_per_peak_and_channel
+from pax.datastructure import Hit
 
 
 class TestPeakProperties(unittest.TestCase):
@@ -23,6 +24,17 @@ class TestPeakProperties(unittest.TestCase):
         integrate_until_fraction(w, fractions_desired, result)
         np_testing.assert_almost_equal(result, fractions_desired, decimal=4)
 
+    def test_count_hits_per_peak_and_channel(self):
+        hits = np.zeros(4, dtype=Hit.get_dtype())
+        hits['channel'] = [0, 2, 2, 1]
+        hits['area'] = [1, 2, 3, 4]
+        peak_index = np.array([0, 0, 0, 1])
+        np_testing.assert_equal(count_hits_per_peak_and_channel(peak_index, hits, dict(n_channels=3)),
+                                [[1, 0, 2], [0, 1, 0]])
+        np_testing.assert_equal(count_hits_per_peak_and_channel(peak_index, hits, dict(n_channels=3),
+                                                                weights=hits['area']),
+                                [[1, 0, 5], [0, 4, 0]])
+
     def test_store_waveform(self):
         field = np.zeros(5)
         put_w_in_center_of_field(np.ones(3), field, 0)
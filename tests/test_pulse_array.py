@@ -0,0 +1,109 @@
+import pickle
+import unittest
+
+import numpy as np
+from numpy import testing as np_testing
+
+from pax.datastructure import Event, Pulse
+from pax.pulse_array import PulseArray
+
+
+class TestPulseArray(unittest.TestCase):
+
+    def setUp(self):
+        self.raw_datas = [np.arange(i + 1, dtype=np.int16) * (i + 1) for i in range(4)]
+        self.pulse_array = PulseArray.from_raw_data(channels=[1, 1, 3, 7],
+                                                    lefts=[0, 10, 5, 20],
+                                                    raw_datas=self.raw_datas)
+
+    def test_from_raw_data(self):
+        pa = self.pulse_array
+        self.assertEqual(len(pa), 4)
+        self.assertEqual(pa.buffer.dtype, np.int16)
+        self.assertEqual(len(pa.buffer), 1 + 2 + 3 + 4)
+        np_testing.assert_array_equal(pa.data['offset'], [0, 1, 3, 6])
+        np_testing.assert_array_equal(pa.data['right'], [0, 11, 7, 23])
+        for i, raw_data in enumerate(self.raw_datas):
+            np_testing.assert_array_equal(pa.raw_data(i), raw_data)
+        # Fields not given get the default values of Pulse
+        self.assertTrue(np.all(np.isnan(pa.data['baseline'])))
+        self.assertTrue(np.all(pa.data['n_hits_found'] == Pulse.n_hits_found))
+
+    def test_empty(self):
+        pa = PulseArray.from_raw_data([], [], [])
+        self.assertEqual(len(pa), 0)
+        self.assertEqual(pa.to_pulses(), [])
+        self.assertEqual(len(PulseArray.from_pulses([])), 0)
+
+    def test_to_pulses(self):
+        pulses = self.pulse_array.to_pulses()
+        self.assertEqual([p.channel for p in pulses], [1, 1, 3, 7])
+        self.assertEqual([p.right for p in pulses], [0, 11, 7, 23])
+        for pulse, raw_data in zip(pulses, self.raw_datas):
+            self.assertIsInstance(pulse, Pulse)
+            self.assertIsInstance(pulse.channel, int)
+            np_testing.assert_array_equal(pulse.raw_data, raw_data)
+            # raw_data is a view of the buffer
+            self.assertIs(pulse.raw_data.base, self.pulse_array.buffer)
+
+    def test_from_pulses(self):
+        pulses = self.pulse_array.to_pulses()
+        pulses[2].baseline = 4.5
+        pa = PulseArray.from_pulses(pulses)
+        self.assertEqual(pa.data['baseline'][2], 4.5)
+        roundtrip = PulseArray.from_pulses(pa.to_pulses())
+        for name in pa.data.dtype.names:
+            np_testing.assert_array_equal(pa.data[name], roundtrip.data[name])
+        np_testing.assert_array_equal(pa.buffer, self.pulse_array.buffer)
+
+        # Only the requested fields (and the position) are filled
+        pa = PulseArray.from_pulses(pulses, fields=['baseline'])
+        self.assertEqual(pa.data['baseline'][2], 4.5)
+        np_testing.assert_array_equal(pa.data['channel'], [1, 1, 3, 7])
+        np_testing.assert_array_equal(pa.data['noise_sigma'], 0)
+
+    def test_raw_data_length(self):
+        # Pulses whose raw data doesn't match left and right (e.g. processed events without raw data,
+        # truncated pulses) keep their own raw data
+        pulses = [Pulse(channel=0, left=0, right=9),
+                  Pulse(channel=1, left=0, raw_data=np.arange(5, dtype=np.int16)),
+                  Pulse(channel=2, left=0, right=2, raw_data=np.arange(10, 20, dtype=np.int16))]
+        pa = PulseArray.from_pulses(pulses)
+        np_testing.assert_array_equal(pa.data['length'], [0, 5, 10])
+        np_testing.assert_array_equal(pa.data['right'], [9, 4, 2])
+        self.assertEqual(len(pa.raw_data(0)), 0)
+        for restored, pulse in zip(pa.to_pulses(), pulses):
+            self.assertEqual(restored.right, pulse.right)
+            np_testing.assert_array_equal(restored.raw_data, pulse.raw_data)
+
+        event = Event(n_channels=10, start_time=0, length=100, sample_duration=10)
+        event.pulses = pulses
+        restored = pickle.loads(pickle.dumps(event))
+        self.assertEqual(len(restored.pulses[0].raw_data), 0)
+        np_testing.assert_array_equal(restored.pulses[2].raw_data, np.arange(10, 20))
+
+    def test_raw_data_dtype(self):
+        with self.assertRaises(ValueError):
+            PulseArray.from_raw_data([0], [0], [np.arange(3, dtype=np.int64)])
+
+    def test_pickle_event(self):
+        event = Event(n_channels=10, start_time=0, length=100, sample_duration=10)
+        event.pulses = self.pulse_array.to_pulses()
+        event.pulses[0].noise_sigma = 2.0
+        restored = pickle.loads(pickle.dumps(event))
+        self.assertEqual(len(restored.pulses), 4)
+        self.assertIsInstance(restored.pulses, list)
+        self.assertEqual(restored.pulses[0].noise_sigma, 2.0)
+        for pulse, raw_data in zip(restored.pulses, self.raw_datas):
+            np_testing.assert_array_equal(pulse.raw_data, raw_data)
+        self.assertEqual(restored.to_json(), event.to_json())
+
+        # Events pickled with a list of pulses still load
+        state = event.__dict__.copy()
+        old_style = Event.__new__(Event)
+        old_style.__setstate__(state)
+        self.assertIs(old_style.pulses, event.pulses)
+
+
+if __name__ == '__main__':
+    unittest.main()
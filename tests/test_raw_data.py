@@ -33,6 +33,13 @@ plugins_to_test = [
         'encoder':      'Pickle.EncodeZPickle',
         'write_plugin': 'Zip.WriteZipped',
     },
+    {
+        'name':         'ZippedBinary',
+        'read_plugin':  'Zip.ReadZipped',
+        'decoder':      'Binary.DecodeZBinary',
+        'encoder':      'Binary.EncodeZBinary',
+        'write_plugin': 'Zip.WriteZipped',
+    },
 ]
 
 
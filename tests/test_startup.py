@@ -0,0 +1,20 @@
+import unittest
+
+from pax import benchmarks
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        """Importing pax.core should not import matplotlib, scipy, etc.: plugins import those when they need them"""
+        self.assertEqual(benchmarks.heavy_modules_imported('pax.core'), [])
+
+    def test_startup_benchmark(self):
+        results = benchmarks.startup_benchmark(n_repeats=1)
+        self.assertEqual(len(results), 4)
+        for description, seconds in results:
+            self.assertGreater(seconds, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from pax import core, transport
+from pax.datastructure import Event, EventProxy, Pulse
+
+plugins_for_multiprocessing = """
+import numpy as np
+from pax import plugin, datastructure
+
+
+class PulsesInput(plugin.InputPlugin):
+
+    def startup(self):
+        self.number_of_events = self.config['n_events']
+
+    def get_events(self):
+        for i in range(self.number_of_events):
+            event = datastructure.Event(n_channels=2, start_time=0, length=10000, sample_duration=10,
+                                        event_number=i)
+            event.pulses.append(datastructure.Pulse(channel=1, left=0,
+                                                    raw_data=i * np.ones(5000, dtype=np.int16)))
+            yield event
+
+
+class CheckPulsesOutput(plugin.OutputPlugin):
+
+    def startup(self):
+        self.outfile = open(self.config['output_name'], mode='w')
+
+    def write_event(self, event):
+        assert np.all(event.pulses[0].raw_data == event.event_number)
+        self.outfile.write("%d\\n" % event.event_number)
+
+    def shutdown(self):
+        self.outfile.close()
+"""
+
+
+def make_event(event_number, pulse_length=5000):
+    event = Event(n_channels=2, start_time=0, length=10000, sample_duration=10, event_number=event_number)
+    event.pulses.append(Pulse(channel=1, left=0, raw_data=np.arange(pulse_length, dtype=np.int16)))
+    return event
+
+
+class TestTransport(unittest.TestCase):
+
+    def test_invalid_transport(self):
+        with self.assertRaises(ValueError):
+            transport.get_transport({'transport': 'carrier_pigeon'})
+
+    def test_pickle_transport(self):
+        t = transport.get_transport({})
+        block = [make_event(i) for i in range(3)]
+        self.assertIs(t.unpack(t.pack(block)), block)
+
+    def test_shared_memory_roundtrip(self):
+        t = transport.get_transport({'transport': 'shared_memory'})
+        block = [make_event(i) for i in range(3)]
+        payload = t.pack(block)
+
+        # Only a small descriptor should be left to go through the queue
+        self.assertIsNotNone(payload.segment_name)
+        self.assertEqual(len(payload.spans), 3)
+        self.assertLess(len(pickle.dumps(payload)), block[0].pulses[0].raw_data.nbytes)
+
+        # Decode in another transport instance, as if we were another process
+        t2 = transport.get_transport({'transport': 'shared_memory'})
+        block_2 = t2.unpack(payload)
+        self.assertEqual([e.event_number for e in block_2], [0, 1, 2])
+        for e in block_2:
+            np.testing.assert_array_equal(e.pulses[0].raw_data, block[0].pulses[0].raw_data)
+        del block_2, e
+        t2.release(payload)
+        self.assertEqual(t2.lingering_segments, [])
+
+    def test_shared_memory_small_arrays_in_band(self):
+        t = transport.get_transport({'transport': 'shared_memory'})
+        payload = t.pack([make_event(0, pulse_length=10)])
+        self.assertIsNone(payload.segment_name)
+        self.assertEqual(t.unpack(payload)[0].pulses[0].length, 10)
+
+    def test_binary_roundtrip(self):
+        t = transport.get_transport({'transport': 'binary'})
+        block = [make_event(i) for i in range(3)] + [EventProxy(data=b'something', event_number=3)]
+        payload = pickle.loads(pickle.dumps(t.pack(block)))
+        self.assertIsInstance(payload[0], transport.BinaryEvent)
+        block_2 = t.unpack(payload)
+        self.assertEqual([e.event_number for e in block_2], [0, 1, 2, 3])
+        self.assertEqual(block_2[3].data, b'something')
+        for e in block_2[:3]:
+            np.testing.assert_array_equal(e.pulses[0].raw_data, block[0].pulses[0].raw_data)
+            self.assertTrue(e.pulses[0].raw_data.flags.writeable)
+
+    def test_shared_memory_multiprocessing(self):
+        self.run_multiprocessing('shared_memory')
+
+    def test_binary_multiprocessing(self):
+        self.run_multiprocessing('binary')
+
+    def run_multiprocessing(self, transport_name):
+        tempdir = tempfile.mkdtemp()
+        with open(os.path.join(tempdir, 'temp_transport_plugins.py'), mode='w') as outfile:
+            outfile.write(plugins_for_multiprocessing)
+        output_file = os.path.join(tempdir, 'event_numbers.txt')
+        mypax = core.Processor(config_dict={'pax': {'plugin_group_names': ['input', 'output'],
+                                                    'plugin_paths': [tempdir],
+                                                    'input': 'temp_transport_plugins.PulsesInput',
+                                                    'output': 'temp_transport_plugins.CheckPulsesOutput',
+                                                    'output_name': output_file,
+                                                    'n_cpus': 2,
+                                                    'event_block_size': 3,
+                                                    'transport': transport_name,
+                                                    'print_timing_report': False},
+                                            'temp_transport_plugins.PulsesInput': {'n_events': 20}},
+                               just_testing=True)
+        mypax.run()
+        with open(output_file) as infile:
+            self.assertEqual([int(x) for x in infile.readlines()], list(range(20)))
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
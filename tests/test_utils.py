@@ -0,0 +1,47 @@
+import unittest
+
+from pax.utils import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = LatencyHistogram()
+        for ms in range(1, 101):
+            h.add(ms)
+        self.assertEqual(h.n, 100)
+        self.assertEqual(h.max, 100)
+        self.assertAlmostEqual(h.summary()['mean'], 50.5)
+        for q in (50, 90, 99):
+            # Percentiles are upper bin edges, the bins are ~6% wide
+            self.assertGreaterEqual(h.percentile(q), q)
+            self.assertLess(h.percentile(q), q * 1.07)
+        self.assertEqual(h.percentile(100), 100)
+
+    def test_merge(self):
+        h1, h2 = LatencyHistogram(), LatencyHistogram()
+        for ms in (1, 2, 3):
+            h1.add(ms)
+        h2.add(1e9)
+        h1.merge(h2)
+        self.assertEqual(h1.n, 4)
+        self.assertEqual(h1.max, 1e9)
+        self.assertEqual(h1.percentile(100), 1e9)
+        self.assertLess(h1.percentile(50), 3)
+
+    def test_add_many(self):
+        h1, h2 = LatencyHistogram(), LatencyHistogram()
+        h1.add(5, n=3)
+        for _ in range(3):
+            h2.add(5)
+        self.assertEqual((h1.counts, h1.n, h1.total, h1.max), (h2.counts, h2.n, h2.total, h2.max))
+
+    def test_empty(self):
+        h = LatencyHistogram()
+        h.add(0)
+        self.assertEqual(LatencyHistogram().percentile(50), 0)
+        self.assertEqual(h.percentile(50), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()